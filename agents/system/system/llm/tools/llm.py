@@ -64,12 +64,14 @@ def llm(conversation: Conversation) -> str:
     print('\n\n[red]Stream[green i]\n\n')
     last_edit_success = True
     print('_________________')
+    Stream.reset()
     for message in response:
         mm = message.choices[0].delta.content
         if mm:
             print(f"[green i]{mm}", end='')
             msg += mm
-        Stream.stream = msg
+            Stream.write(mm)
+    Stream.close()
     print('\n\n_______[green on blue b]END_STREAM[/]________\n\n')
     #print(msg)
     DEBUG and input('continue ?')
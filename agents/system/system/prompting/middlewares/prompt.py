@@ -31,7 +31,7 @@ def prompt_histo(ctx: dict[str, any], input_str: str):
     ctx['user_input'],*_ = ctx['args']
 
     # Get the last 12 messages from history
-    histo = ctx['agent'].histo[-12:]
+    histo = ctx['agent'].history.window(12)
     
     # Create template with base prompt, history and user input
     ret = Tool['tpl']((base_prompt+histo) + Message('user','{user_input}'), **ctx)
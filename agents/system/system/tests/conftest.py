@@ -0,0 +1,33 @@
+import os
+from collections import OrderedDict
+
+import pytest
+
+
+@pytest.fixture
+def isolated_state(tmp_path, monkeypatch):
+    """The global State and event log, kept under tmp_path for the duration of the test."""
+    from cogni import State
+    from cogni.wrappers import event as event_module
+    from cogni.wrappers.event_wakeup import WakeupChannel
+    from cogni.wrappers.state_backends import make_backend
+
+    State.flush()
+    states_dir = str(tmp_path / 'states')
+    os.makedirs(states_dir)
+    backend = make_backend('directory', states_dir)
+    lock_files = {}
+    for name, value in (('_states_dir', states_dir), ('_backend', backend), ('_cache', {}),
+                        ('_versions', {}), ('_nodes', {}), ('_lru', OrderedDict()),
+                        ('_lock_files', lock_files)):
+        monkeypatch.setattr(State, name, value)
+
+    events_dir = str(tmp_path / 'events')
+    monkeypatch.setattr(event_module, 'EVENTS_DIR', events_dir)
+    monkeypatch.setattr(event_module, '_event_log', None)
+    monkeypatch.setattr(event_module, 'wakeup', WakeupChannel(os.path.join(events_dir, 'wake')))
+    yield State
+    State.flush()
+    backend.close()
+    for lock_file in lock_files.values():
+        lock_file.close()
@@ -0,0 +1,80 @@
+from cogni import Conversation, Message, Tool
+
+
+def test_appends_and_slices_keep_value_semantics():
+    """Conversations grown from the same one, or sliced from it, never see each other's messages."""
+    base = Conversation([Message('system', 'You are {name}'), Message('user', 'Hi')])
+    base.llm = 'fake'
+    left = base + Message('assistant', 'left')
+    right = base.rehop('right', 'assistant')
+    assert [m.content for m in base] == ['You are {name}', 'Hi']
+    assert left[-1].content == 'left' and right[-1].content == 'right'
+    assert right.should_infer and not left.should_infer and left.llm == right.llm == 'fake'
+
+    # The tip shares its backing list, a branch copies only its own view
+    assert left._items is base._items and right._items is not base._items
+
+    longer = left + right[1:]
+    assert [m.content for m in longer] == ['You are {name}', 'Hi', 'left', 'Hi', 'right']
+    window = longer[-2:]
+    assert len(window) == 2 and window[0].content == 'Hi' and window._items is longer._items
+    assert [m.content for m in longer[::2]] == ['You are {name}', 'left', 'right']
+    assert [m.content for m in window + Message('user', 'more')] == ['Hi', 'right', 'more']
+    assert len(longer) == 5 and longer[-1] is right[-1]
+
+    longer.hops += 1
+    assert left.hops == base.hops == 0
+
+
+def test_templating_leaves_the_source_conversation_alone():
+    """tpl returns new messages and shares the ones it does not change."""
+    conv = Conversation([Message('system', 'You are {name}'), Message('user', 'Hi')])
+    rendered = Tool['tpl'](conv, name='Bob')
+    assert rendered[0].content == 'You are Bob' and conv[0].content == 'You are {name}'
+    assert rendered[0]._original_content == 'You are {name}'
+    assert rendered[1] is conv[1]
+
+
+def test_messages_are_immutable_values():
+    """Messages cannot be changed in place, and keep their original content only when it differs."""
+    import pickle
+    from copy import deepcopy
+    import pytest
+
+    msg = Message('A', 'Hello {name}')
+    assert msg.role == 'assistant' and msg._original is None
+    with pytest.raises(AttributeError):
+        msg.content = 'changed'
+    with pytest.raises(AttributeError):
+        del msg.role
+    assert deepcopy(msg) is msg and pickle.loads(pickle.dumps(msg)) == msg
+
+    parsed = msg.with_content('Hello Bob').parse(str.upper)
+    assert parsed.content == 'HELLO {NAME}' and parsed._original_content == 'Hello {name}'
+    assert parsed.role is Message(''.join(['assis', 'tant']), '').role
+    assert msg.with_content(msg.content) is msg and msg.parse(str) == msg
+
+
+def test_conv_files_stream_tail_and_append(tmp_path, monkeypatch):
+    """The streaming reader and the appends give what from_str and to_str give."""
+    from cogni.entities import conv_file
+
+    # Small blocks so messages and separators are cut between reads
+    monkeypatch.setattr(conv_file, 'BLOCK_SIZE', 7)
+    handwritten = "system:You are {name}\n\n__-__\n\nuser: Hi: there\n\n__-__\n\nA:ok\n"
+    path = tmp_path / 'agent.conv'
+    path.write_text(handwritten)
+    expected = [m.to_dict() for m in Conversation.from_str(handwritten)]
+    assert Conversation.from_file(str(path)).to_dict() == expected
+    assert Conversation.from_file(str(path), last=2).to_dict() == expected[1:]
+    assert Conversation.from_file(str(path), last=10).to_dict() == expected
+
+    conv = Conversation.from_file(str(path))
+    conv[:1].to_file(str(path))
+    (conv[1:] + Message('user', 'é' * 20)).append_to_file(str(path))
+    assert path.read_text() == (conv + Message('user', 'é' * 20)).to_str()
+    assert conv_file.read_last(str(path), 1) == [Message('user', 'é' * 20)]
+
+    empty = tmp_path / 'empty.conv'
+    Conversation([Message('user', 'first')]).append_to_file(str(empty))
+    assert empty.read_text() == 'user:first' and len(Conversation.from_file(str(empty))) == 1
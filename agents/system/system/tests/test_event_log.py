@@ -0,0 +1,368 @@
+import os
+from cogni.wrappers.event_log import ENTRY, EventLog
+
+
+def _event(i, type='tick'):
+    return {'type': type, 'payload': {'n': i}, 'timestamp': 1000 + i}
+
+
+def test_offsets_and_tail_reads(tmp_path):
+    """Offsets grow by one per event and reads start at the requested one."""
+    log = EventLog(str(tmp_path))
+    assert log.read(0) == [] and log.end_offset == 0
+
+    assert [log.append(_event(i)) for i in range(3)] == [0, 1, 2]
+    assert log.append_batch(_event(i) for i in range(3, 10)) == 3
+    assert log.end_offset == 10
+
+    assert [off for off, _ in log.read(7)] == [7, 8, 9]
+    assert log.read(4, limit=2) == [(4, _event(4)), (5, _event(5))]
+    assert log.offset_for_timestamp(1005) == 5
+    assert log.offset_for_timestamp(99999) == 10
+
+
+def test_type_filter_skips_other_events(tmp_path):
+    """Events of other types are skipped from the index, without being parsed."""
+    log = EventLog(str(tmp_path))
+    log.append_batch(_event(i, 'llm_stream_start' if i % 3 else 'root_call_agent') for i in range(9))
+    assert [off for off, _ in log.read(0, types=['root_call_agent'])] == [0, 3, 6]
+    assert [off for off, _ in log.read(4, limit=1, types=['root_call_agent'])] == [6]
+
+
+def test_segments_roll_and_retention(tmp_path):
+    """Full segments are closed, and the oldest ones dropped past the retention size."""
+    log = EventLog(str(tmp_path), segment_bytes=200, retention_bytes=600)
+    for i in range(40):
+        log.append(_event(i))
+
+    segments = sorted(n for n in os.listdir(tmp_path) if n.endswith('.log'))
+    assert len(segments) > 1
+    assert sum(os.path.getsize(tmp_path / n) for n in segments) <= 600 + 200
+    start = log.start_offset
+    assert start > 0
+    assert [off for off, _ in log.read(0)] == list(range(start, 40))
+    assert log.read(start)[0] == (start, _event(start))
+    assert log.offset_for_timestamp(0) == start
+    assert log.offset_for_timestamp(1037) == 37 and log.offset_for_timestamp(1040) == 40
+
+
+def test_torn_index_entry_is_ignored(tmp_path):
+    """A half-written index entry is invisible to readers and dropped by the next writer."""
+    log = EventLog(str(tmp_path))
+    log.append(_event(0))
+    with open(tmp_path / ('0' * 20 + '.idx'), 'ab') as f:
+        f.write(b'\x01' * (ENTRY.size - 3))
+    assert log.end_offset == 1 and len(log.read(0)) == 1
+    assert log.append(_event(1)) == 1
+    assert log.read(0) == [(0, _event(0)), (1, _event(1))]
+
+
+def test_wakeup_reaches_other_processes_only(tmp_path):
+    """notify() wakes listeners of other processes and cleans up dead ones."""
+    import select
+    from cogni.wrappers.event_wakeup import WakeupChannel
+
+    channel = WakeupChannel(str(tmp_path / 'wake'))
+    sock = channel.listen()
+    channel.notify()
+    assert select.select([sock], [], [], 0)[0] == []
+
+    os.rename(sock.getsockname(), tmp_path / 'wake' / '1-0.sock')
+    open(tmp_path / 'wake' / '2-0.sock', 'w').close()   # left over by a dead process
+    channel.notify()
+    assert select.select([sock], [], [], 1)[0] == [sock]
+    WakeupChannel.drain(sock)
+    assert not os.path.exists(tmp_path / 'wake' / '2-0.sock')
+    sock.close()
+
+
+def test_push_delivery_does_not_wait_for_polling(isolated_state):
+    """Events stored in the process reach the handlers without a poll."""
+    import asyncio
+    import time
+    from cogni.wrappers.event import Event, _ES, event_log, store_event
+
+    async def run():
+        es = _ES(poll_interval=60)
+        es.watch_only = True
+        received = []
+        es.on('push_test', lambda evt: received.append(time.monotonic()))
+        es.offset = event_log().end_offset
+        es.start()
+        await asyncio.sleep(0.05)
+        sent = time.monotonic()
+        store_event(Event(type='push_test', payload={}))
+        for _ in range(100):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        await es.stop()
+        return sent, received
+
+    sent, received = asyncio.run(run())
+    assert len(received) == 1 and received[0] - sent < 0.5
+
+
+
+def test_local_inbox_is_shared_safely_between_threads():
+    """The writer thread pushes events while the loop takes them, without breaking the loop."""
+    import asyncio
+    import threading
+    from cogni.wrappers.event import EventRecord, _ES
+
+    es = _ES(poll_interval=60)
+    loop = asyncio.new_event_loop()
+    es._loop_ref, es._wakeup = loop, asyncio.Event()
+    evt = EventRecord('inbox_test', {})
+    done, errors = threading.Event(), []
+
+    def push():
+        for offset in range(50000):
+            es._push(offset, evt)
+        done.set()
+
+    pusher = threading.Thread(target=push)
+    pusher.start()
+    try:
+        taken = 0
+        while not done.is_set():
+            # Takes what follows the offset and drops everything behind it
+            taken += len(es._take_local(taken + 1000))
+    except RuntimeError as e:
+        errors.append(e)
+    finally:
+        pusher.join()
+        loop.close()
+    assert not errors
+
+def test_subscriptions_filter_by_type_and_payload(isolated_state, monkeypatch):
+    """Only the events a subscription handles are parsed, and each keeps its own offset."""
+    import asyncio
+    from cogni import State
+    from cogni.wrappers import event as event_module
+    from cogni.wrappers.event import _ES, event_log
+
+    built = []
+
+    class CountingRecord(event_module.EventRecord):
+        @classmethod
+        def from_dict(cls, data):
+            built.append(data['type'])
+            return super().from_dict(data)
+
+    monkeypatch.setattr(event_module, 'EventRecord', CountingRecord)
+
+    async def run():
+        es = _ES(poll_interval=0.01, push=False)
+        es.watch_only = True
+        calls, tools = [], []
+        es.on('root_call_agent', lambda evt: calls.append(evt.payload['agent']),
+              where=lambda payload: payload.get('agent') != 'skip', name='calls')
+        es.on('tool_used', lambda evt: tools.append(evt.payload['agent']), name='tools')
+        es.offset = event_log().end_offset
+        start = es.offset
+        es.start()
+        events = [{'type': 'llm_stream_start', 'payload': {'agent': 'a'}, 'timestamp': 1}] * 20
+        events += [{'type': 'root_call_agent', 'payload': {'agent': name}, 'timestamp': 1}
+                   for name in ('a', 'skip', 'b')]
+        events.append({'type': 'tool_used', 'payload': {'agent': 'c'}, 'timestamp': 1})
+        event_log().append_batch(events)
+        for _ in range(100):
+            if tools:
+                break
+            await asyncio.sleep(0.01)
+        await es.stop()
+        return calls, tools, start
+
+    calls, tools, start = asyncio.run(run())
+    assert calls == ['a', 'b'] and tools == ['c']
+    assert sorted(built) == ['root_call_agent', 'root_call_agent', 'tool_used']
+    offsets = State['events']['subscriptions_watch']
+    assert offsets['calls'] == offsets['tools'] == start + 24
+
+
+def test_emit_is_queued_and_ordered_per_emitter(isolated_state):
+    """Emitted events reach the log in batches, in the order each thread emitted them."""
+    import threading
+    from cogni.wrappers.event import ES, event_log
+
+    start = event_log().end_offset
+
+    def emitter(name):
+        for i in range(200):
+            ES.emit('queued', {'emitter': name, 'i': i})
+
+    threads = [threading.Thread(target=emitter, args=(name,)) for name in 'abc']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ES.flush(timeout=10)
+
+    stored = [evt['payload'] for _, evt in event_log().read(start, types=['queued'])]
+    assert len(stored) == 600
+    for name in 'abc':
+        assert [p['i'] for p in stored if p['emitter'] == name] == list(range(200))
+
+
+def test_writer_backpressure_and_flush():
+    """A full queue makes emitters wait for the writer, and flush waits for the last batch."""
+    import threading
+    import time
+    from cogni.wrappers.event_writer import EventWriter
+
+    release = threading.Event()
+    written = []
+
+    def write(batch):
+        release.wait()
+        written.extend(batch)
+
+    writer = EventWriter(write, max_queue=2, max_batch=2)
+    done = []
+    submitter = threading.Thread(target=lambda: [writer.submit(i) for i in range(6)] and done.append(True))
+    submitter.start()
+    try:
+        time.sleep(0.1)
+        # A batch being written, two queued: the submitter waits
+        assert not done and len(writer._queue) == 2
+        assert not writer.flush(timeout=0.05)
+    finally:
+        release.set()
+    submitter.join(5)
+    assert writer.flush(timeout=5)
+    assert done and written == list(range(6))
+
+
+def test_event_records_convert_to_and_from_the_model():
+    """Records carry the fields of Event without validation, and convert both ways."""
+    from cogni.wrappers.event import Event, EventRecord
+
+    record = EventRecord('tool_used', {'tool': 'ls'})
+    assert record.timestamp > 0 and not hasattr(record, '__dict__')
+    event = Event.from_record(record)
+    assert event == record and EventRecord.from_event(event) == record
+    assert EventRecord.from_dict(event.model_dump()) == record
+    assert record.model_dump() == event.model_dump()
+
+
+def test_concurrent_dispatch_isolates_slow_handlers(isolated_state):
+    """A slow handler doesn't hold back the others; ordering, limits and timeouts hold."""
+    import asyncio
+    import random
+    import threading
+    import time
+    from cogni import State
+    from cogni.wrappers.event import _ES, event_log
+
+    log = []
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(evt):
+        time.sleep(0.3)
+        log.append('slow')
+
+    def limited(evt):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(random.random() * 0.02)
+        with lock:
+            running[0] -= 1
+        log.append(('limited', evt.payload['i']))
+
+    async def stuck(evt):
+        await asyncio.sleep(5)
+
+    async def run():
+        es = _ES(poll_interval=0.01, push=False, concurrent=True)
+        es.watch_only = True
+        es.on('slow', slow, name='slow')
+        es.on('fast', lambda evt: log.append('fast'), name='fast')
+        es.on('limited', limited, name='limited', concurrency=2, ordered=True)
+        es.on('stuck', stuck, name='stuck', timeout=0.05)
+        es.offset = event_log().end_offset
+        start = es.offset
+        es.start()
+        event_log().append_batch(
+            [{'type': 'slow', 'payload': {}, 'timestamp': 1}, {'type': 'fast', 'payload': {}, 'timestamp': 1},
+             {'type': 'stuck', 'payload': {}, 'timestamp': 1}]
+            + [{'type': 'limited', 'payload': {'i': i}, 'timestamp': 1} for i in range(10)])
+        for _ in range(200):
+            if 'slow' in log:
+                break
+            await asyncio.sleep(0.01)
+        await es.stop()
+        return es, start
+
+    es, start = asyncio.run(run())
+    assert log.index('fast') < log.index('slow')
+    assert [entry[1] for entry in log if entry[0] == 'limited'] == list(range(10))
+    assert peak[0] == 1
+    stats = es.stats()
+    assert stats['stuck']['timeouts'] == 1 and stats['slow']['count'] == 1
+    assert stats['slow']['max'] >= 0.3 > stats['fast']['max']
+    assert State['events']['subscriptions_watch']['slow'] == start + 13
+
+
+def test_queries_use_the_type_and_agent_indexes(tmp_path):
+    """Queries by type and agent match a full scan, even with torn or missing tags."""
+    log = EventLog(str(tmp_path), segment_bytes=2000)
+    types = ['root_call_agent', 'llm_stream_start', 'tool_used']
+    log.append_batch({'type': types[i % 3], 'payload': {'agent' if i % 2 else 'name': f"agent{i % 4}"},
+                      'timestamp': 1000 + i} for i in range(60))
+    assert len(log._bases()) > 1
+
+    def scan(type, agent, start=0, end=None):
+        return [(off, evt) for off, evt in log.read(start)
+                if (end is None or off < end) and evt['type'] == type
+                and agent in (evt['payload'].get('agent'), evt['payload'].get('name'))]
+
+    assert log.query(types=['tool_used'], agents=['agent1']) == scan('tool_used', 'agent1')
+    assert log.query(types=['root_call_agent'], agents=['agent0'], start=10, end=50) \
+        == scan('root_call_agent', 'agent0', 10, 50)
+    assert [off for off, _ in log.query(types=['tool_used'], limit=3)] == [2, 5, 8]
+
+    # A fresh reader rebuilds the postings from the log where the tags are unusable
+    first, last = log._bases()[0], log._bases()[-1]
+    os.remove(tmp_path / f"{first:020d}.tags")
+    with open(tmp_path / f"{last:020d}.tags", 'ab') as f:
+        f.write(b'12\ttorn')
+    log.append_batch({'type': 'tool_used', 'payload': {'agent': 'agent1'}, 'timestamp': 2000} for _ in range(2))
+    fresh = EventLog(str(tmp_path), segment_bytes=2000)
+    assert fresh.query(types=['tool_used'], agents=['agent1']) == scan('tool_used', 'agent1')
+
+
+def test_query_events_and_replay(isolated_state):
+    """query_events combines type, agent and time window; replay feeds the handlers again."""
+    import asyncio
+    from cogni.wrappers.event import _ES, _current_timestamp_ms, event_log, query_events
+
+    start = event_log().end_offset
+    now = _current_timestamp_ms() + 1000
+    event_log().append_batch({'type': 'replayed', 'payload': {'agent': 'a' if i % 2 else 'b', 'i': i},
+                              'timestamp': now + 10 * i} for i in range(10))
+    found = query_events('replayed', agent='a', since=now + 20, until=now + 70, start=start)
+    assert [rec.payload['i'] for _, rec in found] == [3, 5, 7]
+
+    es = _ES()
+    seen = []
+    es.on('replayed', lambda evt: seen.append(evt.payload['i']))
+    count = asyncio.run(es.replay(speed=1000, types='replayed', start=start))
+    assert count == 10 and seen == list(range(10))
+
+
+def test_events_kept_in_the_state_are_imported_once(isolated_state, monkeypatch):
+    """Events stored in State['events']['events'] before the log existed are copied into it once."""
+    from cogni.wrappers import event as event_module
+
+    isolated_state['events'] = {'events': [{'type': 'old', 'payload': {'agent': 'a', 'i': i},
+                                            'timestamp': 1000 + i} for i in range(3)],
+                                'last_event': 1002}
+    assert [(off, rec.payload['i']) for off, rec in event_module.query_events('old', agent='a')] == \
+        [(0, 0), (1, 1), (2, 2)]
+    assert event_module._ES().offset == 3
+
+    monkeypatch.setattr(event_module, '_event_log', None)
+    assert event_module.event_log().end_offset == 3
@@ -18,3 +18,57 @@ def test_prompt_histo():
     # Test that the conversation history is correctly maintained
     conv = Agent[agent_name]('Hi')
     assert conv[-1].content == 'Hi'
+
+def test_history_appends_and_windows(tmp_path):
+    """The history appends to its file, reads windows past its cache from disk and sees other writers."""
+    from cogni import Conversation, Message
+    from cogni.entities import conv_file
+    from cogni.wrappers.histo import History
+
+    path = str(tmp_path / 'agent.conv')
+    history = History(path, cache_size=4)
+    assert history.last() is None and len(history.read()) == 0
+    for i in range(10):
+        assert history.append(Message('user', f"m{i}"))
+    assert not history.append(Message('user', 'm9'))
+    assert history.last().content == 'm9'
+    assert [m.content for m in history.window(3)] == ['m7', 'm8', 'm9']
+    assert [m.content for m in history.window(6)] == [f"m{i}" for i in range(4, 10)]
+    assert history.read().to_str() == Conversation.from_file(path).to_str()
+
+    # Another process appends: the cached tail is reloaded
+    conv_file.append_messages(path, [Message('assistant', 'from elsewhere')])
+    assert history.last().content == 'from elsewhere'
+    history.append(Message('user', 'm10'))
+    assert [m.content for m in Conversation.from_file(path, last=2)] == ['from elsewhere', 'm10']
+
+def test_prompt_registry_caches_and_reloads(tmp_path):
+    """Prompts are indexed once, parsed once per version of their file, and found when added."""
+    import os
+    import pytest
+    from cogni import Message
+    from cogni.wrappers.prompts import _Prompts
+
+    registry = _Prompts(check_interval=0)
+    (tmp_path / 'agent' / 'prompts').mkdir(parents=True)
+    (tmp_path / '.states' / 'prompts').mkdir(parents=True)
+    (tmp_path / '.states' / 'prompts' / 'hidden.conv').write_text('system:no')
+    prompt = tmp_path / 'agent' / 'prompts' / 'helper.conv'
+    prompt.write_text('system:v1')
+
+    path, first = registry.get('helper', root=str(tmp_path))
+    _, second = registry.get('helper', root=str(tmp_path))
+    assert path == str(prompt) and first[0] is second[0] and first is not second
+    first.should_infer = True
+    assert not registry.get('helper', root=str(tmp_path))[1].should_infer
+    grown = first + Message('user', 'hi')
+    assert len(grown) == 2 and len(registry.get('helper', root=str(tmp_path))[1]._items) == 1
+
+    prompt.write_text('system:v2')
+    os.utime(prompt, ns=(0, os.stat(prompt).st_mtime_ns + 10**9))
+    assert registry.get('helper', root=str(tmp_path))[1][0].content == 'v2'
+
+    (tmp_path / 'agent' / 'prompts' / 'added.conv').write_text('system:new')
+    assert registry.get('added', root=str(tmp_path))[1][0].content == 'new'
+    with pytest.raises(FileNotFoundError):
+        registry.get('hidden', root=str(tmp_path))
@@ -0,0 +1,399 @@
+import os
+from cogni.wrappers.state import _State
+
+
+def test_batched_writes_are_deferred(tmp_path):
+    """Batched durability keeps writes in memory until flush."""
+    state = _State(str(tmp_path), durability='batched', flush_interval=60)
+    state['s'] = {}
+    state['s']['counter'] = 1
+    state['s']['items'] = []
+    state['s']['items'].append('a')
+
+    assert state['s']['counter'] == 1
+    assert not os.path.exists(tmp_path / 's' / 'counter' / 'val.json')
+
+    state.flush()
+    assert os.path.exists(tmp_path / 's' / 'counter' / 'val.json')
+
+    fresh = _State(str(tmp_path))
+    assert fresh['s'].to_dict() == {'counter': 1, 'items': ['a']}
+
+
+def test_batched_delete_then_recreate(tmp_path):
+    """A pending delete is applied before a later write to the same key."""
+    state = _State(str(tmp_path))
+    state['s'] = {'d': {'old': 1}}
+
+    state.configure(durability='batched', flush_interval=60)
+    del state['s']['d']
+    state['s']['d'] = {'new': 2}
+    state.flush()
+
+    fresh = _State(str(tmp_path))
+    assert fresh['s'].to_dict() == {'d': {'new': 2}}
+
+
+def test_snapshot_backend_replay_and_compaction(tmp_path):
+    """The snapshot backend replays its log on open and survives compaction."""
+    state = _State(str(tmp_path), backend='snapshot')
+    state['events'] = {'events': [], 'last_event': 0}
+    for i in range(5):
+        state['events']['events'].append({'n': i})
+    state['events']['last_event'] = 4
+
+    fresh = _State(str(tmp_path), backend='snapshot')
+    assert fresh['events'].to_dict() == {'events': [{'n': i} for i in range(5)], 'last_event': 4}
+
+    state['events']['events'][1] = None
+    fresh._backend.compact('events')
+    assert not os.path.exists(tmp_path / '__snapshot' / 'events.wal.1')
+    fresh['events']['last_event'] = 5
+
+    again = _State(str(tmp_path), backend='snapshot')
+    assert again['events']['last_event'] == 5
+    assert again['events']['events'][4].to_dict() == {'n': 4}
+
+    # Checks replay only what was appended to the log since the last one
+    reads = []
+    backend = again._backend
+    replay = backend._replay
+    backend._replay = lambda root, path, offset: reads.append(offset) or replay(root, path, offset)
+    assert backend.stat('events', ['last_event']) == ('val', False)
+    assert backend.stat('events', ['missing']) is None and not reads
+    fresh['events']['events'][4]['n'] = 6
+    assert backend.stat('events', ['events', '4']) == ('dict', True)
+    assert reads and all(offset > 0 for offset in reads)
+    assert backend.load('events')['events'][4] == {'n': 6}
+
+
+def test_migrate_directory_to_snapshot(tmp_path):
+    """States written in the directory layout can be moved to the snapshot backend."""
+    from cogni.wrappers.state_backends import DirectoryBackend, SnapshotBackend, migrate_states
+
+    state = _State(str(tmp_path))
+    state['exec'] = {'logs': [{'tool': 'a'}], 'waiting': False}
+
+    assert migrate_states(DirectoryBackend(str(tmp_path)), SnapshotBackend(str(tmp_path))) == ['exec']
+    assert _State(str(tmp_path), backend='snapshot')['exec'].to_dict() == state['exec'].to_dict()
+
+
+def test_sqlite_concurrent_appends(tmp_path):
+    """Two State instances sharing one database never overwrite each other's appends."""
+    first = _State(str(tmp_path), backend='sqlite')
+    second = _State(str(tmp_path), backend='sqlite')
+    first['exec'] = {'logs': []}
+    second['exec']['logs']
+
+    for i in range(3):
+        first['exec']['logs'].append({'tool': 'first', 'n': i})
+        second['exec']['logs'].append({'tool': 'second', 'n': i})
+
+    logs = _State(str(tmp_path), backend='sqlite')['exec']['logs'].to_dict()
+    assert len(logs) == 6
+    assert [log['tool'] for log in logs] == ['first', 'second'] * 3
+    assert second['exec']['logs'].to_dict() == logs
+
+
+
+def test_sqlite_reserved_slots_keep_their_index(tmp_path):
+    """A reader loading between a slot reservation and its write still sees items at their index."""
+    writer = _State(str(tmp_path), backend='sqlite')
+    writer['s'] = {'l': [{'n': 0}]}
+    assert writer._backend.append_slot('s', ['l']) == 1
+    writer['s']['l'].append({'n': 2})
+
+    reader = _State(str(tmp_path), backend='sqlite')
+    items = reader['s']['l']
+    assert items.to_dict() == [{'n': 0}, {'n': 2}]
+    items[-1]['n'] = 5
+    assert _State(str(tmp_path), backend='sqlite')['s']['l'].to_dict() == [{'n': 0}, {'n': 5}]
+
+def test_sqlite_subtree_read(tmp_path):
+    """Subtrees can be read without loading the whole state."""
+    state = _State(str(tmp_path), backend='sqlite')
+    state['events'] = {'events': [{'type': 'a'}, {'type': 'b'}], 'last_event': 3}
+
+    backend = state._backend
+    assert backend.load_subtree('events', ['events', '1']) == {'type': 'b'}
+    assert backend.load_subtree('events', ['last_event']) == 3
+    assert backend.load_subtree('events', ['missing']) == {}
+
+
+def test_refresh_only_reloads_changed_states(tmp_path):
+    """refresh() keeps states nobody else touched and reloads the others."""
+    reader = _State(str(tmp_path))
+    writer = _State(str(tmp_path))
+    writer['events'] = {'last_event': 0}
+    writer['stuff'] = {'cwd': '/'}
+
+    events, stuff = reader['events'], reader['stuff']
+    assert reader.refresh() == []
+
+    # Our own writes do not invalidate our cache, even the first one of a state
+    reader['stuff']['cwd'] = '/tmp'
+    reader['new']['key'] = 1
+    assert reader.refresh() == []
+
+    writer['events']['last_event'] = 42
+    assert reader.refresh() == ['events']
+    assert reader['stuff'] is stuff
+    assert reader['events'] is not events
+    assert reader['events']['last_event'] == 42
+
+    # Writing after someone else must not hide their write
+    writer['stuff']['cwd'] = '/var'
+    reader['stuff']['user'] = 'me'
+    assert reader.refresh() == ['stuff']
+    assert reader['stuff'].to_dict() == {'cwd': '/var', 'user': 'me'}
+
+
+
+def test_generation_files_stay_small(tmp_path, monkeypatch):
+    """Generation files are replaced once full, and writes through the old one still count."""
+    import os
+    from cogni.wrappers import state_backends
+    monkeypatch.setattr(state_backends, 'GEN_FILE_SIZE', 8)
+    reader = _State(str(tmp_path))
+    writer = _State(str(tmp_path))
+    writer['events'] = {'last_event': 0}
+    reader['events']['last_event']
+
+    for n in range(1, 30):
+        writer['events']['last_event'] = n
+        reader['events']['seen'] = n
+        assert reader.refresh() == ['events']
+        assert reader['events']['last_event'] == n
+        assert reader.refresh() == []
+    assert os.path.getsize(tmp_path / '__gen' / 'events') < 8
+    assert sorted(os.listdir(tmp_path / '__gen')) == ['events']
+
+
+def test_states_created_by_item_access_reload_everywhere(tmp_path):
+    """A state created by State['new']['k'] = v is read back by loads, snapshots and migrations."""
+    from cogni.wrappers.state_backends import DirectoryBackend, SQLiteBackend, migrate_states
+
+    state = _State(str(tmp_path))
+    state['new']['k'] = 1
+    state['new']['nested']['x'] = 'y'
+    expected = {'k': 1, 'nested': {'x': 'y'}}
+
+    assert _State(str(tmp_path))['new'].to_dict() == expected
+    assert DirectoryBackend(str(tmp_path)).load('new') == expected
+    assert state.snapshot('new').to_dict() == expected
+    assert migrate_states(DirectoryBackend(str(tmp_path)), SQLiteBackend(str(tmp_path))) == ['new']
+    assert _State(str(tmp_path), backend='sqlite')['new'].to_dict() == expected
+
+
+def test_list_items_after_a_none_keep_their_index(tmp_path):
+    """Lazily loaded list items are written back at their stored index, None items included."""
+    for backend in ('directory', 'snapshot'):
+        root = str(tmp_path / backend)
+        _State(root, backend=backend)['probe'] = {'l': [None, {'a': 1}, 3]}
+
+        state = _State(root, backend=backend)
+        items = state['probe']['l']
+        assert items.to_dict() == [{'a': 1}, 3]
+        items[1]['a'] = 2
+        items[2] = 4
+        assert _State(root, backend=backend)['probe']['l'].to_dict() == [{'a': 2}, 4]
+
+
+def test_subscribe_delivers_path_scoped_deltas(tmp_path):
+    """Subscribers get small deltas, only for the prefix they registered."""
+    state = _State(str(tmp_path))
+    state['events'] = {'events': []}
+    state['exec'] = {}
+
+    deltas, snapshots, batches = [], [], []
+    state.subscribe(deltas.append, 'events/events')
+    state.subscribe(lambda name, data: snapshots.append(data), 'exec', snapshot=True)
+    state.subscribe(batches.append, 'events', coalesce=60)
+
+    state['events']['events'].append({'type': 'a'})
+    state['events']['last_event'] = 1
+    state['events']['last_event'] = 2
+    state['exec']['waiting'] = True
+
+    assert [(d.path, d.op, d.value) for d in deltas] == [(('events', '0'), 'append', {'type': 'a'})]
+    assert snapshots == [{'waiting': True}]
+    assert batches == []
+
+    state.flush()
+    assert [[(c.path, c.value) for c in batch] for batch in batches] == [
+        [(('events', '0'), {'type': 'a'}), (('last_event',), 2)]]
+
+
+def test_contains_and_exists_have_no_side_effects(tmp_path):
+    """Membership tests answer from metadata and never create anything."""
+    for backend in ('directory', 'snapshot', 'sqlite'):
+        root = tmp_path / backend
+        _State(str(root), backend=backend)['exec'] = {'logs': [{'tool': 'a'}], 'tree': {}}
+
+        state = _State(str(root), backend=backend)
+        assert 'exec' in state
+        assert 'missing' not in state
+        assert state.exists('exec/logs/0/tool')
+        assert state.exists('exec/tree')
+        assert not state.exists('exec/nope')
+        assert not state.exists('missing')
+        assert state._cache == {}
+        assert not os.path.exists(root / 'missing')
+
+        state['exec']
+        assert state.exists(['exec', 'logs', '0'])
+        assert not state.exists('exec/logs/1')
+
+
+def test_lazy_loading_with_bounded_cache(tmp_path):
+    """Only touched subtrees are loaded, and loaded ones are capped by cache_size."""
+    writer = _State(str(tmp_path))
+    writer['events'] = {'events': [{'type': 't', 'payload': {'n': i}} for i in range(50)], 'last_event': 7}
+
+    state = _State(str(tmp_path), cache_size=10)
+    assert state['events']['last_event'] == 7
+    events = state['events']['events']
+    assert events._data is None
+
+    assert [e['payload']['n'] for e in events.to_dict()] == list(range(50))
+    loaded = [node for node in state._lru.values() if node._data is not None]
+    assert len(loaded) <= 10
+
+    # Evicted nodes come back as the same objects, so held references stay valid
+    assert state['events']['events'] is events
+    events.append({'type': 'u', 'payload': {'n': 50}})
+    assert len(_State(str(tmp_path))['events']['events']) == 51
+
+
+def test_nodes_are_slotted_and_share_path_prefixes(tmp_path):
+    """Nodes don't copy their path, it is rebuilt from the links to their owners."""
+    state = _State(str(tmp_path))
+    state['exec'] = {'logs': [{'tool': 'a', 'args': {'x': 1}}]}
+    args = state['exec']['logs'][0]['args']
+
+    assert not hasattr(args, '__dict__')
+    assert args._path == ['logs', '0', 'args']
+    args['y'] = 2
+    assert _State(str(tmp_path))['exec'].to_dict() == {'logs': [{'tool': 'a', 'args': {'x': 1, 'y': 2}}]}
+
+
+def test_bulk_operations_write_once_and_notify_once(tmp_path):
+    """extend/update/replace_all/truncate persist in one write with one change each."""
+    for backend in ('directory', 'snapshot', 'sqlite'):
+        root = tmp_path / backend
+        state = _State(str(root), backend=backend)
+        state['conv'] = {'messages': [], 'meta': {}}
+        changes, writes = [], []
+        state.subscribe(changes.append, 'conv')
+        apply_tracked = state._backend.apply_tracked
+        state._backend.apply_tracked = lambda ops, known: writes.append(1) or apply_tracked(ops, known)
+
+        messages = state['conv']['messages']
+        messages.extend({'role': 'user', 'n': i} for i in range(20))
+        state['conv']['meta'].update(agent='Coder', hops=3)
+        assert len(writes) == 2
+        assert [(c.path, c.op) for c in changes] == [(('messages',), 'extend'), (('meta',), 'update')]
+        assert len(changes[0].value) == 20
+
+        messages.truncate(5)
+        messages.append({'role': 'assistant', 'n': 5})
+        assert [m['n'] for m in _State(str(root), backend=backend)['conv']['messages'].to_dict()] == list(range(6))
+
+        messages.replace_all(['a', 'b'])
+        state['conv']['meta'].replace_all({'agent': 'Tester'})
+        assert changes[-1] == ('conv', ('meta',), 'set', {'agent': 'Tester'})
+        assert _State(str(root), backend=backend)['conv'].to_dict() == {
+            'messages': ['a', 'b'], 'meta': {'agent': 'Tester'}}
+
+
+def _append_from_process(states_dir, tag, count):
+    state = _State(states_dir)
+    for i in range(count):
+        state['events']['events'].append({'tag': tag, 'n': i})
+
+
+def test_concurrent_appends_never_collide(tmp_path):
+    """Threads and processes appending to one list each get their own index."""
+    import multiprocessing
+    import threading
+
+    state = _State(str(tmp_path))
+    state['events'] = {'events': []}
+    events = state['events']['events']
+    indices = []
+    threads = [threading.Thread(target=lambda: indices.extend(events.append(i) for i in range(50)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(indices) == list(range(200))
+
+    ctx = multiprocessing.get_context('fork')
+    procs = [ctx.Process(target=_append_from_process, args=(str(tmp_path), tag, 20)) for tag in 'ab']
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    stored = _State(str(tmp_path))['events']['events'].to_dict()
+    assert len(stored) == 240
+    assert sorted((e['tag'], e['n']) for e in stored[200:]) == sorted((t, n) for t in 'ab' for n in range(20))
+
+
+def test_compare_and_set_and_lock(tmp_path):
+    """compare_and_set sees writes from other processes, lock() refreshes and flushes."""
+    state = _State(str(tmp_path))
+    other = _State(str(tmp_path))
+    state['exec'] = {'owner': None}
+    other['exec']['owner']
+
+    assert state['exec'].compare_and_set('owner', None, 'a')
+    assert not other['exec'].compare_and_set('owner', None, 'b')
+    assert other['exec']['owner'] == 'a'
+    assert other['exec'].compare_and_set('owner', 'a', 'b')
+
+    state['exec']['slots'] = ['a']
+    assert not state['exec']['slots'].compare_and_set(3, 'x', 'b')
+    assert not state['exec']['slots'].compare_and_set(-2, None, 'b')
+    assert state['exec']['slots'].compare_and_set(2, None, 'c')
+    assert state['exec']['slots'].to_dict() == ['a', 'c']
+    other.refresh('exec')
+    assert other['exec']['slots'].compare_and_set(2, 'c', 'd')
+    assert _State(str(tmp_path))['exec']['slots'][2] == 'd'
+    assert state['exec']['slots'].append('e') == 3
+    assert other['exec']['slots'].compare_and_set(3, 'e', 'f')
+
+    with state.lock('exec') as exec_state:
+        assert exec_state['owner'] == 'b'
+        exec_state['count'] = 1
+    assert _State(str(tmp_path))['exec']['count'] == 1
+
+
+def test_published_snapshots_are_read_in_place(tmp_path):
+    """Readers query and diff published snapshots without touching the state's files."""
+    writer = _State(str(tmp_path))
+    writer['exec'] = {'logs': [{'tool': 't%d' % i} for i in range(12)], 'waiting': False, 'tree': {}}
+    writer.publish('exec')
+
+    reader = _State(str(tmp_path))
+    before = reader.snapshot('exec')
+    assert before.get('logs/11/tool') == 't11'
+    assert before.get('logs')[10] == {'tool': 't10'}
+    assert before.keys('logs')[:3] == ['0', '1', '2']
+    assert before.kind('tree') == 'dict' and 'waiting' in before
+    assert before.get('missing', 'default') == 'default'
+    assert before.to_dict() == writer['exec'].to_dict()
+    assert reader._cache == {}
+
+    writer.configure(publish=['exec'], publish_interval=60)
+    writer['exec']['waiting'] = True
+    del writer['exec']['tree']
+    writer['exec']['logs'].append({'tool': 'new'})
+    writer._publish_pending_states()
+
+    after = reader.snapshot('exec')
+    assert before.get('waiting') is False
+    assert [(c.path, c.op, c.value) for c in before.diff(after)] == [
+        (('logs', '12'), 'set', {'tool': 'new'}),
+        (('tree',), 'delete', None),
+        (('waiting',), 'set', True)]
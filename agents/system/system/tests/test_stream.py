@@ -0,0 +1,140 @@
+import threading
+import time
+
+from cogni import State
+from cogni.wrappers.stream import StreamBuffer
+
+
+def test_cursors_read_only_new_deltas(isolated_state):
+    """Each cursor gets what was written since its last read, across restarts."""
+    buffer = StreamBuffer('test_cursors', persist_interval=None)
+    first = buffer.cursor()
+    for delta in ('Hel', 'lo', ' wor'):
+        buffer.write(delta)
+    assert first.read() == 'Hello wor'
+    late = buffer.cursor(offset=3)
+    buffer.write('ld')
+    assert first.read() == 'ld' and late.read() == 'lo world'
+    assert first.read() == '' and buffer.read(7) == 'orld'
+
+    buffer.close()
+    assert first.done
+    buffer.reset()
+    buffer.write('new')
+    assert not first.done and first.read() == 'new'
+
+
+def test_waiting_reader_gets_every_token(isolated_state):
+    """A reader waiting in another thread sees the whole stream, in order."""
+    buffer = StreamBuffer('test_threads', persist_interval=None)
+    buffer.reset()
+    received = []
+
+    def reader():
+        cursor = buffer.cursor()
+        while not cursor.done:
+            received.append(cursor.wait(timeout=5))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(200):
+        buffer.write(f"{i} ")
+    buffer.close()
+    thread.join(5)
+    assert ''.join(received) == ''.join(f"{i} " for i in range(200))
+
+
+def test_persistence_is_throttled_and_incremental(isolated_state):
+    """The State gets one chunk per persistence, and other readers rebuild the stream from it."""
+    writer = StreamBuffer('test_persisted', persist_interval=3600)
+    writer.reset()
+    for i in range(100):
+        writer.write(f"t{i} ")
+    # Persisted by reset, not due again before the end
+    assert len(State['stream_buffer']['test_persisted']['chunks']) == 0
+    writer.close()
+    entry = State['stream_buffer']['test_persisted']
+    assert len(entry['chunks']) == 1 and entry['done']
+
+    reader = StreamBuffer('test_persisted')
+    cursor = reader.cursor()
+    assert cursor.read() == writer.text and cursor.done
+
+
+def test_channels_keep_concurrent_agents_apart(isolated_state):
+    """Writes go to the channel of the agent running in the context, tails see every token."""
+    import asyncio
+    from cogni.wrappers.stream import _Stream
+
+    streams = _Stream()
+    runs = {name: streams.new_run(name) for name in ('coder', 'reviewer')}
+    keys = [streams.key(runs[name], 0) for name in runs]
+    for key in keys:
+        streams[key].reset()
+    received = {key: [] for key in keys}
+
+    def agent(name):
+        with streams.channel(name, 0, run=runs[name]):
+            for i in range(100):
+                streams.write(f"{name}{i} ")
+
+    async def run():
+        tail = streams.tail(*keys)
+        threads = [threading.Thread(target=agent, args=(name,)) for name in runs]
+        for thread in threads:
+            thread.start()
+        async for key, delta in tail:
+            received[key].append(delta)
+        for thread in threads:
+            thread.join()
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    for name, key in zip(runs, keys):
+        assert ''.join(received[key]) == ''.join(f"{name}{i} " for i in range(100)) == streams[key].text
+    assert streams.current is streams._default and not streams.live()
+
+
+def test_finished_channels_are_evicted_and_buffers_bounded(isolated_state):
+    """Only the last finished channels are kept, and each keeps its last characters."""
+    from cogni.wrappers.stream import StreamBuffer, _Stream
+
+    streams = _Stream(max_finished=2)
+    run = streams.new_run('looper')
+    for hop in range(4):
+        with streams.channel('looper', hop, run=run):
+            streams.write(f"hop {hop}")
+    assert [hop for hop in range(4) if streams.key(run, hop) in streams] == [2, 3]
+    assert streams.key(run, 0) not in State['stream_buffer']
+
+    ring = StreamBuffer('test_ring', persist_interval=None, capacity=10)
+    cursor = ring.cursor()
+    for i in range(10):
+        ring.write(f"{i:02d}")
+    assert ring.length == 20 and cursor.read() == '0506070809'
+
+
+def test_abandoned_channels_expire_and_any_process_evicts(isolated_state):
+    """Open channels of dead writers stop being live, and readers evict old finished ones."""
+    import asyncio
+    import subprocess
+    import sys
+    from cogni.wrappers.stream import _Stream
+
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    streams = State['stream_buffer']
+    streams['crashed.0'] = {'generation': 1, 'chunks': ['half an ans'], 'done': False,
+                            'pid': dead.pid, 'updated': time.time()}
+    for n in range(3):
+        streams[f'old.{n}'] = {'generation': 1, 'chunks': ['ok'], 'done': True,
+                               'pid': dead.pid, 'updated': n}
+
+    reader = _Stream(max_finished=2)
+
+    async def tail_all():
+        return [item async for item in reader.tail()]
+
+    assert asyncio.run(asyncio.wait_for(tail_all(), 5)) == []
+    assert streams['crashed.0']['done']
+    assert sorted(streams.keys()) == ['crashed.0', 'old.2']
+    assert reader['crashed.0'].text == 'half an ans' and reader['crashed.0'].done
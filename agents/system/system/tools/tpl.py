@@ -1,4 +1,3 @@
-from copy import deepcopy
 import random
 import re
 import string
@@ -17,12 +16,7 @@ def tpl_s(tpl_str: str, **kwargs) -> str:
 
 @tool
 def tpl_c(conv: Conversation, **kwargs) -> Conversation:
-    new_conv = deepcopy(conv)
-
-    for m in new_conv.msgs:
-        m.content = tpl_s(m.content, **kwargs)
-
-    return new_conv
+    return conv.map(lambda m: m.with_content(tpl_s(m.content, **kwargs)))
 
 
 @tool
@@ -66,8 +60,7 @@ def tpl_tool(conv):
             modified_content = remove_comments(modified_content)
 
     elif isinstance(conv, Conversation):
-        new_conv = deepcopy(conv)
-        for msg in new_conv.msgs:
+        def render(msg):
             msg_content = msg._original_content
             matches = re.finditer(tool_pattern, msg._original_content)
             for match in matches:
@@ -82,7 +75,7 @@ def tpl_tool(conv):
                 msg_content = msg_content\
                 .replace(
                     match.group(0), str(tool_uses[random_id]))
-            msg.content = remove_comments(msg_content)
-        modified_content = new_conv
+            return msg.with_content(remove_comments(msg_content))
+        modified_content = conv.map(render)
 
     return tpl(modified_content, **tool_uses)
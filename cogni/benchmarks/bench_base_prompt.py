@@ -0,0 +1,69 @@
+"""
+Agent.base_prompt lookups: recursive glob + parse on every access vs the prompt registry.
+
+Builds a throwaway project with --agents prompt files and a node_modules-like directory of
+--files files, then times --n lookups of a prompt the way base_prompt did it before and
+through cogni.wrappers.prompts.Prompts.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_base_prompt.py --n 200
+"""
+import os
+import glob
+import time
+import argparse
+import tempfile
+
+from cogni import Conversation, Message
+from cogni.wrappers.prompts import Prompts
+
+
+def build(root: str, agents: int, files: int) -> None:
+    for i in range(agents):
+        prompts = os.path.join(root, 'agents', f"agent{i}", 'prompts')
+        os.makedirs(prompts)
+        Conversation([Message('system', f"You are agent{i}. " + 'x' * 2000),
+                      Message('user', 'Hi'), Message('assistant', 'ok')]).to_file(
+            os.path.join(prompts, f"agent{i}.conv"))
+    for i in range(files):
+        package = os.path.join(root, 'node_modules', f"pkg{i // 50}")
+        os.makedirs(package, exist_ok=True)
+        open(os.path.join(package, f"file{i}.js"), 'w').close()
+
+
+def glob_lookup(root: str, name: str) -> Conversation:
+    for file_path in glob.glob(root + f"/**/prompts/{name}.conv", recursive=True):
+        return Conversation.from_file(file_path)
+    raise FileNotFoundError(name)
+
+
+def main(n: int, agents: int, files: int) -> None:
+    root = tempfile.mkdtemp(prefix='cogni-prompts-')
+    build(root, agents, files)
+    name = f"agent{agents // 2}"
+    start = time.perf_counter()
+    for _ in range(n):
+        expected = glob_lookup(root, name)
+    old = (time.perf_counter() - start) / n
+
+    start = time.perf_counter()
+    Prompts.get(name, root=root)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        _, prompt = Prompts.get(name, root=root)
+    new = (time.perf_counter() - start) / n
+    assert prompt.to_str() == expected.to_str()
+    print(f"{agents} prompts, {files:,} other files")
+    print(f"glob + parse {old * 1000:8.2f} ms/lookup   registry {new * 1e6:6.1f} us/lookup "
+          f"(first lookup, index and parse: {first * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=200)
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--files', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.n, args.agents, args.files)
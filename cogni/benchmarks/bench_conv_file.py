@@ -0,0 +1,70 @@
+"""
+Reading and appending to large .conv files: whole-file split/rewrite vs the streaming reader/writer.
+
+Writes a conversation of --messages messages of about --size characters (a multi-MB .histo
+file), then times a full read, reading the last 12 messages, and appending one message, the
+way Conversation did it before (read, split, strip, rebuild and rewrite the file) and with
+cogni.entities.conv_file.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_conv_file.py --messages 5000 --size 1000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from cogni import Conversation, Message
+from cogni.entities import conv_file
+
+ROLES = ['user', 'assistant', 'developer']
+
+
+def old_read(path):
+    with open(path) as f:
+        return Conversation.from_str(f.read())
+
+
+def old_append(path, msg):
+    padded_SEP = '\n\n' + conv_file.SEP.decode() + '\n\n'
+    conv = old_read(path) + msg
+    with open(path, 'w') as f:
+        f.write(padded_SEP.join(f"{m.role}:{m.content}" for m in conv))
+
+
+def timed(fn, *args, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(messages: int, size: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix='cogni-conv-'), 'histo.conv')
+    Conversation([Message(ROLES[i % 3], f"message {i}\n" + 'x' * size) for i in range(messages)]).to_file(path)
+    print(f"{messages:,} messages, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    old, old_conv = timed(old_read, path)
+    new, new_conv = timed(Conversation.from_file, path)
+    assert new_conv.to_dict() == old_conv.to_dict()
+    print(f"{'full read':<12} split {old * 1000:8.1f} ms   streaming {new * 1000:8.2f} ms")
+
+    old, old_tail = timed(lambda: old_read(path)[-12:])
+    new, new_tail = timed(Conversation.from_file, path, 12)
+    assert new_tail.to_dict() == old_tail.to_dict()
+    print(f"{'last 12':<12} split {old * 1000:8.1f} ms   mmap tail {new * 1000:8.3f} ms")
+
+    msg = Message('user', 'one more')
+    old, _ = timed(old_append, path, msg, repeat=1)
+    new, _ = timed(conv_file.append_messages, path, [msg], repeat=1)
+    assert conv_file.read_last(path, 2) == [msg, msg]
+    print(f"{'append 1':<12} rewrite {old * 1000:6.1f} ms   append {new * 1000:11.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=1000)
+    args = parser.parse_args()
+    main(args.messages, args.size)
@@ -0,0 +1,81 @@
+"""
+Cost of long tool loops: the deep-copying Conversation vs the structurally shared one.
+
+Each hop does what Agent.__call__ and a use_tools middleware do: rehop with the LLM reply,
+read the last message, add a tool result, and take the 12-message window of prompt_histo.
+Messages are --size characters. Prints the time of the whole --hops loop and of its last hop.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_conversation_hops.py --hops 200
+"""
+import time
+import argparse
+from copy import deepcopy
+
+from cogni import Conversation, Message
+
+
+class DeepcopyConversation:
+    """The previous Conversation operations, copying every message on each of them."""
+
+    def __init__(self, msgs):
+        self.msgs = list(msgs)
+        self.llm = None
+        self.should_infer = False
+        self.hops = 0
+
+    def __add__(self, other):
+        if isinstance(other, Message):
+            new_msgs = deepcopy(self.msgs) + [deepcopy(other)]
+        else:
+            new_msgs = deepcopy(self.msgs) + deepcopy(other.msgs)
+        new_conv = deepcopy(self)
+        new_conv.msgs = new_msgs
+        return new_conv
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.msgs[key]
+        new_conv = deepcopy(self)
+        new_conv.msgs = deepcopy(self.msgs[key])
+        return new_conv
+
+    def rehop(self, message_str=None, role='system'):
+        new_conv = deepcopy(self)
+        if message_str is not None:
+            new_conv = new_conv + Message(role, message_str)
+        new_conv.should_infer = True
+        return new_conv
+
+
+def loop(cls, hops: int, size: int) -> tuple:
+    conv = cls([Message('system', 'x' * size), Message('user', 'y' * size)])
+    last_hop = 0.0
+    start = time.perf_counter()
+    for hop in range(hops):
+        hop_start = time.perf_counter()
+        conv = conv.rehop('a' * size, 'assistant')
+        conv.should_infer = False
+        assert conv[-1].role == 'assistant'
+        conv.hops += 1
+        conv = conv + Message('developer', 't' * size)
+        conv.should_infer = True
+        window = conv[-12:]
+        last_hop = time.perf_counter() - hop_start
+    assert len(window.msgs) == 12
+    return time.perf_counter() - start, last_hop
+
+
+def main(hops: int, size: int) -> None:
+    for name, cls in (('deepcopy', DeepcopyConversation), ('shared', Conversation)):
+        total, last_hop = loop(cls, hops, size)
+        print(f"{name:<9} {hops} hops {total * 1000:9.1f} ms   last hop {last_hop * 1000:7.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hops', type=int, default=200)
+    parser.add_argument('--size', type=int, default=2000)
+    args = parser.parse_args()
+    main(args.hops, args.size)
@@ -0,0 +1,71 @@
+"""
+Emit-to-handler latency of ES.
+
+Emits events from the dispatching process and from another process, with push delivery and
+with the old 100ms polling, and reports the delay between ``store_event`` and the handler.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_event_latency.py --n 50
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+os.environ.setdefault('COGNI_EVENTS_DIR', tempfile.mkdtemp(prefix='cogni-events-'))
+
+from cogni.wrappers.event import Event, _ES, event_log, store_event
+
+EMITTER = """
+import sys, time
+from cogni.wrappers.event import Event, store_event
+n, interval = int(sys.argv[1]), float(sys.argv[2])
+time.sleep(0.5)
+for i in range(n):
+    store_event(Event(type='bench', payload={'sent': time.time()}))
+    time.sleep(interval)
+"""
+
+
+async def measure(push: bool, remote: bool, n: int, interval: float = 0.02) -> list:
+    latencies = []
+    es = _ES(poll_interval=0.1, push=push)
+    es.on('bench', lambda evt: latencies.append(time.time() - evt.payload['sent']))
+    es.offset = event_log().end_offset
+    es.start()
+    if remote:
+        proc = subprocess.Popen([sys.executable, '-c', EMITTER, str(n), str(interval)])
+        while proc.poll() is None:
+            await asyncio.sleep(0.05)
+    else:
+        for _ in range(n):
+            store_event(Event(type='bench', payload={'sent': time.time()}))
+            await asyncio.sleep(interval)
+    await asyncio.sleep(0.3)
+    await es.stop()
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else float('nan')
+    print(f"{name:<28} n={len(latencies):<4} median {statistics.median(latencies) * 1000:8.2f} ms"
+          f"   p99 {p99 * 1000:8.2f} ms")
+
+
+async def main(n: int) -> None:
+    for push in (False, True):
+        for remote in (False, True):
+            name = f"{'push' if push else 'poll 100ms'} / {'other process' if remote else 'same process'}"
+            report(name, await measure(push, remote, n))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=50)
+    asyncio.run(main(parser.parse_args().n))
@@ -0,0 +1,84 @@
+"""
+Event queries over a day of events: full scan vs the type/agent indexes of the log.
+
+Fills a fresh log with --n events (a mix of stream, tool and agent-call events from 20
+agents, spread over 24h), then times the same queries as a filtered full read and through
+``query_events``, cold (index loaded from the .tags files) and warm.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_event_query.py --n 200000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+os.environ['COGNI_EVENTS_DIR'] = tempfile.mkdtemp(prefix='cogni-events-')
+
+from cogni.wrappers import event as event_module
+from cogni.wrappers.event import EventRecord, event_log, query_events
+
+TYPES = ['llm_stream_start', 'llm_stream_end', 'agent_will_infer', 'tool_used', 'root_call_agent']
+DAY_MS = 24 * 3600 * 1000
+
+
+def fill(n: int) -> int:
+    start_ms = 1_700_000_000_000
+    batch = []
+    for i in range(n):
+        # Agent calls are rare, stream events frequent
+        event_type = TYPES[4] if i % 97 == 0 else TYPES[i % 4]
+        batch.append({'type': event_type, 'payload': {'name': f"agent{i % 20}", 'hops': i % 7},
+                      'timestamp': start_ms + i * DAY_MS // n})
+        if len(batch) == 5000:
+            event_log().append_batch(batch)
+            batch = []
+    event_log().append_batch(batch)
+    return start_ms
+
+
+def scan(types=None, agent=None, since=None, until=None):
+    found = []
+    for off, evt in event_log().read(0):
+        payload = evt['payload']
+        if types and evt['type'] != types:
+            continue
+        if agent and agent not in (payload.get('agent'), payload.get('name')):
+            continue
+        if (since and evt['timestamp'] < since) or (until and evt['timestamp'] > until):
+            continue
+        found.append((off, EventRecord.from_dict(evt)))
+    return found
+
+
+def timed(fn, **criteria):
+    start = time.perf_counter()
+    result = fn(**criteria)
+    return time.perf_counter() - start, len(result)
+
+
+def main(n: int) -> None:
+    start_ms = fill(n)
+    hour = 3600 * 1000
+    queries = {
+        'type=root_call_agent': dict(types='root_call_agent'),
+        'type+agent': dict(types='tool_used', agent='agent3'),
+        'agent, 1h window': dict(agent='agent7', since=start_ms + 10 * hour, until=start_ms + 11 * hour),
+    }
+    print(f"{n:,} events in {len(event_log()._bases())} segments")
+    for name, criteria in queries.items():
+        scan_time, scanned = timed(scan, **criteria)
+        # Cold: a new log object, its postings are loaded from the .tags files
+        event_module._event_log = None
+        cold, found = timed(query_events, **criteria)
+        warm, _ = timed(query_events, **criteria)
+        assert found == scanned
+        print(f"{name:<22} {found:>7,} hits   scan {scan_time * 1000:8.1f} ms   "
+              f"index cold {cold * 1000:8.1f} ms   warm {warm * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=200000)
+    main(parser.parse_args().n)
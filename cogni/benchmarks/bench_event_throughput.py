@@ -0,0 +1,54 @@
+"""
+Emit and fetch throughput of the event pipeline, pydantic ``Event`` vs ``EventRecord``.
+
+emit: build the event and queue it, then wait for the writer to store everything.
+fetch: read the log back and turn every stored event into an object.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_event_throughput.py --n 20000
+"""
+import os
+import time
+import argparse
+import tempfile
+
+os.environ.setdefault('COGNI_EVENTS_DIR', tempfile.mkdtemp(prefix='cogni-events-'))
+
+from cogni.wrappers.event import Event, EventRecord, event_log, flush, queue_event
+
+
+def payload(i: int) -> dict:
+    return {'name': 'agent', 'llm': 'gpt-4o', 'hops': i % 7}
+
+
+def bench_emit(make, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        queue_event(make(i))
+    flush()
+    return time.perf_counter() - start
+
+
+def bench_fetch(convert, offset: int) -> float:
+    start = time.perf_counter()
+    for _, evt in event_log().read(offset):
+        convert(evt)
+    return time.perf_counter() - start
+
+
+def main(n: int) -> None:
+    for name, make, convert in (
+        ('Event (pydantic)', lambda i: Event(type='bench', payload=payload(i)), lambda d: Event(**d)),
+        ('EventRecord', lambda i: EventRecord('bench', payload(i)), EventRecord.from_dict),
+    ):
+        offset = event_log().end_offset
+        emit = bench_emit(make, n)
+        fetch = bench_fetch(convert, offset)
+        print(f"{name:<18} emit {n / emit:10,.0f} ev/s   fetch {n / fetch:10,.0f} ev/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=20000)
+    main(parser.parse_args().n)
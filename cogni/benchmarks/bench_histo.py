@@ -0,0 +1,70 @@
+"""
+Per-turn cost of an agent history: re-read/rewrite of the .histo file vs the History store.
+
+A turn does what prompt_histo and Agent.__call__ do: read the last 12 messages, then append
+the user message and the assistant reply. Histories are filled to each size first (messages
+of --size characters), then --turns turns are timed.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_histo.py --turns 20
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from cogni import Conversation, Message
+from cogni.wrappers.histo import History
+
+
+class RewriteHistory:
+    """The previous Agent.histo / append_histo: parse the whole file, rewrite it on append."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def histo(self):
+        try:
+            return Conversation.from_file(self.path)
+        except Exception:
+            return Conversation([])
+
+    def window(self, k):
+        return self.histo[-k:]
+
+    def append(self, msg):
+        last = self.histo[-1] if len(self.histo) else None
+        if last is not None and last.content == msg.content and last.role == msg.role:
+            return
+        (self.histo + msg).to_file(self.path)
+
+
+def turns(history, n: int, size: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        assert len(history.window(12)) == 12
+        history.append(Message('user', f"question {i} " + 'q' * size))
+        history.append(Message('assistant', f"answer {i} " + 'a' * size))
+    return (time.perf_counter() - start) / n
+
+
+def main(n: int, size: int) -> None:
+    for messages in (100, 1000, 5000):
+        results = []
+        for cls in (RewriteHistory, History):
+            path = os.path.join(tempfile.mkdtemp(prefix='cogni-histo-'), 'agent.conv')
+            Conversation([Message('user' if i % 2 else 'assistant', f"{i} " + 'x' * size)
+                          for i in range(messages)]).to_file(path)
+            results.append(turns(cls(path), n, size))
+        print(f"{messages:>5} messages   rewrite {results[0] * 1000:8.2f} ms/turn   "
+              f"History {results[1] * 1000:6.3f} ms/turn")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--size', type=int, default=500)
+    args = parser.parse_args()
+    main(args.turns, args.size)
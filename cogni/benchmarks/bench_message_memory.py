@@ -0,0 +1,58 @@
+"""
+Memory and copy cost of messages: the previous dict-based Message vs the slotted one.
+
+Builds --n messages from a .histo-like conversation (roles and contents read from text, so
+every role is a fresh string), then reports the python heap held per message, without the
+content strings (the same in both), and the time to deepcopy the conversation.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_message_memory.py --n 20000
+"""
+import gc
+import time
+import argparse
+import tracemalloc
+from copy import deepcopy
+
+from cogni import Conversation, Message
+
+
+class DictMessage:
+    """The previous Message: a __dict__ with role, content and a duplicate _original_content."""
+
+    def __init__(self, role: str, content: str):
+        if role.strip() == "A":
+            role = "assistant"
+        self.role = role
+        self.content = content
+        self._original_content = content
+
+
+def measure(cls, lines: list) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    msgs = [cls(*line.split(':', 1)) for line in lines]
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # Without the content strings, built by split in both cases
+    held -= sum(len(m.content) + 49 for m in msgs)
+    conv = Conversation(msgs)
+    start = time.perf_counter()
+    deepcopy(conv)
+    return held / len(msgs), time.perf_counter() - start
+
+
+def main(n: int) -> None:
+    roles = ['system', 'user', 'assistant', 'developer']
+    lines = [f"{roles[i % 4]}:message {i} " + 'x' * (i % 200) for i in range(n)]
+    for name, cls in (('dict', DictMessage), ('slotted', Message)):
+        per_message, copy_time = measure(cls, lines)
+        print(f"{name:<8} {per_message:6.0f} B/message   deepcopy of {n:,} messages {copy_time * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=20000)
+    main(parser.parse_args().n)
@@ -0,0 +1,110 @@
+"""
+Memory footprint of loaded State trees: copied-path nodes (before) vs slotted, owner-linked nodes.
+
+Stores N event-like records in a throwaway states directory, loads them back both ways and
+reports the bytes of python heap held per stored leaf (scalar value):
+
+- before: the previous node layout, loaded here level by level from the same backend. Each
+  node has a __dict__, its own copy of its path and an entry in a weak registry keyed by
+  its path tuple.
+- after: the current ``_State``, touching every event so that all of them are loaded.
+
+Run from a cogni project root (the package reads ./CONF.yaml on import):
+
+    python benchmarks/bench_state_memory.py --n 2000
+"""
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+import weakref
+from collections import OrderedDict
+
+from cogni.wrappers.state import _State
+from cogni.wrappers.state_backends import DirectoryBackend
+
+LEAVES_PER_EVENT = 5
+
+
+def make_event(i: int) -> dict:
+    return {
+        'type': 'llm_stream_start',
+        'payload': {'name': 'Coder', 'llm': 'gpt41', 'hops': i % 7},
+        'timestamp': 1_700_000_000_000 + i,
+    }
+
+
+class CopiedPathNode:
+    """The previous StateDict/StateList layout: a __dict__ and its own copy of its path."""
+
+    def __init__(self, state_name: str, path: list, registry):
+        self._data = None
+        self._parent = None
+        self._state_name = state_name
+        self._path = path
+        registry[tuple(path)] = self
+
+
+def measure(load) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = load()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used, elapsed, tree
+
+
+def load_before(states_dir: str):
+    """Load every node as the previous _load_node did, one level at a time."""
+    backend = DirectoryBackend(states_dir)
+    registry, lru = weakref.WeakValueDictionary(), OrderedDict()
+
+    def load(node):
+        kind, children = backend.load_children(node._state_name, node._path)
+        node._data = [] if kind == 'list' else {}
+        for key, child_kind, value in children:
+            if child_kind != 'val':
+                value = load(CopiedPathNode(node._state_name, list(node._path + [key]), registry))
+            if kind == 'list':
+                node._data.append(value)
+            else:
+                node._data[key] = value
+        lru[id(node)] = node
+        return node
+
+    return load(CopiedPathNode('bench', [], registry)), registry, lru
+
+
+def load_after(states_dir: str):
+    state = _State(states_dir, cache_size=10 ** 9)
+    events = state['bench']['events']
+    # Touch every event so all of them are loaded
+    for i in range(len(events)):
+        events[i]['payload']['hops']
+    return state
+
+
+def main(n: int = 2000) -> None:
+    with tempfile.TemporaryDirectory() as states_dir:
+        writer = _State(states_dir, durability='batched', batch_size=10 ** 9)
+        writer['bench'] = {'events': [make_event(i) for i in range(n)]}
+        writer.flush()
+        del writer
+
+        leaves = n * LEAVES_PER_EVENT
+        print(f"events: {n}  leaves: {leaves}")
+        for name, load in (('before', load_before), ('after', load_after)):
+            used, elapsed, tree = measure(lambda: load(states_dir))
+            print(f"{name:<7} load: {elapsed:5.2f}s   heap: {used / 1024 / 1024:5.1f} MiB  ->  "
+                  f"{used / leaves:4.0f} bytes per leaf")
+            del tree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--n', type=int, default=2000)
+    main(parser.parse_args().n)
@@ -168,13 +168,31 @@ The available space on `/` is `371G`.
         console.print(Panel(f"Running agent [bold blue]{agent}[/]"))
         # TODO: Implement agent running
 
+    def migrate_states(self, dst: str = 'snapshot', src: str = 'directory', states_dir: str = './.states'):
+        """Copy every state from one storage backend to another.
+
+        Args:
+            dst: Backend to migrate to (``snapshot`` or ``directory``)
+            src: Backend to migrate from
+            states_dir: The states directory
+        """
+        from .wrappers.state_backends import make_backend, migrate_states
+
+        src_backend = make_backend(src, states_dir)
+        dst_backend = make_backend(dst, states_dir)
+        names = migrate_states(src_backend, dst_backend)
+        dst_backend.close()
+        console.print(f"[green]✓[/] Migrated {len(names)} states from {src} to {dst}")
+        console.print(f"[info]Set COGNI_STATE_BACKEND={dst} to use them")
+
     def __str__(self):
         return """Cogni CLI
 
 Usage:
     cogni create <name>     Create a new project
     cogni init             Initialize project in current directory
-    cogni run <agent> <input>  Run an agent"""
+    cogni run <agent> <input>  Run an agent
+    cogni migrate_states --dst=snapshot  Move .states to another storage backend"""
 
 
 def main():
@@ -0,0 +1,128 @@
+"""
+Streaming reader/writer for the ``.conv`` format.
+
+A ``.conv`` file is ``role:content`` messages separated by ``SEP``. Files written by
+cogni pad the separator with blank lines (``PADDED_SEP``), and each chunk is stripped
+before its role is split off, so hand-written files with any padding read the same::
+
+    system:You are a helpful agent
+
+    __-__
+
+    user:Hi
+
+Messages are parsed block by block, the last N are found by searching separators
+backwards in an mmap of the file, and appends write one separator and the new messages
+at the end. The results are the same as ``Conversation.from_str`` / ``to_str``.
+"""
+import io
+import os
+import mmap
+from typing import IO, Iterable, Iterator, List, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+from .message import Message
+
+SEP = b'\n__-__\n'
+PADDED_SEP = b'\n\n' + SEP + b'\n\n'
+
+#: Bytes read at a time when parsing forward
+BLOCK_SIZE = 64 * 1024
+
+
+def _message(chunk: Union[bytes, str]) -> Message:
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode()
+    role, content = chunk.strip().split(':', 1)
+    return Message(role=role, content=content)
+
+
+def _encode(msg: Message) -> bytes:
+    return f"{msg.role}:{msg.content}".encode()
+
+
+def iter_messages(source: Union[IO, mmap.mmap, bytes, str]) -> Iterator[Message]:
+    """
+    Yields the messages of a conversation as they are read.
+    :param source: A text or binary file object, an mmap, or the conversation as bytes/str.
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    elif isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    buffer = source.read(0)
+    sep = SEP if isinstance(buffer, bytes) else SEP.decode()
+    search_from, found = 0, False
+    while True:
+        block = source.read(BLOCK_SIZE)
+        buffer += block
+        start, pos = 0, buffer.find(sep, search_from)
+        while pos != -1:
+            yield _message(buffer[start:pos])
+            found = True
+            start = pos + len(sep)
+            pos = buffer.find(sep, start)
+        buffer = buffer[start:]
+        # A separator may be cut between this block and the next one
+        search_from = max(0, len(buffer) - len(sep) + 1)
+        if not block:
+            break
+    # An empty file has no message, an empty last chunk is an error as in from_str
+    if found or buffer.strip():
+        yield _message(buffer)
+
+
+def read_messages(path: str) -> List[Message]:
+    with open(path, 'rb') as f:
+        return list(iter_messages(f))
+
+
+def read_last(path: str, n: int) -> List[Message]:
+    """Returns the last n messages of the file, parsing only those."""
+    chunks = []
+    with open(path, 'rb') as f:
+        if n <= 0 or os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            while len(chunks) < n:
+                pos = mm.rfind(SEP, 0, end)
+                if pos == -1:
+                    chunks.append(mm[:end])
+                    break
+                chunks.append(mm[pos + len(SEP):end])
+                end = pos
+    return [_message(chunk) for chunk in reversed(chunks)]
+
+
+def write_messages(path: str, msgs: Iterable[Message]) -> None:
+    """Writes the messages as to_str() does, one message at a time."""
+    with open(path, 'wb') as f:
+        for i, msg in enumerate(msgs):
+            if i:
+                f.write(PADDED_SEP)
+            f.write(_encode(msg))
+
+
+def append_messages(path: str, msgs: Iterable[Message]) -> int:
+    """
+    Appends the messages at the end of the file (created if needed), without reading it.
+    :return: The size of the file before the append.
+    """
+    data = PADDED_SEP.join(_encode(msg) for msg in msgs)
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            size = f.seek(0, os.SEEK_END)
+            if data:
+                f.write(PADDED_SEP + data if size else data)
+                f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    return size
@@ -3,12 +3,17 @@ Defines the Conversation class, which represents a sequence of messages between
 """
 import os
 import json
-from copy import deepcopy
-from typing import List
+import threading
+from itertools import islice
+from typing import Callable, Iterable, List
 from .message import Message
+from . import conv_file
 
 
-SEP = '\n__-__\n'
+SEP = conv_file.SEP.decode()
+
+# Guards the "is this view still the tip of its backing list" check in _extended
+_tip_lock = threading.Lock()
 
 
 def repr_flags(**flags):
@@ -35,12 +40,25 @@ class Conversation:
     """
     Represents a conversation, which is a sequence of messages.
     Conversations can be created from strings or files and manipulated programmatically.
+
+    Messages are never modified in place, so conversations share them: a conversation
+    is a view (start, stop) over an append-only backing list. `+` appends to that list
+    when the conversation is its tip, and copies only its own view when it is not
+    (another conversation already grew from it), or when the backing is a tuple (see
+    frozen()). Slicing shares the list as well.
+    The flags (llm, should_infer, hops) belong to each conversation.
     """
     @classmethod
-    def from_file(cls, path: str):
+    def from_file(cls, path: str, last: int | None = None):
+        """
+        Reads the conversation in path, parsed as it is read.
+        :param last: Only read the last messages of the file.
+        """
         assert os.path.isfile(path), f"No conversation found at {path}"
+        if last is not None:
+            return cls(conv_file.read_last(path, last))
         with open(path) as f:
-            return cls.from_str(f.read())
+            return cls(conv_file.iter_messages(f))
 
     @classmethod
     def from_str(cls, conv_str: str) -> 'Conversation':
@@ -51,14 +69,17 @@ class Conversation:
 
     def to_str(self) -> str:
         padded_SEP = '\n\n' + SEP + '\n\n'
-        return f"{padded_SEP}".join(f"{msg.role}:{msg.content}" for msg in self.msgs)
+        return f"{padded_SEP}".join(f"{msg.role}:{msg.content}" for msg in self)
 
     def to_file(self, path: str) -> None:
-        with open(path, 'w') as f:
-            f.write(self.to_str())
+        conv_file.write_messages(path, self)
+
+    def append_to_file(self, path: str) -> None:
+        """Appends the messages to the conversation in path, without rewriting it."""
+        conv_file.append_messages(path, self)
 
     def openai(self) -> List[dict]:
-        conv = [msg.to_dict() for msg in self.msgs]
+        conv = [msg.to_dict() for msg in self]
         for m in conv:
             if m['role'] !='assistant':
                 m['role'] = 'user'
@@ -69,7 +90,7 @@ class Conversation:
         Converts the conversation to a list of dictionaries, each representing a message.
         :return: A list of dictionaries with 'role' and 'content' keys.
         """
-        return [{'role': msg.role, 'content': msg.content} for msg in self.msgs]
+        return [{'role': msg.role, 'content': msg.content} for msg in self]
 
     def __init__(self, msgs: List[Message]) -> None:
 
@@ -78,24 +99,55 @@ class Conversation:
                 return Message(**msg)
             return msg
 
-        self.msgs = [to_Message(m) for m in msgs]
+        self._items = [to_Message(m) for m in msgs]
+        self._start = 0
+        self._stop = len(self._items)
         self.llm = None
         self.should_infer = False
         self.hops = 0
 
+    @property
+    def msgs(self) -> tuple:
+        """The messages of the conversation, as a tuple."""
+        return tuple(islice(self._items, self._start, self._stop))
+
+    def _derive(self, items: list, start: int, stop: int) -> 'Conversation':
+        """A new conversation with the flags of this one over items[start:stop]."""
+        new_conv = object.__new__(type(self))
+        new_conv.__dict__.update(self.__dict__)
+        new_conv._items, new_conv._start, new_conv._stop = items, start, stop
+        return new_conv
+
+    def _extended(self, msgs: Iterable[Message]) -> 'Conversation':
+        msgs = list(msgs)
+        with _tip_lock:
+            if isinstance(self._items, list) and self._stop == len(self._items):
+                self._items.extend(msgs)
+                return self._derive(self._items, self._start, self._stop + len(msgs))
+        items = list(self._items[self._start:self._stop]) + msgs
+        return self._derive(items, 0, len(items))
+
+    def frozen(self) -> 'Conversation':
+        """
+        The same conversation over a tuple of its messages, which `+` never extends in place.
+        For conversations kept and handed out many times, such as cached prompts.
+        """
+        items = tuple(self)
+        return self._derive(items, 0, len(items))
+
+    def map(self, fn: Callable[[Message], Message]) -> 'Conversation':
+        """Returns a new Conversation with the same flags and fn applied to every message."""
+        items = [fn(msg) for msg in self]
+        return self._derive(items, 0, len(items))
+
     def __add__(self, other) -> 'Conversation':
         """Returns a new Conversation instance with the given message or conversation added."""
         if isinstance(other, Message):
-            new_msgs = deepcopy(self.msgs) + [deepcopy(other)]
+            return self._extended((other,))
         elif isinstance(other, Conversation):
-            new_msgs = deepcopy(self.msgs) + deepcopy(other.msgs)
-        else:
-            raise TypeError(
-                "Operand must be an instance of Message or Conversation.")
-        new_conv = deepcopy(self)
-        new_conv.msgs = new_msgs
-
-        return new_conv
+            return self._extended(other)
+        raise TypeError(
+            "Operand must be an instance of Message or Conversation.")
 
     def __repr__(self):
         """
@@ -107,30 +159,39 @@ class Conversation:
                            hops=self.hops)
 
         # Convert each message to its string representation
-        msgs = ''.join([str(m) for m in self.msgs])
+        msgs = ''.join([str(m) for m in self])
 
         return flags + '\n' + msgs
 
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __iter__(self):
+        return islice(self._items, self._start, self._stop)
+
     def __getitem__(self, key):
         if isinstance(key, int):
             # Return a single message if key is an integer
-            return self.msgs[key]
-            return deepcopy(self.msgs[key])
+            index = key + len(self) if key < 0 else key
+            if not 0 <= index < len(self):
+                raise IndexError("Conversation index out of range")
+            return self._items[self._start + index]
         elif isinstance(key, slice):
             # Return a new Conversation instance with a slice of messages if key is a slice
-            new_msgs = deepcopy(self.msgs[key])
-            new_conv = deepcopy(self)
-            new_conv.msgs = new_msgs
-            return new_conv
+            indices = range(self._start, self._stop)[key]
+            if indices.step == 1:
+                return self._derive(self._items, indices.start, max(indices.start, indices.stop))
+            items = [self._items[i] for i in indices]
+            return self._derive(items, 0, len(items))
         else:
             raise TypeError(
                 "Invalid key type. Key must be an integer or a slice.")
 
     def rehop(self, message_str=None, role='system'):
-        new_conv = deepcopy(self)
-
         if message_str is not None:
-            new_conv = new_conv + Message(role, message_str)
+            new_conv = self + Message(role, message_str)
+        else:
+            new_conv = self._derive(self._items, self._start, self._stop)
         new_conv.should_infer = True
 
         return new_conv
@@ -2,13 +2,18 @@
 Defines the Message class, which represents a single message in a conversation.
 Each message has a role (e.g., 'user' or 'system') and content (the text of the message).
 """
-from copy import deepcopy
+import sys
 
 
 class Message:
     """
     Represents a single message in a conversation.
+
+    Messages are immutable and shared between conversations: with_content and parse
+    return new messages. Roles are interned, and the original (template) content is
+    only stored when it differs from the content.
     """
+    __slots__ = ('role', 'content', '_original')
 
     def __init__(self, role: str, content: str):
         """
@@ -18,9 +23,45 @@ class Message:
         """
         if role.strip() == "A":
             role = "assistant"
-        self.role = role
-        self.content = content
-        self._original_content = content
+        object.__setattr__(self, 'role', sys.intern(role))
+        object.__setattr__(self, 'content', content)
+        object.__setattr__(self, '_original', None)
+
+    @classmethod
+    def _make(cls, role: str, content: str, original: str | None) -> 'Message':
+        msg = object.__new__(cls)
+        object.__setattr__(msg, 'role', role)
+        object.__setattr__(msg, 'content', content)
+        object.__setattr__(msg, '_original', None if original == content else original)
+        return msg
+
+    @property
+    def _original_content(self) -> str:
+        """The content the message was created with, before templating or parsing."""
+        return self.content if self._original is None else self._original
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Message is immutable, use with_content() instead of setting {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Message is immutable, cannot delete {name}")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Message._make, (self.role, self.content, self._original)
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self.role == other.role and self.content == other.content
+
+    def __hash__(self):
+        return hash((self.role, self.content))
 
     def to_dict(self) -> dict:
         """
@@ -36,8 +77,17 @@ class Message:
         }
     to_json = to_dict
 
-    def parse(self, parser):
-        self.content = parser(self._original_content)
+    def with_content(self, content: str) -> 'Message':
+        """
+        Returns a message with the given content, the same role and the same original content.
+        """
+        if content == self.content:
+            return self
+        return Message._make(self.role, content, self._original_content)
+
+    def parse(self, parser) -> 'Message':
+        """Returns a message whose content is parser applied to the original content."""
+        return self.with_content(parser(self._original_content))
 
     def __repr__(self):
         import shutil
@@ -1,10 +1,11 @@
-import glob
 import os
 from typing import Any, Dict, List, Optional
 from .instances_store import InstancesStore
 from .middleware import MW
 from ..entities import Message, Conversation
 from .tool import Tool
+from .histo import History
+from .prompts import Prompts
 
 
 class Agent(metaclass=InstancesStore):
@@ -23,36 +24,31 @@ class Agent(metaclass=InstancesStore):
         Agent[name] = self
 
 
+    @property
+    def history(self) -> History:
+        """The history store of the agent (its path is known once base_prompt was read)."""
+        return History.for_path(self._histo_path)
+
     @property
     def histo(self):
         try:
-            return Conversation.from_file(self._histo_path)
+            return self.history.read()
         except:  # FIXME: have typed exception & exception handling, this can hide nasty bugs
             return Conversation([])
 
     def append_histo(self, msg):
-        try:
-            last = self.histo[-1]
-            if last.content == msg.content and last.role == msg.role:
-                return
-        except:  # FIXME
-            pass
-        (self.histo + msg).to_file(self._histo_path)
+        self.history.append(msg)
 
     @property
     def base_prompt(self):
-        grandparent_path = os.getcwd()
-        pattern = grandparent_path + f"/**/prompts/{self.name}.conv"
-
-        for file_path in glob.glob(pattern, recursive=True):
-            self._histo_path = file_path.replace(
-                '/prompts/', '/prompts/.histo/')
+        file_path, prompt = Prompts.get(self.name)
+        histo_path = file_path.replace('/prompts/', '/prompts/.histo/')
+        if getattr(self, '_histo_path', None) != histo_path:
+            self._histo_path = histo_path
             histo_dir = os.path.dirname(self._histo_path)
             if not os.path.exists(histo_dir):
                 os.makedirs(histo_dir, exist_ok=True)
-            return Conversation.from_file(file_path)
-
-        raise FileNotFoundError(f"Did not find {self.name}.conv")
+        return prompt
 
     def _init_middlewares(self):
         """Initialize middleware chain from string specification."""
@@ -75,7 +71,7 @@ class Agent(metaclass=InstancesStore):
         - ctx: The context dict
         - conv: The current conversation/value
         """
-        from cogni import State, Tool, ES
+        from cogni import State, Tool, ES, Stream
         self._init_middlewares()
         parent = kwargs.get("_parent")
         if parent:
@@ -94,6 +90,8 @@ class Agent(metaclass=InstancesStore):
             Agent.root_call = self.name
             ES.emit('root_call_agent', {"agent":self.name})
         Agent.last_active = self.name
+        # LLM output of this run goes to its own stream channels, one per hop
+        run = Stream.new_run(self.name)
 
         def infer(conv):
             ...
@@ -121,10 +119,12 @@ class Agent(metaclass=InstancesStore):
                     )
                 else:
                     Tool['emit']('agent_will_infer',{"name":self.name,"llm":llm,"hops":conv.hops})
-                    Tool['emit']('llm_stream_start',{"name":self.name,"llm":llm,"hops":conv.hops})
+                    channel = Stream.key(run, conv.hops)
+                    Tool['emit']('llm_stream_start',{"name":self.name,"llm":llm,"hops":conv.hops,"stream":channel})
                     
                     inferor = Tool['llm']
-                    infered_conf = inferor(conv)
+                    with Stream.channel(self.name, conv.hops, run=run):
+                        infered_conf = inferor(conv)
                     conv = conv.rehop(
                         infered_conf,
                         'assistant'
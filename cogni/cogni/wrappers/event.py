@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import os
+import re
+import time
 import asyncio
+import weakref
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Callable, Awaitable
+from typing import Any, Callable, Awaitable, Iterable
 
 from pydantic import BaseModel, Field
 from .tool import tool
+from .event_log import EventLog
+from .event_wakeup import WakeupChannel
+from .event_writer import EventWriter
 
 # ---------------------------------------------------------------------------
 # Event model
@@ -27,47 +38,192 @@ class Event(BaseModel):
         extra = "ignore"
         populate_by_name = True
 
+    @classmethod
+    def from_record(cls, record: EventRecord) -> Event:
+        return cls(type=record.type, payload=record.payload, timestamp=record.timestamp)
+
+
+class EventRecord:
+    """
+    Slotted event used inside the pipeline (emit queue, log, dispatch).
+
+    It has the attributes of ``Event`` but no validation: ``Event`` stays the model of the
+    public API, records are converted with ``Event.from_record`` / ``EventRecord.from_event``.
+    """
+
+    __slots__ = ('type', 'payload', 'timestamp')
+
+    def __init__(self, type: str, payload: dict[str, Any], timestamp: int | None = None):
+        self.type = type
+        self.payload = payload
+        self.timestamp = _current_timestamp_ms() if timestamp is None else timestamp
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> EventRecord:
+        return cls(data['type'], data.get('payload') or {}, data.get('timestamp'))
+
+    @classmethod
+    def from_event(cls, event: Event | EventRecord) -> EventRecord:
+        if isinstance(event, EventRecord):
+            return event
+        return cls(event.type, event.payload, event.timestamp)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'type': self.type, 'payload': self.payload, 'timestamp': self.timestamp}
+
+    def model_dump(self, **_) -> dict[str, Any]:
+        """Same as ``to_dict``, for code written against ``Event``."""
+        return self.to_dict()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (EventRecord, Event)):
+            return NotImplemented
+        return (self.type, self.payload, self.timestamp) == (other.type, other.payload, other.timestamp)
+
+    def __repr__(self) -> str:
+        return f"EventRecord(type={self.type!r}, payload={self.payload!r}, timestamp={self.timestamp})"
+
 
 # ---------------------------------------------------------------------------
-# Storage hooks — declare only, you will implement them
+# Storage hooks — events live in an append-only, segmented log (see event_log.py)
 # ---------------------------------------------------------------------------
 
-async def fetch_new_events(after:int) -> list[Event]:
-    """Retrieve and return *new* events not yet processed."""
-    from cogni import State
-    State.reset_cache()
-    if not "events" in State['events']:
-        return []
-    #print(State['events'])
-    all_events = [
-        e for e in State['events']['events'].to_dict() if e.get('timestamp')]
-    #print(all_events)
-    #print(all_events)
-    new_events = [Event(**evt) for evt in all_events if evt['timestamp'] > after]
-    sorted_events = sorted(new_events, key=lambda x: x.timestamp)
-    
-    return sorted_events
+#: Where the event log is kept, relative to the project root
+EVENTS_DIR = os.getenv('COGNI_EVENTS_DIR', './.states/__events')
+
+_event_log: EventLog | None = None
+
+#: Wakes dispatchers of other processes when an event is stored
+wakeup = WakeupChannel(os.path.join(EVENTS_DIR, 'wake'))
+
+#: Running dispatchers of this process, handed new events directly by ``store_event``
+_local_dispatchers: "weakref.WeakSet[_ES]" = weakref.WeakSet()
+
+#: ``async`` (the default) queues emitted events for a background writer, ``sync`` stores
+#: them before ``emit`` returns
+EMIT_MODE = os.getenv('COGNI_EVENTS_EMIT', 'async')
 
 
-def store_event(event: Event) -> None:
-    """Persist an event for later consumption."""
-    from cogni import State
-    State.reset_cache()
-    if not "events" in State['events']:
-        State['events']['events'] = []
-        
+def event_log() -> EventLog:
+    """The process-wide event log, opened on first use."""
+    global _event_log
+    if _event_log is None:
+        log = EventLog(EVENTS_DIR)
+        _import_state_events(log)
+        _event_log = log
+    return _event_log
+
+
+def _import_state_events(log: EventLog) -> None:
+    """
+    Copies the events kept in ``State['events']['events']`` before the event log existed
+    into a log that was never written to, so that replays and queries still see them.
+    """
+    if log.end_offset:
+        return
+    from .state import State
+    if not State.exists('events/events'):
+        return
+    events = State['events']['events'].to_dict()
+    log.import_events(evt for evt in events if isinstance(evt, dict) and 'type' in evt)
+
+
+def read_events(offset: int, limit: int | None = None,
+                types: Iterable[str] | None = None) -> list[tuple[int, Event]]:
+    """Return ``(offset, event)`` for the events stored from *offset* on (of *types* only), in order."""
+    return [(off, Event(**evt)) for off, evt in event_log().read(offset, limit, types)]
+
+
+async def fetch_new_events(after:int) -> list[Event]:
+    """Retrieve and return the events stored after the *after* timestamp (ms)."""
+    log = event_log()
+    # Only the tail from the first candidate offset is read, and only newer events validated
+    return [Event(**evt) for _, evt in log.read(log.offset_for_timestamp(after + 1))
+            if (evt.get('timestamp') or 0) > after]
+
+
+def query_events(types: str | Iterable[str] | None = None, agent: str | Iterable[str] | None = None,
+                 since: int | None = None, until: int | None = None, start: int = 0,
+                 end: int | None = None, limit: int | None = None) -> list[tuple[int, EventRecord]]:
+    """
+    Stored events matching every given criterion, as ``(offset, record)`` in log order.
+
+    Args:
+        types: Event type(s)
+        agent: Agent name(s), from ``payload['agent']`` or ``payload['name']``
+        since: First timestamp (ms) to include
+        until: Last timestamp (ms) to include
+        start: First offset to include
+        end: Offset to stop before
+        limit: Maximum number of events to return
+
+    Type and agent come from the secondary indexes of the log, the time window from a
+    binary search of its offsets: only the matching events are read.
+    """
+    log = event_log()
+    if since is not None:
+        start = max(start, log.offset_for_timestamp(since))
+    if until is not None:
+        stop = log.offset_for_timestamp(until + 1)
+        end = stop if end is None else min(end, stop)
+    found = log.query(types=[types] if isinstance(types, str) else types,
+                      agents=[agent] if isinstance(agent, str) else agent,
+                      start=start, end=end, limit=limit)
+    records = [(off, EventRecord.from_dict(evt)) for off, evt in found]
+    if since is not None or until is not None:
+        records = [(off, rec) for off, rec in records
+                   if (since is None or rec.timestamp >= since) and (until is None or rec.timestamp <= until)]
+    return records
+
+
+def _check(event: Event | EventRecord) -> None:
     if not event.type:
         print(event)
         raise Exception('a')
-    try:
-        State['events']['events'].append(event.model_dump(exclude_unset=False))
-    except:
-        ...
+
+
+def _store_batch(events: list[Event | EventRecord]) -> int:
+    """Append *events* to the log in one write and hand them to the dispatchers."""
+    events = [EventRecord.from_event(evt) for evt in events]
+    first = event_log().append_batch(evt.to_dict() for evt in events)
+    for es in list(_local_dispatchers):
+        for i, evt in enumerate(events):
+            es._push(first + i, evt)
+    wakeup.notify()
+    return first
+
+
+#: Stores the events queued by ``emit``, see ``event_writer``
+writer = EventWriter(_store_batch)
+
+
+def store_event(event: Event | EventRecord) -> int:
+    """Persist an event for later consumption, return its offset in the log."""
+    _check(event)
+    # Events emitted before by this process must come first
+    if writer.pending:
+        writer.flush()
+    return _store_batch([event])
+
+
+def queue_event(event: Event | EventRecord) -> None:
+    """Hand an event to the background writer (see ``EMIT_MODE``) and return immediately."""
+    _check(event)
+    if EMIT_MODE == 'sync':
+        store_event(event)
+    else:
+        writer.submit(event)
+
+
+def flush(timeout: float | None = None) -> bool:
+    """Wait until every emitted event is stored, False on timeout."""
+    return writer.flush(timeout)
+
 
 @tool
 def emit(type:str, payload:dict[str, Any]) -> None:
-    event = Event(type=type, payload=payload)
-    store_event(event)
+    event = EventRecord(type, payload)
+    queue_event(event)
 
 
 
@@ -76,61 +232,239 @@ def emit(type:str, payload:dict[str, Any]) -> None:
 # ---------------------------------------------------------------------------
 
 
-Handler = Callable[[Event], Awaitable[None] | None]
+Handler = Callable[[EventRecord], Awaitable[None] | None]
+Predicate = Callable[[dict[str, Any]], bool]
+
+
+class HandlerStats:
+    """Call count, outcomes and latency of a handler."""
+
+    __slots__ = ('count', 'errors', 'timeouts', 'total', 'max', '_recent')
+
+    #: Latencies kept for the percentiles
+    RECENT = 1000
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent: deque = deque(maxlen=self.RECENT)
+
+    def record(self, seconds: float, outcome: str = 'ok') -> None:
+        self.count += 1
+        if outcome == 'error':
+            self.errors += 1
+        elif outcome == 'timeout':
+            self.timeouts += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._recent.append(seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Latency under which *q* (0..1) of the recent calls completed."""
+        if not self._recent:
+            return 0.0
+        ordered = sorted(self._recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {'count': self.count, 'errors': self.errors, 'timeouts': self.timeouts,
+                'mean': self.mean, 'p50': self.percentile(0.5), 'p95': self.percentile(0.95),
+                'max': self.max}
+
+
+class EventSubscription:
+    """A handler registered with ``ES.on``, with its own offset in the log."""
+
+    def __init__(self, owner: "_ES", name: str, types: set[str] | None,
+                 where: Predicate | None, handler: Handler, concurrency: int | None = None,
+                 timeout: float | None = None, ordered: bool = False):
+        self._owner = owner
+        self.name = name
+        self.types = types
+        self.where = where
+        self.func = handler
+        self.handler = owner._ensure_async(handler)
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ordered = ordered
+        self.stats = HandlerStats()
+        #: Offset of the next event to handle, loaded from ``State['events']`` on first dispatch
+        self.offset: int | None = None
+        # Offset persisted last, and offsets whose handler is still running (concurrent mode)
+        self._committed: int | None = None
+        self._inflight: set[int] = set()
+        self._semaphore: asyncio.Semaphore | None = None
+        # Last task of each event type, for ``ordered``
+        self._tails: dict[str, asyncio.Task] = {}
+
+    def matches(self, event_type: str, payload: dict[str, Any]) -> bool:
+        if self.types is not None and event_type not in self.types:
+            return False
+        return self.where is None or bool(self.where(payload))
+
+    def unsubscribe(self) -> None:
+        if self in self._owner._subscriptions:
+            self._owner._subscriptions.remove(self)
 
 
 class _ES:
-    """In-memory event dispatcher with async background listener."""
+    """
+    In-memory event dispatcher with async background listener.
 
-    def __init__(self, poll_interval: float = 0.1) -> None:
-        from .state import State
+    With *push* (the default) the listener sleeps until an event is stored: emitters of the
+    same process hand it their events directly, other processes wake it through a Unix
+    socket (see ``event_wakeup``). The log is still checked every *poll_interval* seconds
+    when push is off, or every ``PUSH_FALLBACK_INTERVAL`` seconds as a safety net.
+
+    Each handler is a subscription with its own offset. The log is only read for the types
+    someone subscribed to, and an event is only decoded into an ``EventRecord`` when a
+    subscription will handle it.
+
+    Handlers run one after the other by default. With *concurrent*, each call is a task of
+    its own and sync handlers run in a thread pool of *max_workers*, so a slow handler only
+    delays itself; see the options of ``on``. A subscription offset then only moves past
+    events whose handler completed, and the listener waits when *max_pending* calls are
+    still running.
+    """
+
+    PUSH_FALLBACK_INTERVAL = 1.0
+
+    def __init__(self, poll_interval: float = 0.1, push: bool = True, concurrent: bool = False,
+                 max_workers: int | None = None, max_pending: int = 1000) -> None:
         self._poll_interval = poll_interval
-        self._handlers: dict[str, list[Handler]] = {}
-        self._wildcard_handlers: list[Handler] = []
+        self._subscriptions: list[EventSubscription] = []
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        self._tasks: set[asyncio.Task] = set()
         self._running: bool = False
         self._task: asyncio.Task | None = None
         self.watch_only = False
-        if "last_event" not in State["events"]:
-            State["events"]["last_event"] = 0
-            
-        self._last_handle = State["events"]["last_event"]
+        self.push = push
+        self._loop_ref: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        # Filled by the storing thread (the EventWriter's), emptied by the loop
+        self._inbox: dict[int, EventRecord] = {}
+        self._inbox_lock = threading.Lock()
+
     @property
-    def last_event(self):
+    def offset(self) -> int:
+        """
+        Offset up to which the log was dispatched, persisted in ``State['events']``.
+
+        New subscriptions start from it.
+        """
         from .state import State
-        key = "last_event"
-        if self.watch_only:
-            key += "_watch"
+        key = "offset_watch" if self.watch_only else "offset"
         if key not in State["events"]:
-            State["events"][key] = 0
+            # Resume from the timestamp kept before events had offsets
+            last_event = State["events"].get("last_event_watch" if self.watch_only else "last_event")
+            State["events"][key] = event_log().offset_for_timestamp(last_event + 1) if last_event else 0
         return State["events"][key]
-    
-    @last_event.setter
-    def last_event(self, val):
+
+    @offset.setter
+    def offset(self, val: int) -> None:
+        from .state import State
+        self._save_offset(val)
+        # Subscriptions follow, so that they don't replay what came before
+        for sub in self._subscriptions:
+            sub.offset = sub._committed = None
+        key = "subscriptions_watch" if self.watch_only else "subscriptions"
+        if key in State["events"]:
+            del State["events"][key]
+
+    def _save_offset(self, val: int) -> None:
         from .state import State
-        key = "last_event"
-        if self.watch_only:
-            key += "_watch"
+        State["events"]["offset_watch" if self.watch_only else "offset"] = val
 
-        State["events"][key] = val
+    def _stored_offsets(self):
+        from .state import State
+        key = "subscriptions_watch" if self.watch_only else "subscriptions"
+        if key not in State["events"]:
+            State["events"][key] = {}
+        return State["events"][key]
+
+    def _active_subscriptions(self) -> list[EventSubscription]:
+        """The subscriptions, with their offsets loaded."""
+        subs = list(self._subscriptions)
+        pending = [sub for sub in subs if sub.offset is None]
+        if pending:
+            stored = self._stored_offsets()
+            for sub in pending:
+                sub.offset = sub._committed = stored.get(sub.name, self.offset)
+        return subs
+
+    def _commit(self, subs: Iterable[EventSubscription]) -> None:
+        """Persist how far each of *subs* got: up to its oldest call still running."""
+        positions = {}
+        for sub in subs:
+            if sub.offset is None:
+                continue
+            position = min(sub._inflight) if sub._inflight else sub.offset
+            if position != sub._committed:
+                sub._committed = positions[sub.name] = position
+        if positions:
+            self._stored_offsets().update(positions)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Latency and outcomes of each handler, by subscription name (see ``HandlerStats``)."""
+        return {sub.name: sub.stats.as_dict() for sub in self._subscriptions}
 
     # ---------------------------------------------------------------------
     # Registration API
     # ---------------------------------------------------------------------
-    def on(self, event_type: str, handler: Handler) -> None:
-        """Register *handler* for *event_type* (or "*" for any event)."""
-        container = (
-            self._wildcard_handlers
-            if event_type == "*"
-            else self._handlers.setdefault(event_type, [])
-        )
-        container.append(self._ensure_async(handler))
+    def on(self, event_type: str | Iterable[str], handler: Handler,
+           where: Predicate | None = None, name: str | None = None,
+           concurrency: int | None = None, timeout: float | None = None,
+           ordered: bool = False) -> EventSubscription:
+        """
+        Register *handler* for *event_type* (or "*" for any event).
+
+        Args:
+            event_type: An event type, several of them, or "*"
+            handler: Called with each matching ``EventRecord``, sync or async
+            where: Only handle the events whose payload satisfies this predicate
+            name: Key of the subscription offset, derived from the handler by default
+            concurrency: Concurrent mode: maximum number of calls running at once
+            timeout: Concurrent mode: seconds after which a call is given up (a sync
+                handler keeps its thread until it returns)
+            ordered: Concurrent mode: handle events of the same type one at a time, in order
+        """
+        types = {event_type} if isinstance(event_type, str) else set(event_type)
+        types = None if "*" in types else types
+        if name is None:
+            name = f"{getattr(handler, '__module__', None)}.{getattr(handler, '__qualname__', 'handler')}"
+            name += "@" + ("*" if types is None else ",".join(sorted(types)))
+        name = re.sub(r"[^\w.@,*-]", "_", name)
+        taken = {sub.name for sub in self._subscriptions}
+        unique, n = name, 1
+        while unique in taken:
+            n += 1
+            unique = f"{name}#{n}"
+        sub = EventSubscription(self, unique, types, where, handler, concurrency, timeout, ordered)
+        # Wildcard handlers run first
+        if types is None:
+            index = sum(1 for s in self._subscriptions if s.types is None)
+            self._subscriptions.insert(index, sub)
+        else:
+            self._subscriptions.append(sub)
+        return sub
 
     @staticmethod
-    def _ensure_async(handler: Handler) -> Callable[[Event], Awaitable[None]]:
+    def _ensure_async(handler: Handler) -> Callable[[EventRecord], Awaitable[None]]:
         if asyncio.iscoroutinefunction(handler):
             return handler  # type: ignore[return-value]
 
-        async def _wrapper(evt: Event) -> None:  # type: ignore[valid-type]
+        async def _wrapper(evt: EventRecord) -> None:  # type: ignore[valid-type]
             handler(evt)  # type: ignore[misc]
 
         return _wrapper
@@ -138,65 +472,261 @@ class _ES:
     # ---------------------------------------------------------------------
     # Runtime control
     # ---------------------------------------------------------------------
-    async def _dispatch(self, evt: Event) -> None:
-        for h in self._wildcard_handlers:
-            res = h(evt)
-            if asyncio.iscoroutine(res):
-                await res
-        for h in self._handlers.get(evt.type, []):
-            res = h(evt)
-            if asyncio.iscoroutine(res):
-                await res
+    async def _dispatch(self, evt: EventRecord, subs: list[EventSubscription] | None = None) -> None:
+        """Run the handlers of *subs* (by default, of every subscription matching *evt*)."""
+        if subs is None:
+            subs = [sub for sub in self._subscriptions if sub.matches(evt.type, evt.payload)]
+        for sub in subs:
+            started = time.perf_counter()
+            try:
+                res = sub.handler(evt)
+                if asyncio.iscoroutine(res):
+                    await res
+            except Exception:
+                sub.stats.record(time.perf_counter() - started, 'error')
+                raise
+            sub.stats.record(time.perf_counter() - started)
+
+    def _dispatch_concurrently(self, offset: int, evt: EventRecord,
+                               subs: list[EventSubscription]) -> None:
+        """Start one task per handler of *evt*, without waiting for them."""
+        for sub in subs:
+            previous = sub._tails.get(evt.type) if sub.ordered else None
+            sub._inflight.add(offset)
+            task = asyncio.ensure_future(self._call(sub, offset, evt, previous))
+            self._tasks.add(task)
+            if sub.ordered:
+                sub._tails[evt.type] = task
+            task.add_done_callback(lambda task, sub=sub, offset=offset, event_type=evt.type:
+                                   self._on_call_done(task, sub, offset, event_type))
+
+    async def _call(self, sub: EventSubscription, offset: int, evt: EventRecord,
+                    previous: asyncio.Task | None) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        if sub.concurrency and sub._semaphore is None:
+            sub._semaphore = asyncio.Semaphore(sub.concurrency)
+        if sub._semaphore is not None:
+            await sub._semaphore.acquire()
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            if sub.is_async:
+                call = sub.func(evt)
+            else:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='cogni-event-handler')
+                call = asyncio.get_running_loop().run_in_executor(self._executor, sub.func, evt)
+            await (asyncio.wait_for(call, sub.timeout) if sub.timeout else call)
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            print(f"Event handler {sub.name} timed out after {sub.timeout}s on {evt.type} #{offset}")
+        except Exception:
+            outcome = 'error'
+            traceback.print_exc()
+        finally:
+            sub.stats.record(time.perf_counter() - started, outcome)
+            if sub._semaphore is not None:
+                sub._semaphore.release()
+
+    def _on_call_done(self, task: asyncio.Task, sub: EventSubscription, offset: int,
+                      event_type: str) -> None:
+        self._tasks.discard(task)
+        sub._inflight.discard(offset)
+        if sub._tails.get(event_type) is task:
+            del sub._tails[event_type]
+        self._commit([sub])
+
+    def _push(self, offset: int, evt: EventRecord) -> None:
+        """Hand over an event stored by this process (any thread)."""
+        loop = self._loop_ref
+        if loop is None or loop.is_closed():
+            return
+        with self._inbox_lock:
+            self._inbox[offset] = evt
+        loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _take_local(self, offset: int) -> list[tuple[int, EventRecord]]:
+        """The events handed over by ``_push`` that directly follow *offset*."""
+        events = []
+        with self._inbox_lock:
+            while offset in self._inbox:
+                events.append((offset, self._inbox.pop(offset)))
+                offset += 1
+            # Older ones were already read from the log
+            for stale in [o for o in self._inbox if o < offset]:
+                del self._inbox[stale]
+        return events
+
+    async def _wait(self) -> None:
+        """Sleep until something is stored, or until the next poll is due."""
+        if not self.push:
+            await asyncio.sleep(self._poll_interval)
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.PUSH_FALLBACK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    def _listen(self) -> None:
+        """Register for in-process hand-overs and cross-process wakeups."""
+        self._loop_ref = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._sock = None
+        if not self.push:
+            return
+        _local_dispatchers.add(self)
+        if WakeupChannel.supported():
+            sock = wakeup.listen()
+            try:
+                self._loop_ref.add_reader(sock.fileno(), self._on_wakeup, sock)
+                self._sock = sock
+            except NotImplementedError:
+                # Event loops without add_reader fall back on polling
+                wakeup.close(sock)
+
+    def _on_wakeup(self, sock) -> None:
+        WakeupChannel.drain(sock)
+        self._wakeup.set()
+
+    def _unlisten(self) -> None:
+        _local_dispatchers.discard(self)
+        if self._sock is not None:
+            self._loop_ref.remove_reader(self._sock.fileno())
+            wakeup.close(self._sock)
+            self._sock = None
+        self._loop_ref = None
+        with self._inbox_lock:
+            self._inbox.clear()
+
+    def _read(self, subs: list[EventSubscription]) -> tuple[list, int, int]:
+        """
+        The events the subscriptions still have to handle, as ``(offset, type, payload,
+        record)``, with the range ``[start, end)`` of the log they cover.
+        """
+        start = min((sub.offset for sub in subs), default=self.offset)
+        local = self._take_local(start)
+        if local:
+            return [(off, evt.type, evt.payload, evt) for off, evt in local], start, local[-1][0] + 1
+        # Taken before reading, so that the skipped events are covered too
+        end = event_log().end_offset
+        types = None
+        if all(sub.types is not None for sub in subs):
+            types = set().union(*(sub.types for sub in subs))
+        records = event_log().read(start, types=types)
+        if records:
+            end = max(end, records[-1][0] + 1)
+        return [(off, rec.get('type'), rec.get('payload') or {}, rec) for off, rec in records], start, end
 
     async def _loop(self) -> None:
         from cogni import State
-        State.reset_cache()
-
-
-        while self._running:
+        State.refresh()
+
+        self._listen()
+        try:
+            while self._running:
+                self._wakeup.clear()
+                subs = self._active_subscriptions()
+                try:
+                    # Events of this process come straight from memory, others from the
+                    # tail of the log past the subscription offsets
+                    records, start, end = self._read(subs)
+                except Exception as E:  # pragma: no cover
+                    print(E)
+                    raise
+                for offset, event_type, payload, record in records:
+                    handlers = [sub for sub in subs
+                                if sub.offset <= offset and sub.matches(event_type, payload)]
+                    if not handlers:
+                        continue
+                    evt = EventRecord.from_dict(record) if isinstance(record, dict) else record
+                    if self.concurrent:
+                        while len(self._tasks) >= self.max_pending:
+                            await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                        self._dispatch_concurrently(offset, evt, handlers)
+                    else:
+                        await self._dispatch(evt, handlers)
+
+                    for sub in handlers:
+                        sub.offset = offset + 1
+                    if not self.concurrent:
+                        self._commit(handlers)
+
+                # Every subscription is now past the events it didn't want
+                for sub in subs:
+                    sub.offset = max(sub.offset, end)
+                self._commit(subs)
+                if end > start:
+                    self._save_offset(end)
+                else:
+                    await self._wait()
+        finally:
             try:
-                events = await fetch_new_events(self.last_event)
-            except Exception as E:  # pragma: no cover
-                print(E)
-                raise
-                events = []
-            for evt in events:
-                await self._dispatch(evt)
-
-                self.last_event = evt.timestamp
-
-            await asyncio.sleep(self._poll_interval)
+                # Calls still running complete before we stop
+                if self._tasks:
+                    await asyncio.wait(set(self._tasks))
+                self._commit(self._subscriptions)
+            finally:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+                self._unlisten()
 
     def start(self) -> None:
-        """Kick off the background polling task (idempotent)."""
+        """Kick off the background listening task (idempotent)."""
         if self._task is None or self._task.done():
             self._running = True          # ← moved here, prevents race
             self._task = asyncio.create_task(self._loop())
 
     async def stop(self) -> None:
-        """Stop the polling loop and wait for completion."""
+        """Stop the listening loop and wait for completion."""
         self._running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
         if self._task:
             await self._task              # wait for graceful exit
             self._task = None
 
+    async def replay(self, speed: float | None = None, **criteria) -> int:
+        """
+        Dispatch stored events again to the matching handlers, return how many were replayed.
+
+        *criteria* select the events like ``query_events``. With *speed*, the gaps between
+        events are reproduced, *speed* times faster; without, events follow each other
+        directly. Subscription offsets are left alone.
+        """
+        previous = None
+        replayed = 0
+        for _, evt in query_events(**criteria):
+            if speed and previous is not None and evt.timestamp > previous:
+                await asyncio.sleep((evt.timestamp - previous) / 1000 / speed)
+            previous = evt.timestamp
+            await self._dispatch(evt)
+            replayed += 1
+        return replayed
+
     # ---------------------------------------------------------------------
     # Convenience: emit helper
     # ---------------------------------------------------------------------
-    def emit(self, event_type: str, payload: dict[str, Any]) -> Event:
-        evt = Event(type=event_type, payload=payload)
-        store_event(evt)
-        return evt
+    def emit(self, event_type: str, payload: dict[str, Any]) -> EventRecord:
+        """Queue an event for storage, see ``queue_event``."""
+        evt = EventRecord(event_type, payload)
+        queue_event(evt)
         return evt
+
+    @staticmethod
+    def flush(timeout: float | None = None) -> bool:
+        """Wait until every emitted event is stored, False on timeout."""
+        return flush(timeout)
     
 ES= _ES(0.1)
 
-def on(event, callback=None):
+def on(event, callback=None, where=None):
     def _decorator(func):
         def _inner(event):
             func(event)
             if callback:
                 callback()
-        ES.on(event, _inner)
+        ES.on(event, _inner, where=where, name=f"{func.__module__}.{func.__qualname__}@{event}")
         return _inner
     return _decorator
\ No newline at end of file
@@ -0,0 +1,419 @@
+"""
+Append-only, segmented event log.
+
+Events are JSON lines in segment files named after the offset of their first event::
+
+    <log_dir>/00000000000000000000.log   events 0..n-1
+    <log_dir>/00000000000000000000.idx   one fixed-size entry per event
+    <log_dir>/00000000000000004213.log   next segment, starts at offset 4213
+    ...
+
+An index entry is ``(timestamp, position in the .log, crc32 of the type)``, so an event is
+found by offset in O(1), by timestamp with a binary search, and skipped by type without
+parsing it. Writers append under an ``flock`` and write the index entry after the line, so
+readers never need a lock: whatever the index covers is complete. Old segments are dropped
+as a whole by size/age retention.
+
+``<base>.tags`` is the secondary index used by ``query``: one ``i<TAB>type<TAB>agent`` line
+per event, written after the index entry. Readers turn it into posting lists per type and
+per agent, and parse the log for the events whose line is missing (torn or not written yet).
+"""
+import os
+import json
+import time
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+#: ``(timestamp ms, position, crc32(type))`` of each event, little-endian
+ENTRY = struct.Struct('<QQI')
+
+#: Segment size that triggers rolling to a new segment
+SEGMENT_BYTES = 8 * 1024 * 1024
+#: Total size of the log above which the oldest segments are dropped
+RETENTION_BYTES = 512 * 1024 * 1024
+#: Age above which a closed segment is dropped
+RETENTION_SECONDS = 7 * 24 * 3600
+#: Average distance in bytes between wanted events above which they are read one by one
+SPARSE_GAP = 4096
+
+
+def type_hash(event_type: str) -> int:
+    return zlib.crc32(event_type.encode())
+
+
+def event_agent(event: Dict[str, Any]) -> str:
+    """Name of the agent an event is about: ``payload['agent']`` or ``payload['name']``."""
+    payload = event.get('payload')
+    if not isinstance(payload, dict):
+        return ''
+    agent = payload.get('agent') or payload.get('name')
+    return agent if isinstance(agent, str) else ''
+
+
+def _tag(value: str) -> str:
+    return value.replace('\t', ' ').replace('\n', ' ')
+
+
+class _SegmentTags:
+    """Posting lists of a segment: sorted event numbers by type and by agent."""
+
+    __slots__ = ('read_bytes', 'count', 'types', 'agents')
+
+    def __init__(self):
+        self.read_bytes = 0
+        self.count = 0
+        self.types: Dict[str, array] = {}
+        self.agents: Dict[str, array] = {}
+
+    def add(self, i: int, event_type: str, agent: str) -> None:
+        self.types.setdefault(event_type, array('l')).append(i)
+        if agent:
+            self.agents.setdefault(agent, array('l')).append(i)
+        self.count = i + 1
+
+
+class EventLog:
+    """Offsets are assigned in append order, start at 0 and never go back."""
+
+    def __init__(self, log_dir: str, segment_bytes: int = SEGMENT_BYTES,
+                 retention_bytes: int = RETENTION_BYTES, retention_seconds: float = RETENTION_SECONDS):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        os.makedirs(log_dir, exist_ok=True)
+        self._lock_file = None
+        self._tags: Dict[int, _SegmentTags] = {}
+
+    # -----------------------------------------------------------------
+    # Segments
+    # -----------------------------------------------------------------
+    def _path(self, base: int, ext: str) -> str:
+        return os.path.join(self.log_dir, f"{base:020d}.{ext}")
+
+    def _bases(self) -> List[int]:
+        """Base offsets of the segments, oldest first."""
+        return sorted(int(name[:-4]) for name in os.listdir(self.log_dir)
+                      if name.endswith('.idx') and name[:-4].isdigit())
+
+    def _count(self, base: int) -> int:
+        """Number of events indexed in segment *base* (a torn last entry doesn't count)."""
+        try:
+            return os.path.getsize(self._path(base, 'idx')) // ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self, base: int, start: int = 0) -> bytes:
+        """Raw index entries of segment *base*, from its *start*-th event on."""
+        try:
+            with open(self._path(base, 'idx'), 'rb') as f:
+                f.seek(start * ENTRY.size)
+                data = f.read()
+        except FileNotFoundError:
+            return b''
+        return data[:len(data) - len(data) % ENTRY.size]
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(os.path.join(self.log_dir, 'lock'), 'a')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @property
+    def start_offset(self) -> int:
+        """Offset of the oldest event still retained."""
+        bases = self._bases()
+        return bases[0] if bases else 0
+
+    @property
+    def end_offset(self) -> int:
+        """Offset the next appended event will get."""
+        bases = self._bases()
+        return bases[-1] + self._count(bases[-1]) if bases else 0
+
+    # -----------------------------------------------------------------
+    # Writing
+    # -----------------------------------------------------------------
+    def append(self, event: Dict[str, Any]) -> int:
+        """Append one event (a dict with ``type``, ``payload``, ``timestamp``), return its offset."""
+        return self.append_batch([event])
+
+    def append_batch(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Append *events* in order, return the offset of the first one."""
+        events = list(events)
+        lines = [json.dumps(event, separators=(',', ':')).encode() + b'\n' for event in events]
+        with self._locked():
+            return self._append(events, lines)
+
+    def import_events(self, events: Iterable[Dict[str, Any]]) -> int:
+        """
+        Append *events* if the log has never been written to, return how many were.
+
+        Meant for a one-time import of events kept elsewhere: processes racing to import
+        the same events write them once.
+        """
+        with self._locked():
+            if self.end_offset:
+                return 0
+            events = list(events)
+            if events:
+                self._append(events, [json.dumps(event, separators=(',', ':')).encode() + b'\n'
+                                      for event in events])
+            return len(events)
+
+    def _append(self, events: List[Dict[str, Any]], lines: List[bytes]) -> int:
+        """Append *events*, encoded as *lines*, under the lock; return the offset of the first one."""
+        bases = self._bases()
+        base = bases[-1] if bases else 0
+        count = self._count(base)
+        with open(self._path(base, 'log'), 'ab') as log, open(self._path(base, 'idx'), 'ab') as idx, \
+                open(self._path(base, 'tags'), 'ab') as tags:
+            # Drop a torn index entry left by a crashed writer
+            idx.truncate(count * ENTRY.size)
+            last = self._entries(base, count - 1) if count else b''
+            last_ts = ENTRY.unpack(last)[0] if last else 0
+
+            log.seek(0, os.SEEK_END)
+            position = log.tell()
+            entries = []
+            for event, line in zip(events, lines):
+                # Index timestamps never decrease, so they can be binary searched
+                last_ts = max(last_ts, int(event.get('timestamp') or 0))
+                entries.append(ENTRY.pack(last_ts, position, type_hash(event.get('type', ''))))
+                position += len(line)
+            log.write(b''.join(lines))
+            log.flush()
+            # The index is written last: readers only see complete lines
+            idx.write(b''.join(entries))
+            idx.flush()
+            tags.write(''.join(f"{count + i}\t{_tag(event.get('type', ''))}\t{_tag(event_agent(event))}\n"
+                               for i, event in enumerate(events)).encode())
+
+        first = base + count
+        if position >= self.segment_bytes:
+            self._roll(first + len(lines))
+        return first
+
+    def _roll(self, base: int) -> None:
+        """Start a new segment at *base* and apply retention to the closed ones."""
+        for ext in ('log', 'idx', 'tags'):
+            open(self._path(base, ext), 'ab').close()
+        self.enforce_retention()
+
+    def enforce_retention(self) -> List[int]:
+        """Drop the oldest closed segments beyond the size or age limits, return their bases."""
+        bases = self._bases()
+        sizes = {base: os.path.getsize(self._path(base, 'log')) for base in bases}
+        total = sum(sizes.values())
+        horizon = time.time() - self.retention_seconds
+        dropped = []
+        for base in bases[:-1]:
+            if total <= self.retention_bytes and os.path.getmtime(self._path(base, 'log')) >= horizon:
+                break
+            # Index first: readers discover segments through it
+            os.remove(self._path(base, 'idx'))
+            os.remove(self._path(base, 'log'))
+            try:
+                os.remove(self._path(base, 'tags'))
+            except FileNotFoundError:
+                pass
+            total -= sizes[base]
+            dropped.append(base)
+        return dropped
+
+    # -----------------------------------------------------------------
+    # Reading
+    # -----------------------------------------------------------------
+    def read(self, offset: int = 0, limit: int = None,
+             types: Iterable[str] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Events from *offset* on, as ``(offset, event)`` pairs.
+
+        Args:
+            offset: First offset to return; retained-away offsets are skipped
+            limit: Maximum number of events to return
+            types: Only return events of these types; the others are skipped from the
+                index, without being read or parsed
+        """
+        if types is not None:
+            types = set(types)
+            hashes = {type_hash(t) for t in types}
+        else:
+            hashes = None
+        bases = self._bases()
+        if not bases:
+            return []
+        offset = max(offset, bases[0])
+        result = []
+        for base in bases[bisect_right(bases, offset) - 1:]:
+            start = max(offset - base, 0)
+            entries = self._entries(base, start)
+            if not entries:
+                continue
+            unpacked = list(ENTRY.iter_unpack(entries))
+            wanted = [i for i, entry in enumerate(unpacked) if hashes is None or entry[2] in hashes]
+            if limit is not None:
+                wanted = wanted[:limit - len(result)]
+            for i, event in self._load(base, [(i, unpacked[i][1]) for i in wanted]):
+                if hashes is not None and event.get('type') not in types:
+                    # crc32 collision
+                    continue
+                result.append((base + start + i, event))
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def _load(self, base: int, positions: List[Tuple[int, int]]) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        """Parse the events of segment *base* at *positions*, ``(i, position in the .log)`` pairs in order."""
+        if not positions:
+            return
+        first_position = positions[0][1]
+        with open(self._path(base, 'log'), 'rb') as f:
+            if positions[-1][1] - first_position > SPARSE_GAP * len(positions):
+                # Few events far apart: read their lines only
+                for i, position in positions:
+                    f.seek(position)
+                    yield i, json.loads(f.readline())
+                return
+            f.seek(first_position)
+            data = f.read(positions[-1][1] - first_position) + f.readline()
+        for i, position in positions:
+            position -= first_position
+            line_end = data.index(b'\n', position)
+            yield i, json.loads(data[position:line_end])
+
+    def _positions(self, base: int, wanted: Iterable[int]) -> List[Tuple[int, int]]:
+        entries = self._entries(base)
+        return [(i, ENTRY.unpack_from(entries, i * ENTRY.size)[1]) for i in wanted]
+
+    # -----------------------------------------------------------------
+    # Secondary indexes
+    # -----------------------------------------------------------------
+    def _segment_tags(self, base: int, count: int) -> _SegmentTags:
+        """The posting lists of segment *base*, brought up to its *count* first events."""
+        tags = self._tags.get(base)
+        if tags is None:
+            tags = self._tags[base] = _SegmentTags()
+        if tags.count >= count:
+            return tags
+        try:
+            with open(self._path(base, 'tags'), 'rb') as f:
+                f.seek(tags.read_bytes)
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        data = data[:data.rfind(b'\n') + 1]
+        tags.read_bytes += len(data)
+        for line in data.decode(errors='replace').split('\n')[:-1]:
+            fields = line.split('\t')
+            if len(fields) != 3 or not fields[0].isdigit():
+                # Torn by a crashed writer
+                continue
+            i = int(fields[0])
+            if i < tags.count or i >= count:
+                continue
+            if i > tags.count:
+                self._tag_from_log(base, tags, i)
+            tags.add(i, fields[1], fields[2])
+        if tags.count < count:
+            self._tag_from_log(base, tags, count)
+        return tags
+
+    def _tag_from_log(self, base: int, tags: _SegmentTags, until: int) -> None:
+        """Index the events of segment *base* from ``tags.count`` to *until* by parsing them."""
+        for i, event in self._load(base, self._positions(base, range(tags.count, until))):
+            tags.add(i, _tag(event.get('type', '')), _tag(event_agent(event)))
+
+    def query(self, types: Iterable[str] = None, agents: Iterable[str] = None, start: int = 0,
+              end: int = None, limit: int = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Events of *types* about *agents* (see ``event_agent``), from offset *start* to *end*.
+
+        Only the matching events are read: candidates come from the posting lists of the
+        ``.tags`` files, kept in memory once loaded.
+        """
+        types = None if types is None else {_tag(t) for t in types}
+        agents = None if agents is None else {_tag(a) for a in agents}
+        bases = self._bases()
+        if not bases:
+            return []
+        start = max(start, bases[0])
+        result = []
+        for base in bases[bisect_right(bases, start) - 1:]:
+            if end is not None and base >= end:
+                break
+            count = self._count(base)
+            lo = max(start - base, 0)
+            hi = count if end is None else min(count, end - base)
+            if lo >= hi:
+                continue
+            wanted = None
+            if types is not None or agents is not None:
+                tags = self._segment_tags(base, count)
+                for keys, postings in ((types, tags.types), (agents, tags.agents)):
+                    if keys is None:
+                        continue
+                    matching = set()
+                    for key in keys:
+                        found = postings.get(key)
+                        if found:
+                            matching.update(found[bisect_left(found, lo):bisect_left(found, hi)])
+                    wanted = matching if wanted is None else wanted & matching
+            wanted = range(lo, hi) if wanted is None else sorted(wanted)
+            if limit is not None:
+                wanted = wanted[:limit - len(result)]
+            result.extend((base + i, event) for i, event in self._load(base, self._positions(base, wanted)))
+            if limit is not None and len(result) >= limit:
+                break
+        # Segments dropped by retention
+        for base in [b for b in self._tags if b < bases[0]]:
+            del self._tags[base]
+        return result
+
+    def offset_for_timestamp(self, timestamp: int) -> int:
+        """
+        First offset whose event was logged at or after *timestamp* (ms).
+
+        Segments are skipped by the timestamp of their last entry, and the one holding it is
+        binary searched by reading single entries, so only O(log n) entries are read.
+        """
+        for base in self._bases():
+            try:
+                f = open(self._path(base, 'idx'), 'rb', buffering=0)
+            except FileNotFoundError:
+                # Dropped by retention meanwhile
+                continue
+            with f:
+                count = os.fstat(f.fileno()).st_size // ENTRY.size
+
+                def timestamp_at(i: int) -> int:
+                    f.seek(i * ENTRY.size)
+                    return ENTRY.unpack(f.read(ENTRY.size))[0]
+
+                if not count or timestamp_at(count - 1) < timestamp:
+                    continue
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if timestamp_at(mid) < timestamp:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                return base + lo
+        return self.end_offset
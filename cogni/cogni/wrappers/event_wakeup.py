@@ -0,0 +1,83 @@
+"""
+Cross-process wakeups for event dispatchers.
+
+Each listening dispatcher binds a Unix datagram socket in a shared directory. After storing
+an event, a writer sends one byte to every socket there, so dispatchers in other processes
+wake up right away instead of polling the log. Sockets of dead processes are removed by the
+first writer that fails to reach them.
+"""
+import os
+import socket
+import itertools
+
+_ids = itertools.count()
+
+
+class WakeupChannel:
+    """Wakes up the dispatchers listening on *wake_dir*, in any process."""
+
+    def __init__(self, wake_dir: str):
+        self.wake_dir = wake_dir
+        self._sender = None
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(socket, 'AF_UNIX')
+
+    def listen(self) -> socket.socket:
+        """A non-blocking socket that becomes readable on every ``notify``."""
+        os.makedirs(self.wake_dir, exist_ok=True)
+        path = os.path.join(self.wake_dir, f"{os.getpid()}-{next(_ids)}.sock")
+        if os.path.exists(path):
+            os.remove(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        sock.setblocking(False)
+        return sock
+
+    def close(self, sock: socket.socket) -> None:
+        path = sock.getsockname()
+        sock.close()
+        try:
+            os.remove(path)
+        except (FileNotFoundError, TypeError):
+            pass
+
+    @staticmethod
+    def drain(sock: socket.socket) -> None:
+        """Consume the pending wakeups, they all mean the same thing."""
+        try:
+            while sock.recv(64):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def notify(self) -> None:
+        """Wake every listener of the other processes (local ones are woken directly)."""
+        if not self.supported():
+            return
+        try:
+            names = os.listdir(self.wake_dir)
+        except FileNotFoundError:
+            return
+        prefix = f"{os.getpid()}-"
+        for name in names:
+            if not name.endswith('.sock') or name.startswith(prefix):
+                continue
+            if self._sender is None:
+                self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self._sender.setblocking(False)
+            path = os.path.join(self.wake_dir, name)
+            try:
+                self._sender.sendto(b'!', path)
+            except BlockingIOError:
+                # The listener already has wakeups queued
+                pass
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Its process is gone
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except OSError:
+                pass
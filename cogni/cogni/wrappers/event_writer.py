@@ -0,0 +1,83 @@
+"""
+Background writer for emitted events.
+
+``emit`` only queues the event: a daemon thread drains the queue and stores the events in
+batches, so emitting costs a lock and a deque append instead of a write on the caller's
+path. The queue is FIFO and has a single writer, so events are stored in the order they
+were emitted. When the queue is full, emitters wait for room. ``flush`` waits until
+everything queued so far is stored, and runs at interpreter exit.
+"""
+import os
+import atexit
+import threading
+import traceback
+from collections import deque
+from typing import Any, Callable, List
+
+#: Events queued before emitters have to wait for the writer
+MAX_QUEUE = 10000
+#: Events stored in one write
+MAX_BATCH = 512
+
+
+class EventWriter:
+    """Calls *write* from a background thread with batches of the submitted items, in order."""
+
+    def __init__(self, write: Callable[[List[Any]], Any], max_queue: int = MAX_QUEUE,
+                 max_batch: int = MAX_BATCH):
+        self._write = write
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self._reset()
+        atexit.register(self.flush)
+        if hasattr(os, 'register_at_fork'):
+            # The parent's queue and thread stay with the parent
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._queue = deque()
+        self._cond = threading.Condition()
+        # Queued items plus the batch being written
+        self._pending = 0
+        self._thread = None
+
+    def submit(self, item: Any) -> None:
+        """Queue *item*, waiting for room when the queue is full."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='cogni-event-writer', daemon=True)
+                self._thread.start()
+            while len(self._queue) >= self.max_queue:
+                self._cond.wait()
+            self._queue.append(item)
+            self._pending += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every item submitted so far is written, False on timeout."""
+        with self._cond:
+            if threading.current_thread() is self._thread:
+                return self._pending == len(self._queue) == 0
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+                # Room for waiting emitters
+                self._cond.notify_all()
+            try:
+                self._write(batch)
+            except Exception:
+                # Keep the writer alive for the next events
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._pending -= len(batch)
+                    self._cond.notify_all()
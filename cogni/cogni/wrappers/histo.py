@@ -0,0 +1,103 @@
+"""
+Append-only history of an agent, in its ``prompts/.histo/<name>.conv`` file.
+
+A History keeps the last messages of the file in memory, appends new messages at the
+end of the file, and reads only the window it is asked for. It stats the file before
+using its cache, so appends from other processes (or edits of the file) are seen.
+"""
+import os
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from ..entities import Conversation, Message
+from ..entities import conv_file
+
+#: Messages kept in memory per history
+CACHE_SIZE = 64
+
+
+class History:
+    """The history file of an agent, with its last messages cached."""
+
+    _instances: Dict[str, 'History'] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def for_path(cls, path: str) -> 'History':
+        """The History of path, shared by the agents writing there."""
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._tail: deque = deque(maxlen=cache_size)
+        # True while the tail holds every message of the file
+        self._complete = True
+        self._stat: Optional[Tuple[int, int, int]] = None
+
+    def _file_stat(self) -> Tuple[int, int, int]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return (0, 0, 0)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _refresh(self) -> None:
+        """Reloads the tail when the file changed since we last read or wrote it."""
+        stat = self._file_stat()
+        if stat == self._stat:
+            return
+        msgs = conv_file.read_last(self.path, self._tail.maxlen + 1) if stat[1] else []
+        self._complete = len(msgs) <= self._tail.maxlen
+        self._tail.clear()
+        self._tail.extend(msgs)
+        self._stat = stat
+
+    def last(self) -> Optional[Message]:
+        """The last message, or None when the history is empty."""
+        with self._lock:
+            self._refresh()
+            return self._tail[-1] if self._tail else None
+
+    def window(self, k: int) -> Conversation:
+        """The last k messages."""
+        with self._lock:
+            self._refresh()
+            if k <= 0:
+                return Conversation([])
+            if k <= len(self._tail) or self._complete:
+                return Conversation(list(self._tail)[-k:])
+        return Conversation.from_file(self.path, last=k)
+
+    def read(self) -> Conversation:
+        """The whole history."""
+        with self._lock:
+            self._refresh()
+            if self._complete:
+                return Conversation(list(self._tail))
+        return Conversation.from_file(self.path)
+
+    def append(self, msg: Message) -> bool:
+        """
+        Appends msg at the end of the file, unless it repeats the last message.
+        :return: False when the message was a repeat.
+        """
+        with self._lock:
+            self._refresh()
+            if self._tail and self._tail[-1] == msg:
+                return False
+            size = conv_file.append_messages(self.path, [msg])
+            if self._stat is not None and size != self._stat[1]:
+                # Someone else wrote in between, the tail is reloaded on next use
+                self._stat = None
+                return True
+            if len(self._tail) == self._tail.maxlen:
+                self._complete = False
+            self._tail.append(msg)
+            self._stat = self._file_stat()
+            return True
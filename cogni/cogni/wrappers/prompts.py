@@ -0,0 +1,87 @@
+"""
+Index of the ``prompts/<name>.conv`` files of a project.
+
+The project tree is walked once (skipping hidden directories, as the ``**`` glob it
+replaces did) and every ``.conv`` directly in a ``prompts`` directory is indexed by name.
+Parsed prompts are cached with the mtime of their file, which is checked again at most
+every CHECK_INTERVAL seconds, so a lookup is a dict hit and edited prompts are reloaded.
+A name missing from the index triggers a new walk, for prompt files added later.
+"""
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ..entities import Conversation
+
+#: Seconds between two mtime checks of a cached prompt file
+CHECK_INTERVAL = 1.0
+
+
+class _Prompts:
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        # root -> name -> paths, in walk order
+        self._index: Dict[str, Dict[str, List[str]]] = {}
+        # path -> (mtime_ns, frozen conversation, monotonic time of the last check)
+        self._cache: Dict[str, Tuple[int, Conversation, float]] = {}
+
+    @staticmethod
+    def _scan(root: str) -> Dict[str, List[str]]:
+        index: Dict[str, List[str]] = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            if os.path.basename(dirpath) != 'prompts':
+                continue
+            for filename in filenames:
+                if filename.endswith('.conv') and not filename.startswith('.'):
+                    index.setdefault(filename[:-len('.conv')], []).append(
+                        os.path.join(dirpath, filename))
+        return index
+
+    def path(self, name: str, root: Optional[str] = None) -> str:
+        """The path of prompts/<name>.conv under root (the working directory by default)."""
+        root = root or os.getcwd()
+        with self._lock:
+            index = self._index.get(root)
+            if index is None or name not in index:
+                index = self._index[root] = self._scan(root)
+        if name not in index:
+            raise FileNotFoundError(f"Did not find {name}.conv")
+        return index[name][0]
+
+    def get(self, name: str, root: Optional[str] = None) -> Tuple[str, Conversation]:
+        """
+        The path and the parsed prompt <name>.conv, from the cache while its file is unchanged.
+        The conversation is a new view of the cached one, its flags can be changed, and
+        adding to it copies the messages instead of growing the cached ones.
+        """
+        path = self.path(name, root)
+        now = time.monotonic()
+        cached = self._cache.get(path)
+        if cached is not None and now - cached[2] < self.check_interval:
+            return path, cached[1][:]
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            # Moved or deleted: forget the index of this root and look again
+            with self._lock:
+                self._index.pop(root or os.getcwd(), None)
+                self._cache.pop(path, None)
+            return self.get(name, root)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, Conversation.from_file(path).frozen(), now)
+        else:
+            cached = (mtime, cached[1], now)
+        self._cache[path] = cached
+        return path, cached[1][:]
+
+    def invalidate(self) -> None:
+        """Forgets the indexes and the parsed prompts."""
+        with self._lock:
+            self._index.clear()
+            self._cache.clear()
+
+
+Prompts = _Prompts()
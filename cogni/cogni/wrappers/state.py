@@ -1,71 +1,200 @@
 import os
-import json
-import shutil
-import re
-from typing import Any, Dict, List, Union
+import sys
+import time
+import atexit
+import functools
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Tuple, Union
 
+from .state_backends import StateBackend, make_backend, safe_path_component
+from .state_snapshot import StateSnapshot, write_snapshot
 
-def safe_path_component(component: str) -> str:
-    """Convert a string to a safe path component by replacing unsafe characters."""
-    # Replace characters that might be problematic in file paths
-    safe = re.sub(r'[\\/*?:"<>|]', '_', component)
-    return safe
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads of the same process
+    fcntl = None
 
 
-class StateDict:
-    """A wrapper for dictionaries that provides attribute-style access and automatic persistence"""
+#: Durability modes accepted by ``_State.configure``.
+#: - ``sync``: every mutation hits the file system right away (default).
+#: - ``batched``: mutations collect in a dirty set, flushed on size/time thresholds.
+#: - ``async``: like ``batched`` but a background thread does the flushing.
+DURABILITY_MODES = ('sync', 'batched', 'async')
 
-    def __init__(self, data: Dict = None, parent: '_State' = None, state_name: str = None, path: List[str] = None):
-        self._data = {}
+#: ``StateChange.op`` of the bulk mutations, whose value is relative to the previous content
+BULK_OPS = ('extend', 'update', 'truncate')
+
+
+def _synchronized(method):
+    """Run a mutation of a node under the lock of its state, see ``_State._guard``."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._locked():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class _StateNode:
+    """
+    Lazy-loading plumbing shared by StateDict and StateList.
+
+    Nodes are slotted and do not store their path: each one keeps a link to the container
+    holding it (``_owner``) and its key in there, and ``_path`` is rebuilt on demand. Dict
+    keys are interned, list items keep their int index, so large trees of small records
+    don't pay for a copied path list and a fresh key string per node.
+    """
+    __slots__ = ('_data', '_parent', '_state_name', '_owner', '_key', '__weakref__')
+
+    def _attach(self, parent: '_State', state_name: str, owner: '_StateNode', key) -> None:
         self._parent = parent
         self._state_name = state_name
-        self._path = path or []
+        self._owner = owner
+        self._key = sys.intern(key) if type(key) is str else key
+
+    @property
+    def _path(self) -> List[str]:
+        """Keys from the state root down to this node."""
+        path = []
+        node = self
+        while node._owner is not None:
+            path.append(str(node._key))
+            node = node._owner
+        path.reverse()
+        return path
+
+    @classmethod
+    def _lazy(cls, parent: '_State', state_name: str, owner: '_StateNode' = None, key=None):
+        """A node whose children are only read from storage when first touched."""
+        node = cls.__new__(cls)
+        node._data = None
+        node._attach(parent, state_name, owner, key)
+        return node
+
+    def _child(self, key, value) -> Any:
+        """Wrap *value* stored under *key* of this node, persisting it unless muted."""
+        if isinstance(value, dict):
+            return StateDict(value, self._parent, self._state_name, self, key)
+        if isinstance(value, list):
+            return StateList(value, self._parent, self._state_name, self, key)
+        if self._parent and self._state_name:
+            self._parent._write_val(self._state_name, self._path + [str(key)], value)
+        return value
+
+    def _locked(self, process: bool = False):
+        """Lock of the state this node belongs to, see ``_State._guard``."""
+        if self._parent and self._state_name:
+            return self._parent._guard(self._state_name, process)
+        return nullcontext()
+
+    def _current(self, key) -> Any:
+        """Plain value under *key*, re-read from storage if another process wrote the state."""
+        parent = self._parent
+        if parent and self._state_name and parent._durability == 'sync' and parent._is_stale(self._state_name):
+            path = self._path + [str(key)]
+            with parent._muted():
+                if parent._backend.stat(self._state_name, path) is None:
+                    if isinstance(self._data, dict):
+                        self._data.pop(key, None)
+                    return None
+                if isinstance(self._data, list) and key >= len(self._data):
+                    # Appended by another process: the slots before it read as None until loaded
+                    self._data.extend([None] * (key + 1 - len(self._data)))
+                self._data[key] = self._child(key, parent._load_subtree(self._state_name, path))
+        if isinstance(self._data, dict) and key not in self._data:
+            return None
+        if isinstance(self._data, list) and not 0 <= key < len(self._data):
+            return None
+        value = self._data[key]
+        return value.to_dict() if isinstance(value, _StateNode) else value
+
+    def compare_and_set(self, key, expected: Any, value: Any) -> bool:
+        """
+        Set ``self[key] = value`` only if the current value equals *expected* (None if missing).
+        A list index past the end is missing, the list is extended with None up to it if set.
+
+        The check and the write are atomic between threads and, with ``sync`` durability,
+        between processes sharing the states directory.
+
+        Returns:
+            True if the value was set
+        """
+        with self._locked(process=True):
+            self._ensure_loaded()
+            if isinstance(self._data, list) and key < 0:
+                key += len(self._data)
+                if key < 0:
+                    return False
+            if self._current(key) != expected:
+                return False
+            if isinstance(self._data, list) and key >= len(self._data):
+                self._data.extend([None] * (key + 1 - len(self._data)))
+            self[key] = value
+            return True
+
+    def _bulk(self):
+        """Context in which mutations are persisted in one write and notify nothing."""
+        if self._parent and self._state_name:
+            return self._parent._batch()
+        return nullcontext()
+
+    def _notify(self, path: List[str], op: str, value: Any = None) -> None:
+        if self._parent and self._state_name:
+            self._parent._notify_change(self._state_name, path, op, value)
+
+    def _ensure_loaded(self) -> None:
+        if self._data is None:
+            self._parent._load_node(self)
+        elif self._parent is not None and self._parent._lru is not None:
+            self._parent._touch(self)
+
+    def _unload(self) -> None:
+        """Drop the children from memory, they are reloaded on next access."""
+        # Child containers still referenced elsewhere must come back as the same objects,
+        # see ``_State._lazy_node``. The owner's id is stable: live children keep it alive.
+        nodes = self._parent._nodes.setdefault(self._state_name, weakref.WeakValueDictionary())
+        for key, child in (self._data.items() if isinstance(self._data, dict) else enumerate(self._data)):
+            if isinstance(child, _StateNode):
+                nodes[id(self), key] = child
+        self._data = None
+
+
+class StateDict(_StateNode):
+    """A wrapper for dictionaries that provides attribute-style access and automatic persistence"""
+    __slots__ = ()
+
+    def __init__(self, data: Dict = None, parent: '_State' = None, state_name: str = None,
+                 owner: _StateNode = None, key: str = None):
+        self._data = {}
+        self._attach(parent, state_name, owner, key)
         
         # Create this directory first
         if self._parent and self._state_name:
-            dir_path = self._get_dir_path()
-            os.makedirs(dir_path, exist_ok=True)
-            
-            # Write type file
-            type_file = os.path.join(dir_path, '__type.json')
-            with open(type_file, 'w') as f:
-                json.dump({"type": "dict"}, f)
+            self._parent._write_type(self._state_name, self._path, "dict")
         
         # Then process data
         if data:
             for k, v in data.items():
-                if isinstance(v, dict):
-                    self._data[k] = StateDict(v, parent, state_name, self._path + [k])
-                elif isinstance(v, list):
-                    self._data[k] = StateList(v, parent, state_name, self._path + [k])
-                else:
-                    self._data[k] = v
-                    # Persist scalar values immediately
-                    if self._parent and self._state_name:
-                        key_dir = os.path.join(self._get_dir_path(), safe_path_component(k))
-                        os.makedirs(key_dir, exist_ok=True)
-                        val_file = os.path.join(key_dir, 'val.json')
-                        with open(val_file, 'w') as f:
-                            json.dump(v, f)
+                if type(k) is str:
+                    k = sys.intern(k)
+                # Scalar values are persisted immediately, containers persist themselves
+                self._data[k] = self._child(k, v)
 
     def __len__(self):
+        self._ensure_loaded()
         return len(self._data)
 
     def _persist(self):
         """Save this StateDict to the file system."""
+        self._ensure_loaded()
         if not (self._parent and self._state_name):
             return
             
-        # Get the directory path for this StateDict
-        dir_path = self._get_dir_path()
-        
-        # Create the directory if it doesn't exist
-        os.makedirs(dir_path, exist_ok=True)
-        
         # Write the type file indicating this is a dictionary
-        type_file_path = os.path.join(dir_path, '__type.json')
-        with open(type_file_path, 'w') as f:
-            json.dump({"type": "dict"}, f)
+        path = self._path
+        self._parent._write_type(self._state_name, path, "dict")
         
         # Persist each value (nested objects will persist themselves)
         for k, v in self._data.items():
@@ -73,28 +202,15 @@ class StateDict:
             if isinstance(v, (StateDict, StateList)):
                 continue
                 
-            # For scalar values, create a directory and value file
-            key_dir = os.path.join(dir_path, safe_path_component(k))
-            os.makedirs(key_dir, exist_ok=True)
-            
-            val_file = os.path.join(key_dir, 'val.json')
-            with open(val_file, 'w') as f:
-                json.dump(v, f)
+            # For scalar values, write the value file
+            self._parent._write_val(self._state_name, path + [k], v)
 
     def _get_dir_path(self) -> str:
         """Get the directory path for this StateDict."""
         if not self._parent or not self._state_name:
             return None
         
-        # Start with the states directory
-        dir_path = self._parent._states_dir
-        
-        # Build path from state name and additional path components
-        components = [self._state_name] + self._path
-        for component in components:
-            dir_path = os.path.join(dir_path, safe_path_component(str(component)))
-        
-        return dir_path
+        return self._parent._node_dir(self._state_name, self._path)
     def setdefault(self, key, value):
         if not key in self:
             self[key] = value
@@ -102,6 +218,9 @@ class StateDict:
             
             
     def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._ensure_loaded()
         if name in self._data:
             return self._data[name]
         raise AttributeError(f"'StateDict' object has no attribute '{name}'")
@@ -110,98 +229,99 @@ class StateDict:
         if name.startswith('_'):
             super().__setattr__(name, value)
             return
-        
-        # If we're setting a dict on an existing StateDict, merge them instead of replacing
-        if isinstance(value, dict) and name in self._data and isinstance(self._data[name], StateDict):
-            # Get the existing StateDict
-            existing_dict = self._data[name]
-            
-            # Update it with new values
-            for k, v in value.items():
-                existing_dict[k] = v
-        else:
-            # Standard behavior for non-dictionary values or new keys
-            if isinstance(value, dict):
-                self._data[name] = StateDict(value, self._parent, self._state_name, self._path + [name])
-            elif isinstance(value, list):
-                self._data[name] = StateList(value, self._parent, self._state_name, self._path + [name])
-            else:
-                # For scalar values, update the value in memory
-                self._data[name] = value
-                
-                # Update the value file
-                if self._parent and self._state_name:
-                    key_dir = os.path.join(self._get_dir_path(), safe_path_component(name))
-                    os.makedirs(key_dir, exist_ok=True)
-                    val_file = os.path.join(key_dir, 'val.json')
-                    with open(val_file, 'w') as f:
-                        json.dump(value, f)
-        
-        # Notify parent of changes
-        if self._parent and self._state_name:
-            self._parent._notify_change(self._state_name)
+        self[name] = value
 
     def __getitem__(self, key: str) -> Any:
+        self._ensure_loaded()
         if key not in self._data:
-            self._data[key] = StateDict({}, self._parent, self._state_name, self._path + [key])
+            self._data[key] = StateDict({}, self._parent, self._state_name, self, key)
             # The new StateDict will persist itself
         return self._data[key]
 
+    @_synchronized
     def __setitem__(self, key: str, value: Any) -> None:
+        self._ensure_loaded()
         # If we're setting a dict on an existing StateDict, merge them instead of replacing
         if isinstance(value, dict) and key in self._data and isinstance(self._data[key], StateDict):
             # Get the existing StateDict
             existing_dict = self._data[key]
             
-            # Update it with new values
+            # Update it with new values (each one notifies its own change)
             for k, v in value.items():
                 existing_dict[k] = v
-        else:
-            # Standard behavior for non-dictionary values or new keys
-            if isinstance(value, dict):
-                self._data[key] = StateDict(value, self._parent, self._state_name, self._path + [key])
-            elif isinstance(value, list):
-                self._data[key] = StateList(value, self._parent, self._state_name, self._path + [key])
-            else:
-                # For scalar values, update the value in memory
-                self._data[key] = value
-                
-                # Create directory and update value file
-                if self._parent and self._state_name:
-                    key_dir = os.path.join(self._get_dir_path(), safe_path_component(key))
-                    os.makedirs(key_dir, exist_ok=True)
-                    val_file = os.path.join(key_dir, 'val.json')
-                    with open(val_file, 'w') as f:
-                        json.dump(value, f)
+            return
+
+        # Standard behavior for non-dictionary values or new keys
+        if type(key) is str:
+            key = sys.intern(key)
+        # A whole subtree is persisted in one write
+        with self._bulk():
+            self._data[key] = self._child(key, value)
         
         # Notify parent of changes
         if self._parent and self._state_name:
-            self._parent._notify_change(self._state_name)
+            self._parent._notify_change(self._state_name, self._path + [key], 'set', value)
 
     def __contains__(self, key: str) -> bool:
+        self._ensure_loaded()
         return key in self._data
 
+    @_synchronized
     def __delitem__(self, key: str) -> None:
+        self._ensure_loaded()
         if key in self._data:
             # Remove from memory
             del self._data[key]
             
             # Remove from file system
             if self._parent and self._state_name:
-                key_dir = os.path.join(self._get_dir_path(), safe_path_component(key))
-                if os.path.exists(key_dir):
-                    shutil.rmtree(key_dir)
+                self._parent._remove(self._state_name, self._path + [key])
             
             # Notify parent of changes
             if self._parent and self._state_name:
-                self._parent._notify_change(self._state_name)
+                self._parent._notify_change(self._state_name, self._path + [key], 'delete')
         else:
             raise KeyError(key)
 
     def get(self, item, default=None):
+        self._ensure_loaded()
         return self._data[item] if item in self._data else default
 
+    @_synchronized
+    def update(self, other: Mapping = (), **kwargs) -> None:
+        """
+        Set several keys at once, like ``dict.update`` (nested dicts are merged as with ``[]``).
+
+        Everything is persisted in one backend write and subscribers get a single
+        ``'update'`` change carrying the mapping.
+        """
+        items = dict(other, **kwargs)
+        if not items:
+            return
+        self._ensure_loaded()
+        with self._bulk():
+            for k, v in items.items():
+                self[k] = v
+        self._notify(self._path, 'update', items)
+
+    @_synchronized
+    def replace_all(self, data: Mapping) -> None:
+        """Replace the whole content with *data*, in one write and one ``'set'`` change."""
+        data = dict(data)
+        self._ensure_loaded()
+        with self._bulk():
+            if self._parent and self._state_name:
+                self._parent._remove(self._state_name, self._path)
+                self._parent._write_type(self._state_name, self._path, "dict")
+            self._data = {}
+            for k, v in data.items():
+                if type(k) is str:
+                    k = sys.intern(k)
+                self._data[k] = self._child(k, v)
+        self._notify(self._path, 'set', data)
+
     def to_dict(self) -> Dict:
+        self._ensure_loaded()
         result = {}
         for k, v in self._data.items():
             if isinstance(v, (StateDict, StateList)):
@@ -224,63 +344,42 @@ class StateDict:
         return False
 
     def items(self):
+        self._ensure_loaded()
         return self._data.items()
 
     def keys(self):
+        self._ensure_loaded()
         return self._data.keys()
 
 
-class StateList:
+class StateList(_StateNode):
     """A wrapper for lists that provides automatic persistence"""
+    __slots__ = ()
 
-    def __init__(self, data: List = None, parent: '_State' = None, state_name: str = None, path: List[str] = None):
+    def __init__(self, data: List = None, parent: '_State' = None, state_name: str = None,
+                 owner: _StateNode = None, key: str = None):
         self._data = []
-        self._parent = parent
-        self._state_name = state_name
-        self._path = path or []
+        self._attach(parent, state_name, owner, key)
         
         # Create this directory first
         if self._parent and self._state_name:
-            dir_path = self._get_dir_path()
-            os.makedirs(dir_path, exist_ok=True)
-            
-            # Write type file
-            type_file = os.path.join(dir_path, '__type.json')
-            with open(type_file, 'w') as f:
-                json.dump({"type": "list"}, f)
+            self._parent._write_type(self._state_name, self._path, "list")
         
         # Then process data
         if data:
             for i, item in enumerate(data):
-                if isinstance(item, dict):
-                    self._data.append(StateDict(item, parent, state_name, self._path + [str(i)]))
-                elif isinstance(item, list):
-                    self._data.append(StateList(item, parent, state_name, self._path + [str(i)]))
-                else:
-                    self._data.append(item)
-                    # Persist scalar values immediately
-                    if self._parent and self._state_name:
-                        idx_dir = os.path.join(self._get_dir_path(), str(i))
-                        os.makedirs(idx_dir, exist_ok=True)
-                        val_file = os.path.join(idx_dir, 'val.json')
-                        with open(val_file, 'w') as f:
-                            json.dump(item, f)
+                # Scalar values are persisted immediately, containers persist themselves
+                self._data.append(self._child(i, item))
 
     def _persist(self):
         """Save this StateList to the file system."""
+        self._ensure_loaded()
         if not (self._parent and self._state_name):
             return
             
-        # Get the directory path for this StateList
-        dir_path = self._get_dir_path()
-        
-        # Create the directory if it doesn't exist
-        os.makedirs(dir_path, exist_ok=True)
-        
         # Write the type file indicating this is a list
-        type_file_path = os.path.join(dir_path, '__type.json')
-        with open(type_file_path, 'w') as f:
-            json.dump({"type": "list"}, f)
+        path = self._path
+        self._parent._write_type(self._state_name, path, "list")
         
         # Persist each value (nested objects will persist themselves)
         for i, v in enumerate(self._data):
@@ -288,91 +387,129 @@ class StateList:
             if isinstance(v, (StateDict, StateList)):
                 continue
                 
-            # For scalar values, create a directory and value file
-            idx_dir = os.path.join(dir_path, str(i))
-            os.makedirs(idx_dir, exist_ok=True)
-            
-            val_file = os.path.join(idx_dir, 'val.json')
-            with open(val_file, 'w') as f:
-                json.dump(v, f)
+            # For scalar values, write the value file
+            self._parent._write_val(self._state_name, path + [str(i)], v)
 
     def _get_dir_path(self) -> str:
         """Get the directory path for this StateList."""
         if not self._parent or not self._state_name:
             return None
         
-        # Start with the states directory
-        dir_path = self._parent._states_dir
-        
-        # Build path from state name and additional path components
-        components = [self._state_name] + self._path
-        for component in components:
-            dir_path = os.path.join(dir_path, safe_path_component(str(component)))
-        
-        return dir_path
+        return self._parent._node_dir(self._state_name, self._path)
 
     def __getitem__(self, idx: int) -> Any:
+        self._ensure_loaded()
         return self._data[idx]
 
+    @_synchronized
     def __setitem__(self, idx: int, value: Any) -> None:
-        if isinstance(value, dict):
-            self._data[idx] = StateDict(value, self._parent, self._state_name, self._path + [str(idx)])
-        elif isinstance(value, list):
-            self._data[idx] = StateList(value, self._parent, self._state_name, self._path + [str(idx)])
-        else:
-            # For scalar values, update the value in memory
-            self._data[idx] = value
-            
-            # Create directory and update value file
-            if self._parent and self._state_name:
-                idx_dir = os.path.join(self._get_dir_path(), str(idx))
-                os.makedirs(idx_dir, exist_ok=True)
-                val_file = os.path.join(idx_dir, 'val.json')
-                with open(val_file, 'w') as f:
-                    json.dump(value, f)
+        self._ensure_loaded()
+        if idx < 0:
+            idx += len(self._data)
+        with self._bulk():
+            self._data[idx] = self._child(idx, value)
         
         # Notify parent of changes
         if self._parent and self._state_name:
-            self._parent._notify_change(self._state_name)
+            self._parent._notify_change(self._state_name, self._path + [str(idx)], 'set', value)
 
     def __contains__(self, value: Any) -> bool:
+        self._ensure_loaded()
         return value in self._data
 
     def __len__(self) -> int:
+        self._ensure_loaded()
         return len(self._data)
 
-    def append(self, value: Any) -> None:
-        idx = len(self._data)
-        if isinstance(value, dict):
-            self._data.append(StateDict(value, self._parent, self._state_name, self._path + [str(idx)]))
-        elif isinstance(value, list):
-            self._data.append(StateList(value, self._parent, self._state_name, self._path + [str(idx)]))
-        else:
-            # For scalar values, update the value in memory
-            self._data.append(value)
-            
-            # Create directory and update value file
+    def append(self, value: Any) -> int:
+        """
+        Append *value* and return its index.
+
+        Appends are atomic between threads and, with ``sync`` durability, between processes:
+        concurrent writers never get the same index.
+        """
+        with self._locked(process=True):
+            self._ensure_loaded()
+            idx = len(self._data)
             if self._parent and self._state_name:
-                idx_dir = os.path.join(self._get_dir_path(), str(idx))
-                os.makedirs(idx_dir, exist_ok=True)
-                val_file = os.path.join(idx_dir, 'val.json')
-                with open(val_file, 'w') as f:
-                    json.dump(value, f)
+                # The storage knows better when someone else appended meanwhile
+                idx = self._parent._append_slot(self._state_name, self._path, idx)
+                if idx != len(self._data):
+                    self._reload(idx)
+            with self._bulk():
+                self._data.append(self._child(idx, value))
         
         # Notify parent of changes
         if self._parent and self._state_name:
-            self._parent._notify_change(self._state_name)
-        
-    def extend(self, stuff):
-        for st in stuff:
-            self.append(st)
+            self._parent._notify_change(self._state_name, self._path + [str(idx)], 'append', value)
+        return idx
+
+    def extend(self, items: Iterable) -> None:
+        """
+        Append every item of *items*.
+
+        Everything is persisted in one backend write and subscribers get a single
+        ``'extend'`` change, at the path of the list, carrying the new items.
+        """
+        items = list(items)
+        if not items:
+            return
+        with self._locked(process=True):
+            self._ensure_loaded()
+            idx = len(self._data)
+            if self._parent and self._state_name:
+                # Reserve all the indices at once
+                idx = self._parent._append_slot(self._state_name, self._path, idx, len(items))
+                if idx != len(self._data):
+                    self._reload(idx)
+            with self._bulk():
+                self._data.extend(self._child(idx + i, item) for i, item in enumerate(items))
+        self._notify(self._path, 'extend', items)
+
+    @_synchronized
+    def replace_all(self, items: Iterable) -> None:
+        """Replace the whole content with *items*, in one write and one ``'set'`` change."""
+        items = list(items)
+        self._ensure_loaded()
+        with self._bulk():
+            if self._parent and self._state_name:
+                self._parent._remove(self._state_name, self._path)
+                self._parent._write_type(self._state_name, self._path, "list")
+            self._data = [self._child(i, item) for i, item in enumerate(items)]
+        self._notify(self._path, 'set', items)
+
+    @_synchronized
+    def truncate(self, length: int = 0) -> None:
+        """Drop the items from index *length* on, with one ``'truncate'`` change carrying *length*."""
+        self._ensure_loaded()
+        if length >= len(self._data):
+            return
+        with self._bulk():
+            if self._parent and self._state_name:
+                path = self._path
+                for i in range(length, len(self._data)):
+                    self._parent._remove(self._state_name, path + [str(i)])
+            del self._data[length:]
+        self._notify(self._path, 'truncate', length)
+
+    def _reload(self, length: int) -> None:
+        """Catch up with items other processes appended, up to *length*."""
+        self._ensure_loaded()
+        path = self._path
+        with self._parent._muted():
+            for i in range(len(self._data), length):
+                # Slots still reserved by their writer read back as None
+                item = self._parent._load_subtree(self._state_name, path + [str(i)])
+                self._data.append(self._child(i, item))
 
     def to_dict(self) -> List:
+        self._ensure_loaded()
         result = []
         for item in self._data:
             if isinstance(item, (StateDict, StateList)):
                 result.append(item.to_dict())
-            else:
+            elif item is not None:
+                # None items only hold the index of the next ones, as when loading
                 result.append(item)
         return result
 
@@ -390,126 +527,581 @@ class StateList:
         return False
 
 
+def split_path(path: Union[str, List, Tuple]) -> Tuple[str, ...]:
+    """Normalize ``'exec/logs'`` or ``['exec', 'logs']`` to ``('exec', 'logs')``."""
+    if isinstance(path, str):
+        return tuple(p for p in path.split('/') if p)
+    return tuple(str(p) for p in path)
+
+
+class StateChange(NamedTuple):
+    """A single mutation of a state, as delivered to subscribers."""
+    state_name: str
+    path: Tuple[str, ...]
+    op: str             # 'set', 'append', 'delete', or bulk 'extend', 'update', 'truncate'
+    value: Any = None
+
+
+class StateSubscription:
+    """A callback registered with ``State.subscribe``."""
+
+    def __init__(self, owner: '_State', callback: Callable, prefix: Tuple[str, ...],
+                 snapshot: bool, coalesce: float):
+        self._owner = owner
+        self.callback = callback
+        self.prefix = prefix
+        self.snapshot = snapshot
+        self.coalesce = coalesce
+        self._pending: Dict[Tuple, StateChange] = {}
+        self._pending_since = None
+        self._seq = 0
+
+    def matches(self, state_name: str, path: Tuple[str, ...]) -> bool:
+        """True if a change at *path* touches the watched prefix (above or below it)."""
+        full = (state_name,) + path
+        depth = min(len(full), len(self.prefix))
+        return full[:depth] == self.prefix[:depth]
+
+    def deliver(self, change: StateChange) -> None:
+        if self.snapshot:
+            state = self._owner._cache.get(change.state_name)
+            if state is not None:
+                self.callback(change.state_name, state.to_dict() if hasattr(state, 'to_dict') else state)
+        elif self.coalesce is None:
+            self.callback(change)
+        else:
+            if change.op == 'delete':
+                # Pending changes below a deleted node are moot
+                depth = len(change.path)
+                for key in [k for k in self._pending
+                            if k[0] == change.state_name and k[1][:depth] == change.path]:
+                    del self._pending[key]
+            key = (change.state_name, change.path)
+            if change.op in BULK_OPS:
+                # Relative to what came before: keep every one of them, in order
+                self._seq += 1
+                key += (self._seq,)
+            self._pending.pop(key, None)
+            self._pending[key] = change
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if time.monotonic() - self._pending_since >= self.coalesce:
+                self.drain()
+
+    def drain(self) -> None:
+        """Hand every pending coalesced change to the callback, in one call."""
+        if not self._pending:
+            return
+        changes = list(self._pending.values())
+        self._pending = {}
+        self._pending_since = None
+        self.callback(changes)
+
+    def unsubscribe(self) -> None:
+        self.drain()
+        if self in self._owner._subscribers:
+            self._owner._subscribers.remove(self)
+
+
 class _State:
-    def __init__(self):
+    def __init__(self, states_dir: str = './.states', durability: str = None,
+                 batch_size: int = 256, flush_interval: float = 1.0,
+                 backend: Union[str, StateBackend] = None, cache_size: int = 4096):
         import os
         suffixe = os.getenv('COGNI_STATE_SUFFIX')
         
-        self._states_dir = f'./.states'
+        self._states_dir = states_dir
         self._cache = {}
-        self._callbacks = []
+        # Backend version of each cached state when it was loaded or last written by us
+        self._versions = {}
+        self._subscribers: List[StateSubscription] = []
         os.makedirs(self._states_dir, exist_ok=True)
+        self._backend = make_backend(backend or os.getenv('COGNI_STATE_BACKEND', 'directory'), states_dir)
+
+        # Lazily loaded containers: a bounded LRU of loaded ones, and the live children of
+        # unloaded ones keyed by (id(owner), key)
+        self._nodes: Dict[str, weakref.WeakValueDictionary] = {}
+        self._cache_size = cache_size
+        self._lru = OrderedDict() if self._backend.lazy else None
+
+        # Write-back buffer: (state_name, path, op kind) -> pending op
+        self._dirty: Dict[Tuple, Tuple] = {}
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flusher = None
+        self._flusher_wakeup = threading.Event()
+        self._durability = 'sync'
+        self._local = threading.local()
+
+        # Per-state locks: an RLock between threads, a lock file between processes
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock_files: Dict[str, Any] = {}
+
+        # States republished for ``snapshot`` readers after they change, see ``configure``
+        self._published = set()
+        self._publish_pending = set()
+        self._publish_interval = 1.0
+        self._publisher = None
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self.configure(durability=durability or os.getenv('COGNI_STATE_DURABILITY', 'sync'))
+        atexit.register(self.flush)
+
+    def configure(self, durability: str = None, batch_size: int = None, flush_interval: float = None,
+                  backend: Union[str, StateBackend] = None, cache_size: int = None,
+                  publish: List[str] = None, publish_interval: float = None) -> None:
+        """
+        Tune how mutations are persisted.
+
+        Args:
+            durability: One of ``sync``, ``batched`` or ``async`` (see ``DURABILITY_MODES``)
+            batch_size: Number of pending writes that triggers a flush
+            flush_interval: Maximum age in seconds of a pending write before it is flushed
+            backend: Storage backend name (``directory``, ``snapshot``, ``sqlite``) or instance
+            cache_size: Maximum number of lazily loaded containers kept in memory
+            publish: States to republish for ``snapshot`` readers whenever they change
+            publish_interval: Minimum delay in seconds between two publications of a state
+        """
+        if cache_size is not None:
+            self._cache_size = cache_size
+        if publish_interval is not None:
+            self._publish_interval = publish_interval
+        if publish:
+            self._published.update(publish)
+            self.publish(*publish)
+            if self._publisher is None:
+                self._publisher = threading.Thread(target=self._publish_loop, name='cogni-state-publisher', daemon=True)
+                self._publisher.start()
+                atexit.register(self._publish_pending_states)
+        if backend is not None:
+            self.reset_cache()
+            self._backend.close()
+            self._backend = make_backend(backend, self._states_dir)
+            self._lru = OrderedDict() if self._backend.lazy else None
+        if batch_size is not None:
+            self._batch_size = batch_size
+        if flush_interval is not None:
+            self._flush_interval = flush_interval
+        if durability is None:
+            return
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{durability}', expected one of {DURABILITY_MODES}")
+
+        # Leaving a buffered mode: whatever is pending must reach the disk first
+        self.flush()
+        self._durability = durability
+        if durability == 'async' and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='cogni-state-flusher', daemon=True)
+            self._flusher.start()
 
     def reset_cache(self):
         """Clear the in-memory cache."""
+        self.flush()
         self._cache = {}
+        self._versions = {}
+        self._nodes = {}
+        if self._lru is not None:
+            self._lru.clear()
 
-    def onChange(self, callback):
-        """Set a callback to be triggered when state changes."""
-        self._callbacks = [callback]
+    def refresh(self, *state_names: str) -> List[str]:
+        """
+        Drop cached states that were changed by someone else since we loaded them.
 
-    def _notify_change(self, state_name: str):
-        """Notify callbacks of a change to a state."""
-        if state_name in self._cache:
-            state_dict = self._cache[state_name].to_dict()
-            for callback in self._callbacks:
-                callback(state_name, state_dict)
+        Cheaper than ``reset_cache``: unchanged states stay in memory, and checking a state
+        only costs a backend version lookup.
 
-    def _load_state_recursive(self, base_dir: str) -> Union[Dict, List, Any]:
-        """
-        Recursively load a state from a directory structure.
-        
         Args:
-            base_dir: The directory to load the state from
-        
+            state_names: States to check, all cached states when omitted
+
         Returns:
-            The loaded state as a dictionary, list, or scalar value
+            The names of the states that were dropped and will be reloaded on next access
         """
-        # Check if this is a leaf node (has val.json)
-        val_file = os.path.join(base_dir, 'val.json')
-        if os.path.isfile(val_file):
-            with open(val_file, 'r') as f:
-                try:
-                    toto = f.read()
-                    return json.loads(toto)
-                except json.JSONDecodeError:
-                    return None
-        
-        # Check if this is a container node (has __type.json)
-        type_file = os.path.join(base_dir, '__type.json')
-        if os.path.isfile(type_file):
-            with open(type_file, 'r') as f:
+        if self._dirty:
+            self.flush()
+        stale = []
+        for state_name in state_names or list(self._cache):
+            if state_name not in self._cache:
+                continue
+            if self._backend.version(state_name) != self._versions.get(state_name):
+                self._forget(state_name)
+                stale.append(state_name)
+        return stale
+
+    def _forget(self, state_name: str) -> None:
+        """Drop everything held in memory for *state_name*."""
+        self._cache.pop(state_name, None)
+        self._versions.pop(state_name, None)
+        self._nodes.pop(state_name, None)
+        if self._lru is not None:
+            for key in [k for k, node in self._lru.items() if node._state_name == state_name]:
+                del self._lru[key]
+
+    # ---------------------------------------------------------------------
+    # Lazy loading (used by StateDict / StateList)
+    # ---------------------------------------------------------------------
+    def _lazy_node(self, state_name: str, owner: _StateNode, key: str, kind: str):
+        """The live node stored under *key* of *owner* (the root when None), or a new lazy one."""
+        nodes = self._nodes.get(state_name)
+        node = nodes.get((id(owner), key)) if nodes is not None else None
+        cls = StateList if kind == 'list' else StateDict
+        if not isinstance(node, cls):
+            node = cls._lazy(self, state_name, owner, key)
+        return node
+
+    def _load_node(self, node: _StateNode) -> None:
+        """Read the direct children of a lazy node from storage."""
+        if self._dirty:
+            self.flush()
+        kind, children = self._backend.load_children(node._state_name, node._path)
+        is_list = isinstance(node, StateList)
+        data = [] if is_list else {}
+        with self._muted():
+            for key, child_kind, value in children:
+                if is_list:
+                    # Items keep their stored index, gaps read back as None like reserved slots
+                    key = int(key)
+                    data.extend([None] * (key - len(data)))
+                else:
+                    key = sys.intern(key)
+                if child_kind == 'val':
+                    child = value
+                elif value is not None:
+                    # The backend already had the data at hand
+                    cls = StateList if child_kind == 'list' else StateDict
+                    child = cls(value, self, node._state_name, node, key)
+                else:
+                    child = self._lazy_node(node._state_name, node, key, child_kind)
+                if is_list:
+                    data.append(child)
+                else:
+                    data[key] = child
+        node._data = data
+        if self._lru is not None:
+            self._touch(node)
+
+    def _touch(self, node: _StateNode) -> None:
+        """Mark *node* as recently used, unloading the least recently used ones."""
+        lru = self._lru
+        key = id(node)
+        if key in lru:
+            lru.move_to_end(key)
+            return
+        lru[key] = node
+        while len(lru) > self._cache_size:
+            _, oldest = lru.popitem(last=False)
+            if oldest._data is None:
+                continue
+            # Storage must hold everything before we forget the in-memory copy
+            if self._dirty:
+                self.flush()
+            oldest._unload()
+
+    # ---------------------------------------------------------------------
+    # Persistence primitives (used by StateDict / StateList)
+    # ---------------------------------------------------------------------
+    def _node_dir(self, state_name: str, path: List[str]) -> str:
+        """Directory holding the node at *path* inside *state_name* (directory layout)."""
+        dir_path = self._states_dir
+        for component in [state_name] + list(path):
+            dir_path = os.path.join(dir_path, safe_path_component(str(component)))
+        return dir_path
+
+    def _write_type(self, state_name: str, path: List[str], container_type: str) -> None:
+        """Mark the node at *path* as a ``dict`` or ``list`` container."""
+        self._record(state_name, path, ('type', container_type))
+
+    def _write_val(self, state_name: str, path: List[str], value: Any) -> None:
+        """Store a scalar *value* at *path*."""
+        self._record(state_name, path, ('val', value))
+
+    def _remove(self, state_name: str, path: List[str]) -> None:
+        """Remove the node at *path* and everything below it."""
+        self._record(state_name, path, ('del',))
+
+    @contextmanager
+    def _muted(self):
+        """Build nodes from data already in storage without writing it back."""
+        self._local.muted = getattr(self._local, 'muted', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.muted -= 1
+
+    @contextmanager
+    def _batch(self):
+        """Persist the ops recorded inside the block in one backend write, without notifying."""
+        if getattr(self._local, 'batch', None) is not None:
+            # Nested bulk operation: the outermost one writes
+            yield
+            return
+        self._local.batch = ops = []
+        try:
+            yield
+        finally:
+            self._local.batch = None
+            if ops and self._durability == 'sync':
+                self._apply_ops(ops)
+            else:
+                for state_name, path, op in ops:
+                    self._record(state_name, path, op)
+
+    def _append_slot(self, state_name: str, path: List[str], local_len: int, count: int = 1) -> int:
+        """Index for the next item (or *count* items) of the list at *path*, under ``_guard``."""
+        append_slot = getattr(self._backend, 'append_slot', None)
+        if append_slot is None:
+            if self._durability != 'sync' or not self._is_stale(state_name):
+                return local_len
+            # Another process wrote this state since we read it, it may have appended
+            return max(local_len, self._backend.next_index(state_name, path))
+        if self._dirty:
+            self.flush()
+        return self._tracking_versions([state_name], lambda: append_slot(state_name, path, count))
+
+    def _load_subtree(self, state_name: str, path: List[str]) -> Any:
+        """Read the node at *path* straight from storage."""
+        if self._dirty:
+            self.flush()
+        return self._backend.load_subtree(state_name, path)
+
+    def _record(self, state_name: str, path: List[str], op: Tuple) -> None:
+        """Apply *op* now, or queue it in the dirty set when running write-back."""
+        if getattr(self._local, 'muted', 0):
+            return
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            batch.append((state_name, path, op))
+            return
+        if self._durability == 'sync':
+            self._apply(state_name, path, op)
+            return
+
+        path = tuple(str(p) for p in path)
+        with self._dirty_lock:
+            if op[0] == 'del':
+                # Anything pending below a deleted node is moot
+                depth = len(path)
+                for key in [k for k in self._dirty if k[0] == state_name and k[1][:depth] == path]:
+                    del self._dirty[key]
+                self._dirty[(state_name, path, 'del')] = op
+            else:
+                # Re-insert so the op is ordered after any pending delete
+                key = (state_name, path, 'set')
+                self._dirty.pop(key, None)
+                self._dirty[key] = op
+            pending = len(self._dirty)
+
+        if pending >= self._batch_size:
+            if self._durability == 'async':
+                self._flusher_wakeup.set()
+            else:
+                self.flush()
+        elif self._durability == 'batched' and time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def _apply(self, state_name: str, path: List[str], op: Tuple) -> None:
+        """Hand a single op to the storage backend."""
+        self._apply_ops([(state_name, path, op)])
+
+    def _apply_ops(self, ops: List[Tuple[str, List[str], Tuple]]) -> None:
+        """Write *ops* to the backend, keeping the versions of cached states current."""
+        state_names = {state_name for state_name, _, _ in ops}
+        known = {name: self._versions[name] for name in state_names if name in self._versions}
+        self._versions.update(self._backend.apply_tracked(ops, known))
+        if self._published:
+            self._publish_pending.update(name for name in state_names if name in self._published)
+
+    def _tracking_versions(self, state_names, write):
+        """Run *write*, then adopt the new versions of *state_names* we were up to date with."""
+        tracked = [name for name in state_names if name in self._versions]
+        # A foreign write before ours means our copy is stale: keep it flagged as such
+        fresh = [name for name in tracked if self._backend.version(name) == self._versions[name]]
+        result = write()
+        for name in tracked:
+            self._versions[name] = self._backend.version(name) if name in fresh else None
+        if self._published:
+            self._publish_pending.update(name for name in state_names if name in self._published)
+        return result
+
+    # ---------------------------------------------------------------------
+    # Locking
+    # ---------------------------------------------------------------------
+    @contextmanager
+    def lock(self, state_name: str):
+        """
+        Hold *state_name* exclusively, between threads and between processes.
+
+        On entry the state is refreshed if another process changed it, on exit pending
+        writes are flushed, so a read-modify-write in the block never loses an update::
+
+            with State.lock('exec') as exec_state:
+                exec_state['pause_before'] = None
+
+        Locks are reentrant. Single mutations (``append``, ``compare_and_set``...) lock on
+        their own and don't need this.
+        """
+        with self._guard(state_name):
+            with self._process_lock(state_name) as outermost:
+                if outermost:
+                    self.refresh(state_name)
                 try:
-                    toto = f.read()
-                    type_info = json.loads(toto)
-                    container_type = type_info.get("type")
-                    
-                    # Process based on type
-                    if container_type == "dict":
-                        result = {}
-                        for item in os.listdir(base_dir):
-                            item_path = os.path.join(base_dir, item)
-                            # Skip type file and non-directories
-                            if item == '__type.json' or not os.path.isdir(item_path):
-                                continue
-                            result[item] = self._load_state_recursive(item_path)
-                        return result
-                    
-                    elif container_type == "list":
-                        # Create a list of appropriate size
-                        result = []
-                        indices = []
-                        
-                        # First, collect all valid indices
-                        for item in os.listdir(base_dir):
-                            item_path = os.path.join(base_dir, item)
-                            # Skip type file and non-directories
-                            if item == '__type.json' or not os.path.isdir(item_path):
-                                continue
-                            
-                            # Try to convert the directory name to an integer index
-                            try:
-                                idx = int(item)
-                                indices.append((idx, item_path))
-                            except ValueError:
-                                # Skip directories that don't convert to indices
-                                continue
-                        
-                        # Sort indices and load values
-                        indices.sort()
-                        for idx, item_path in indices:
-                            # Ensure list has enough items
-                            while len(result) <= idx:
-                                result.append(None)
-                            result[idx] = self._load_state_recursive(item_path)
-                        
-                        # Filter out None values that might exist due to gaps
-                        return [x for x in result if x is not None]
-                    
-                except json.JSONDecodeError:
-                    return {}
-        
-        # Default: return empty dict
-        return {}
+                    yield self[state_name]
+                finally:
+                    if outermost:
+                        self.flush()
+
+    @contextmanager
+    def _guard(self, state_name: str, process: bool = False):
+        """
+        Serialize mutations of *state_name* between threads.
+
+        With *process* set, also between processes, but only for ``sync`` durability: buffered
+        writes are private to the process until flushed anyway.
+        """
+        lock = self._locks.get(state_name)
+        if lock is None:
+            lock = self._locks.setdefault(state_name, threading.RLock())
+        with lock:
+            if process and self._durability == 'sync':
+                with self._process_lock(state_name):
+                    yield
+            else:
+                yield
+
+    @contextmanager
+    def _process_lock(self, state_name: str):
+        """``flock`` on ``<states_dir>/__locks/<state>``, held by the thread owning ``_guard``."""
+        depth = getattr(self._local, 'flocks', None)
+        if depth is None:
+            depth = self._local.flocks = {}
+        held = depth.get(state_name, 0)
+        lock_file = None
+        if not held and fcntl is not None:
+            lock_file = self._lock_files.get(state_name)
+            if lock_file is None:
+                lock_dir = os.path.join(self._states_dir, '__locks')
+                os.makedirs(lock_dir, exist_ok=True)
+                lock_file = open(os.path.join(lock_dir, safe_path_component(state_name)), 'a')
+                self._lock_files[state_name] = lock_file
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        depth[state_name] = held + 1
+        try:
+            yield not held
+        finally:
+            depth[state_name] = held
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _is_stale(self, state_name: str) -> bool:
+        """True if someone else wrote *state_name* since we loaded it."""
+        return self._backend.version(state_name) != self._versions.get(state_name)
+
+    def flush(self) -> None:
+        """Write every pending mutation to disk and deliver coalesced changes."""
+        for sub in list(self._subscribers):
+            sub.drain()
+        with self._flush_lock:
+            with self._dirty_lock:
+                pending, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+            if pending:
+                self._apply_ops([(state_name, path, op) for (state_name, path, _), op in pending.items()])
+
+    # ---------------------------------------------------------------------
+    # Read-only snapshots
+    # ---------------------------------------------------------------------
+    def _published_path(self, state_name: str) -> str:
+        return os.path.join(self._states_dir, '__published', safe_path_component(state_name) + '.snap')
+
+    def publish(self, *state_names: str) -> None:
+        """
+        Write a read-only snapshot of each state for ``State.snapshot`` readers.
+
+        The file is replaced atomically, readers that already opened the previous one keep
+        reading it.
+        """
+        for state_name in state_names:
+            with self._guard(state_name, process=True):
+                if self._dirty:
+                    self.flush()
+                write_snapshot(self._published_path(state_name), self._backend.load(state_name))
+                self._publish_pending.discard(state_name)
+
+    def snapshot(self, state_name: str) -> StateSnapshot:
+        """
+        Open the last published snapshot of *state_name*, memory-mapped and read-only.
+
+        Reading it never loads the state or touches its storage, which makes it the cheap
+        way for dashboards and monitors to follow a state another process writes (see the
+        ``publish`` argument of ``configure``). The state is published first if it never was.
+        """
+        file_path = self._published_path(state_name)
+        if not os.path.exists(file_path):
+            self.publish(state_name)
+        return StateSnapshot(file_path, state_name)
+
+    def _publish_pending_states(self) -> None:
+        pending, self._publish_pending = self._publish_pending, set()
+        if pending:
+            self.publish(*pending)
+
+    def _publish_loop(self) -> None:
+        """Background publisher used by ``configure(publish=...)``."""
+        while True:
+            time.sleep(self._publish_interval)
+            self._publish_pending_states()
+
+    def _flush_loop(self) -> None:
+        """Background flusher used by the ``async`` durability mode."""
+        while True:
+            self._flusher_wakeup.wait(self._flush_interval)
+            self._flusher_wakeup.clear()
+            if self._dirty:
+                self.flush()
+
+    def onChange(self, callback):
+        """Set a callback to be triggered with the full state when it changes."""
+        for sub in [s for s in self._subscribers if s.snapshot and s.prefix == ()]:
+            sub.unsubscribe()
+        self.subscribe(callback, snapshot=True)
+
+    def subscribe(self, callback: Callable, prefix: Union[str, List[str]] = (),
+                  snapshot: bool = False, coalesce: float = None) -> StateSubscription:
+        """
+        Call *callback* when something under *prefix* changes.
+
+        Args:
+            callback: Receives a ``StateChange`` per mutation, a list of them when
+                coalescing, or ``(state_name, state_dict)`` when *snapshot* is set
+            prefix: Path starting with the state name, e.g. ``'events/events'``;
+                everything when empty
+            snapshot: Serialize and pass the whole state instead of the delta (O(state size))
+            coalesce: Batch deltas for this many seconds, keeping only the latest change
+                per path; ``State.flush()`` delivers whatever is pending
+
+        Returns:
+            The subscription, call ``unsubscribe()`` on it to stop receiving changes
+        """
+        sub = StateSubscription(self, callback, split_path(prefix), snapshot, coalesce)
+        self._subscribers.append(sub)
+        return sub
+
+    def _notify_change(self, state_name: str, path: List[str] = (), op: str = 'set', value: Any = None):
+        """Hand a change to the subscribers watching its path."""
+        if not self._subscribers or getattr(self._local, 'batch', None) is not None:
+            return
+        path = tuple(str(p) for p in path)
+        change = None
+        for sub in list(self._subscribers):
+            if sub.matches(state_name, path):
+                change = change or StateChange(state_name, path, op, value)
+                sub.deliver(change)
 
     def _load_state(self, state_name: str) -> Dict:
-        """Load a state by name from the file system."""
-        # Check if the directory for this state exists
-        state_dir = os.path.join(self._states_dir, state_name)
-        if os.path.isdir(state_dir):
-            # Load the state recursively
-            return self._load_state_recursive(state_dir)
-        
-        # Legacy support - check for JSON file
-        legacy_path = os.path.join(self._states_dir, f"{state_name}.json")
-        if os.path.exists(legacy_path):
-            with open(legacy_path, 'r') as f:
-                try:
-                    return json.load(f)
-                except json.JSONDecodeError:
-                    return {}
-        
-        return {}
+        """Load a state by name from the storage backend."""
+        if self._dirty:
+            self.flush()
+        return self._backend.load(state_name)
 
     def _save_state(self, state_name: str, data: Union[StateDict, Dict]) -> None:
         """
@@ -517,58 +1109,92 @@ class _State:
         In the new hierarchical structure, persistence is handled by individual StateDict
         and StateList objects as they're modified.
         """
-        if data and self._callbacks:
+        if data:
             data_dict = data.to_dict() if isinstance(data, (StateDict, StateList)) else data
-            for callback in self._callbacks:
-                callback(state_name, data_dict)
+            self._notify_change(state_name, [], 'set', data_dict)
 
     def __getitem__(self, state_name: str) -> StateDict:
         """Get a state by name, loading it from disk if not in cache."""
         if state_name not in self._cache:
-            data = self._load_state(state_name)
-            self._cache[state_name] = StateDict(data, self, state_name)
+            # Read the version first: a write racing with the load makes it stale
+            self._versions[state_name] = self._backend.version(state_name)
+            if self._backend.lazy:
+                # Children are read on first access
+                self._cache[state_name] = self._lazy_node(state_name, None, None, 'dict')
+            else:
+                data = self._load_state(state_name)
+                with self._muted():
+                    self._cache[state_name] = StateDict(data, self, state_name)
         return self._cache[state_name]
 
     def __contains__(self, key):
-        """Check if a state exists and is not empty."""
-        return self[key].to_dict() != {}
+        """Check if a state exists and is not empty, without loading or creating it."""
+        if key in self._cache and getattr(self._cache[key], '_data', True) is not None:
+            node = self._cache[key]
+            return not (isinstance(node, StateDict) and len(node) == 0)
+        if self._dirty:
+            self.flush()
+        info = self._backend.stat(key, [])
+        return info is not None and (info[0] != 'dict' or info[1])
+
+    def exists(self, path: Union[str, List[str]]) -> bool:
+        """
+        Check if a node exists, e.g. ``State.exists('exec/logs')``.
+
+        Cached states are looked up in memory, others with a metadata query on the backend.
+        Nothing is loaded, created or persisted.
+        """
+        state_name, *path = split_path(path)
+        if state_name not in self._cache:
+            if self._dirty:
+                self.flush()
+            return self._backend.stat(state_name, path) is not None
+
+        node = self._cache[state_name]
+        for component in path:
+            if isinstance(node, _StateNode) and node._data is None:
+                # Not loaded yet: ask the backend rather than loading it
+                if self._dirty:
+                    self.flush()
+                return self._backend.stat(state_name, path) is not None
+            if isinstance(node, StateDict) and component in node._data:
+                node = node._data[component]
+            elif isinstance(node, StateList) and component.isdigit() and int(component) < len(node._data):
+                node = node._data[int(component)]
+            else:
+                return False
+        return True
 
     def __setitem__(self, state_name: str, value: Dict) -> None:
         """Set a state to a new value."""
-        # Convert to StateDict if it's not already
-        if isinstance(value, dict):
-            self._cache[state_name] = StateDict(value, self, state_name)
-        elif isinstance(value, list):
-            self._cache[state_name] = StateList(value, self, state_name)
-        else:
-            # For scalar values, create a simple structure
-            state_dir = os.path.join(self._states_dir, state_name)
-            os.makedirs(state_dir, exist_ok=True)
-            val_file = os.path.join(state_dir, 'val.json')
-            with open(val_file, 'w') as f:
-                json.dump(value, f)
-            self._cache[state_name] = value
+        self._versions[state_name] = self._backend.version(state_name)
+        # Convert to StateDict if it's not already, persisting it in one write
+        with self._batch():
+            if isinstance(value, dict):
+                self._cache[state_name] = StateDict(value, self, state_name)
+            elif isinstance(value, list):
+                self._cache[state_name] = StateList(value, self, state_name)
+            else:
+                # For scalar values, create a simple structure
+                self._write_val(state_name, [], value)
+                self._cache[state_name] = value
         
-        # Notify callbacks
-        if self._callbacks:
-            data_dict = self._cache[state_name].to_dict() if hasattr(self._cache[state_name], 'to_dict') else self._cache[state_name]
-            for callback in self._callbacks:
-                callback(state_name, data_dict)
+        # Notify subscribers
+        self._notify_change(state_name, [], 'set', value)
 
     def __delitem__(self, state_name: str) -> None:
         """Delete a state."""
         # Remove from cache
-        self._cache.pop(state_name, None)
-        
-        # Remove from file system
-        state_dir = os.path.join(self._states_dir, state_name)
-        if os.path.isdir(state_dir):
-            shutil.rmtree(state_dir)
+        self._forget(state_name)
+
+        # Drop pending writes for this state, they would resurrect it
+        with self._dirty_lock:
+            for key in [k for k in self._dirty if k[0] == state_name]:
+                del self._dirty[key]
         
-        # Legacy support - remove JSON file if it exists
-        legacy_path = os.path.join(self._states_dir, f"{state_name}.json")
-        if os.path.exists(legacy_path):
-            os.remove(legacy_path)
+        # Remove from storage
+        self._backend.drop(state_name)
+        self._notify_change(state_name, [], 'delete')
 
 
 State = _State()
@@ -0,0 +1,997 @@
+"""
+Storage backends for ``State``.
+
+A backend persists path-level mutations of named states and rebuilds a state as plain
+dicts/lists/scalars. Mutations are tuples:
+
+- ``('type', 'dict' | 'list')``: ensure the node at *path* is a container
+- ``('val', value)``: store a JSON scalar at *path*
+- ``('del',)``: remove the node at *path* and everything below it
+
+Paths are lists of string components, list indices being ``str(idx)``.
+"""
+import os
+import re
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+
+#: Bytes a generation file of DirectoryBackend grows to before it is replaced
+GEN_FILE_SIZE = 64 * 1024
+
+
+def safe_path_component(component: str) -> str:
+    """Convert a string to a safe path component by replacing unsafe characters."""
+    # Replace characters that might be problematic in file paths
+    safe = re.sub(r'[\\/*?:"<>|]', '_', component)
+    return safe
+
+
+class StateBackend:
+    """Base class for State storage backends."""
+
+    #: True if ``load_children`` reads one level without loading the whole state
+    lazy = False
+
+    def load(self, state_name: str) -> Union[Dict, List, Any]:
+        """Return the whole state as plain python values (``{}`` when missing)."""
+        raise NotImplementedError
+
+    def apply(self, state_name: str, path: List[str], op: Tuple) -> None:
+        """Persist a single mutation."""
+        raise NotImplementedError
+
+    def apply_batch(self, ops: Iterable[Tuple[str, List[str], Tuple]]) -> None:
+        """Persist a batch of ``(state_name, path, op)`` mutations, in order."""
+        for state_name, path, op in ops:
+            self.apply(state_name, path, op)
+
+    def version(self, state_name: str) -> Any:
+        """
+        Cheap token that changes whenever *state_name* is written, by any process.
+
+        The default never compares equal, so callers always reload.
+        """
+        return object()
+
+    def apply_tracked(self, ops: Iterable[Tuple[str, List[str], Tuple]],
+                      known: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Persist *ops* like ``apply_batch``, and return the new version of the states in *known*.
+
+        A state gets None instead when someone else wrote it after the version *known* has
+        for it: the caller's copy of it is stale.
+        """
+        fresh = [name for name, version in known.items() if self.version(name) == version]
+        self.apply_batch(ops)
+        return {name: self.version(name) if name in fresh else None for name in known}
+
+    def load_subtree(self, state_name: str, path: List[str]) -> Any:
+        """Return the node at *path* as plain python values (``{}`` when missing)."""
+        node = self.load(state_name)
+        for component in path:
+            if isinstance(node, dict):
+                node = node.get(str(component), {})
+            elif isinstance(node, list) and str(component).isdigit() and int(component) < len(node):
+                node = node[int(component)]
+            else:
+                return {}
+        return node
+
+    def load_children(self, state_name: str, path: List[str]) -> Tuple[str, List[Tuple[str, str, Any]]]:
+        """
+        Read one level of the tree.
+
+        Returns:
+            ``(kind, children)`` for the node at *path*, children being ``(key, kind, value)``
+            triples in order. ``value`` is the scalar for ``val`` children and, for containers,
+            either their plain data or None when the backend left them to be loaded later.
+        """
+        node = self.load_subtree(state_name, path)
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = ((str(i), v) for i, v in enumerate(node))
+        else:
+            return 'val', []
+        children = []
+        for key, value in items:
+            kind = 'dict' if isinstance(value, dict) else 'list' if isinstance(value, list) else 'val'
+            children.append((key, kind, value))
+        return ('list' if isinstance(node, list) else 'dict'), children
+
+    def next_index(self, state_name: str, path: List[str]) -> int:
+        """Index the next item appended to the list at *path* gets."""
+        return len(self.load_children(state_name, path)[1])
+
+    def stat(self, state_name: str, path: List[str]) -> Union[Tuple[str, bool], None]:
+        """
+        Metadata of the node at *path*, without loading or creating anything.
+
+        Returns:
+            ``(kind, has_children)`` with kind in ``dict``, ``list``, ``val``, or None if missing
+        """
+        node = self.load_subtree(state_name, path)
+        if node == {}:
+            return None
+        if isinstance(node, (dict, list)):
+            return ('dict' if isinstance(node, dict) else 'list', len(node) > 0)
+        return ('val', False)
+
+    def drop(self, state_name: str) -> None:
+        """Delete a whole state."""
+        raise NotImplementedError
+
+    def state_names(self) -> List[str]:
+        """Names of the states stored by this backend."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release any resource held by the backend."""
+
+
+# ---------------------------------------------------------------------------
+# Directory layout: one directory per node, `__type.json` / `val.json` files
+# ---------------------------------------------------------------------------
+
+class DirectoryBackend(StateBackend):
+    """The historical layout: ``<states_dir>/<state>/<key>/.../val.json``."""
+
+    lazy = True
+
+    def __init__(self, states_dir: str):
+        self.states_dir = states_dir
+        os.makedirs(self.states_dir, exist_ok=True)
+        # state -> descriptor of its generation file, opened for appending
+        self._gen_files: Dict[str, int] = {}
+        self._gen_lock = threading.Lock()
+
+    def node_dir(self, state_name: str, path: List[str]) -> str:
+        """Directory holding the node at *path* inside *state_name*."""
+        dir_path = self.states_dir
+        for component in [state_name] + list(path):
+            dir_path = os.path.join(dir_path, safe_path_component(str(component)))
+        return dir_path
+
+    def apply(self, state_name: str, path: List[str], op: Tuple) -> None:
+        self._apply_op(state_name, path, op)
+        self._bump(state_name)
+
+    def apply_batch(self, ops: Iterable[Tuple[str, List[str], Tuple]]) -> None:
+        self.apply_tracked(ops, {})
+
+    def apply_tracked(self, ops: Iterable[Tuple[str, List[str], Tuple]],
+                      known: Dict[str, Any]) -> Dict[str, Any]:
+        touched = {}
+        for state_name, path, op in ops:
+            self._apply_op(state_name, path, op)
+            touched[state_name] = True
+        versions = {}
+        for state_name in touched:
+            previous, version = self._bump(state_name)
+            if state_name in known:
+                # Ours is the only write since the known version if it added the only byte,
+                # or created the file when there was none
+                known_version = known[state_name]
+                if known_version is None:
+                    ours = previous[1] == 0
+                else:
+                    ours = known_version[:2] == previous
+                versions[state_name] = version if ours else None
+        return versions
+
+    def _gen_path(self, state_name: str) -> str:
+        return os.path.join(self.states_dir, '__gen', safe_path_component(state_name))
+
+    def _gen_fd(self, state_name: str) -> int:
+        fd = self._gen_files.get(state_name)
+        if fd is None:
+            gen_path = self._gen_path(state_name)
+            os.makedirs(os.path.dirname(gen_path), exist_ok=True)
+            fd = self._gen_files[state_name] = os.open(
+                gen_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return fd
+
+    def _bump(self, state_name: str) -> Tuple[Tuple[int, int], Any]:
+        """
+        Append one byte to the generation file of *state_name*.
+
+        The version is ``(inode, size, mtime_ns)`` of that file, so a write costs one
+        ``write`` on a descriptor kept open and checking a version one ``stat``, between
+        all processes. Once the file holds GEN_FILE_SIZE bytes it is replaced by an empty
+        one: the inode changes, and whoever still writes to the old one sees it unlinked
+        and writes again to the new one.
+
+        Returns:
+            ``(inode, size)`` the file had just before our byte, and the new version, or
+            None when it is not known (the file was replaced, or written again since)
+        """
+        with self._gen_lock:
+            while True:
+                fd = self._gen_fd(state_name)
+                os.write(fd, b'.')
+                size = os.lseek(fd, 0, os.SEEK_CUR)
+                st = os.fstat(fd)
+                if st.st_nlink:
+                    break
+                os.close(self._gen_files.pop(state_name))
+            previous = (st.st_ino, size - 1)
+            if size >= GEN_FILE_SIZE:
+                gen_path = self._gen_path(state_name)
+                tmp_path = f"{gen_path}.{os.getpid()}.{threading.get_ident()}"
+                os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644))
+                os.replace(tmp_path, gen_path)
+                os.close(self._gen_files.pop(state_name))
+                return previous, None
+        if st.st_size != size:
+            return previous, None
+        return previous, (st.st_ino, size, st.st_mtime_ns)
+
+    def version(self, state_name: str) -> Any:
+        try:
+            st = os.stat(self._gen_path(state_name))
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def close(self) -> None:
+        with self._gen_lock:
+            gen_files, self._gen_files = self._gen_files, {}
+        for fd in gen_files.values():
+            os.close(fd)
+
+    def _apply_op(self, state_name: str, path: List[str], op: Tuple) -> None:
+        node_dir = self.node_dir(state_name, path)
+        kind = op[0]
+        if kind == 'del':
+            if os.path.exists(node_dir):
+                shutil.rmtree(node_dir)
+            return
+
+        os.makedirs(node_dir, exist_ok=True)
+        if kind == 'type':
+            with open(os.path.join(node_dir, '__type.json'), 'w') as f:
+                json.dump({"type": op[1]}, f)
+        else:
+            with open(os.path.join(node_dir, 'val.json'), 'w') as f:
+                json.dump(op[1], f)
+
+    def _read_kind(self, node_dir: str) -> Tuple[str, Any]:
+        """``('val', value)`` for a leaf, ``(container_type, None)`` otherwise."""
+        try:
+            with open(os.path.join(node_dir, 'val.json')) as f:
+                try:
+                    return 'val', json.loads(f.read())
+                except json.JSONDecodeError:
+                    return 'val', None
+        except FileNotFoundError:
+            pass
+        try:
+            with open(os.path.join(node_dir, '__type.json')) as f:
+                return json.loads(f.read()).get('type', 'dict'), None
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 'dict', None
+
+    def load_children(self, state_name: str, path: List[str]) -> Tuple[str, List[Tuple[str, str, Any]]]:
+        node_dir = self.node_dir(state_name, path)
+        if not os.path.isdir(node_dir):
+            # Legacy JSON states (or nothing at all)
+            return super().load_children(state_name, path)
+        kind, value = self._read_kind(node_dir)
+        if kind == 'val':
+            return kind, []
+
+        with os.scandir(node_dir) as entries:
+            names = [entry.name for entry in entries if entry.is_dir()]
+        if kind == 'list':
+            # Same ordering as load_recursive: numeric indices only
+            names = [str(i) for i in sorted(int(n) for n in names if n.isdigit())]
+        # None items of lists are kept: they hold the index of the items after them
+        children = []
+        for name in names:
+            child_kind, child_value = self._read_kind(os.path.join(node_dir, name))
+            children.append((name, child_kind, child_value))
+        return kind, children
+
+    def load_subtree(self, state_name: str, path: List[str]) -> Any:
+        node_dir = self.node_dir(state_name, path)
+        if os.path.isdir(node_dir):
+            # Nodes are built from it: list items must stay at their index
+            return self.load_recursive(node_dir, keep_none=True)
+        if os.path.isdir(self.node_dir(state_name, [])):
+            return {}
+        # Legacy JSON states (or nothing at all)
+        return super().load_subtree(state_name, path)
+
+    def next_index(self, state_name: str, path: List[str]) -> int:
+        try:
+            with os.scandir(self.node_dir(state_name, path)) as entries:
+                indices = [int(entry.name) for entry in entries if entry.name.isdigit() and entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        return max(indices) + 1 if indices else 0
+
+    def stat(self, state_name: str, path: List[str]) -> Union[Tuple[str, bool], None]:
+        node_dir = self.node_dir(state_name, path)
+        if not os.path.isdir(node_dir):
+            if not path and os.path.exists(os.path.join(self.states_dir, f"{state_name}.json")):
+                # Legacy JSON state
+                return super().stat(state_name, path)
+            return None
+        if os.path.isfile(os.path.join(node_dir, 'val.json')):
+            return ('val', False)
+
+        kind = 'dict'
+        type_file = os.path.join(node_dir, '__type.json')
+        if os.path.isfile(type_file):
+            with open(type_file) as f:
+                try:
+                    kind = json.load(f).get('type', 'dict')
+                except json.JSONDecodeError:
+                    pass
+        with os.scandir(node_dir) as entries:
+            has_children = any(entry.is_dir() for entry in entries)
+        return (kind, has_children)
+
+    def load(self, state_name: str) -> Union[Dict, List, Any]:
+        # Check if the directory for this state exists
+        state_dir = os.path.join(self.states_dir, state_name)
+        if os.path.isdir(state_dir):
+            # Load the state recursively
+            return self.load_recursive(state_dir)
+
+        # Legacy support - check for JSON file
+        legacy_path = os.path.join(self.states_dir, f"{state_name}.json")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError:
+                    return {}
+            # Convert it to the directory layout
+            self.apply_batch(_plain_to_ops(state_name, [], data))
+            return data
+
+        return {}
+
+    def load_recursive(self, base_dir: str, keep_none: bool = False) -> Union[Dict, List, Any]:
+        """
+        Recursively load a state from a directory structure.
+
+        Args:
+            base_dir: The directory to load the state from
+            keep_none: Keep None list items (and gaps) so items stay at their stored index
+
+        Returns:
+            The loaded state as a dictionary, list, or scalar value
+        """
+        # Check if this is a leaf node (has val.json)
+        val_file = os.path.join(base_dir, 'val.json')
+        if os.path.isfile(val_file):
+            with open(val_file, 'r') as f:
+                try:
+                    toto = f.read()
+                    return json.loads(toto)
+                except json.JSONDecodeError:
+                    return None
+
+        # Container node: its __type.json, or a dict when it has none. The root of a state
+        # is created without writing it, its children are written as they are set.
+        container_type = 'dict'
+        type_file = os.path.join(base_dir, '__type.json')
+        if os.path.isfile(type_file):
+            with open(type_file, 'r') as f:
+                try:
+                    container_type = json.loads(f.read()).get("type")
+                except json.JSONDecodeError:
+                    return {}
+
+        # Process based on type
+        if container_type == "dict":
+            result = {}
+            for item in os.listdir(base_dir):
+                item_path = os.path.join(base_dir, item)
+                # Skip type file and non-directories
+                if item == '__type.json' or not os.path.isdir(item_path):
+                    continue
+                result[item] = self.load_recursive(item_path, keep_none)
+            return result
+
+        elif container_type == "list":
+            # Create a list of appropriate size
+            result = []
+            indices = []
+
+            # First, collect all valid indices
+            for item in os.listdir(base_dir):
+                item_path = os.path.join(base_dir, item)
+                # Skip type file and non-directories
+                if item == '__type.json' or not os.path.isdir(item_path):
+                    continue
+
+                # Try to convert the directory name to an integer index
+                try:
+                    idx = int(item)
+                    indices.append((idx, item_path))
+                except ValueError:
+                    # Skip directories that don't convert to indices
+                    continue
+
+            # Sort indices and load values
+            indices.sort()
+            for idx, item_path in indices:
+                # Ensure list has enough items
+                while len(result) <= idx:
+                    result.append(None)
+                result[idx] = self.load_recursive(item_path, keep_none)
+
+            if keep_none:
+                return result
+            # Filter out None values that might exist due to gaps
+            return [x for x in result if x is not None]
+
+        # Default: return empty dict
+        return {}
+
+    def drop(self, state_name: str) -> None:
+        state_dir = os.path.join(self.states_dir, state_name)
+        if os.path.isdir(state_dir):
+            shutil.rmtree(state_dir)
+
+        # Legacy support - remove JSON file if it exists
+        legacy_path = os.path.join(self.states_dir, f"{state_name}.json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        self._bump(state_name)
+
+    def state_names(self) -> List[str]:
+        names = []
+        for entry in os.scandir(self.states_dir):
+            if entry.is_dir() and not entry.name.startswith('__'):
+                names.append(entry.name)
+            elif entry.is_file() and entry.name.endswith('.json'):
+                names.append(entry.name[:-len('.json')])
+        return names
+
+
+# ---------------------------------------------------------------------------
+# Snapshot + write-ahead log: one compact file per state, plus appended ops
+# ---------------------------------------------------------------------------
+
+class _Node:
+    """Mutable tree node used to replay a write-ahead log."""
+    __slots__ = ('kind', 'children', 'value')
+
+    def __init__(self, kind: str = None, value: Any = None):
+        self.kind = kind          # 'dict', 'list', 'val' or None (implicit directory)
+        self.children = {}
+        self.value = value
+
+    @classmethod
+    def from_plain(cls, data: Any) -> '_Node':
+        if isinstance(data, dict):
+            node = cls('dict')
+            node.children = {str(k): cls.from_plain(v) for k, v in data.items()}
+        elif isinstance(data, list):
+            node = cls('list')
+            node.children = {str(i): cls.from_plain(v) for i, v in enumerate(data)}
+        else:
+            node = cls('val', data)
+        return node
+
+    def to_plain(self) -> Any:
+        if self.kind == 'val':
+            return self.value
+        if self.kind == 'list':
+            # None items and gaps stay, so every item keeps its index
+            items = []
+            for i in sorted(int(k) for k in self.children if k.isdigit()):
+                items.extend([None] * (i - len(items)))
+                items.append(self.children[str(i)].to_plain())
+            return items
+        return {k: v.to_plain() for k, v in self.children.items()}
+
+    def apply(self, path: List[str], op: Tuple) -> None:
+        node = self
+        for component in path[:-1]:
+            node = node.children.setdefault(component, _Node())
+        if not path:
+            # Ops on the state root
+            if op[0] == 'type':
+                if self.kind in ('dict', 'list', None):
+                    self.kind = op[1]
+                else:
+                    self.kind, self.value, self.children = op[1], None, {}
+            elif op[0] == 'val':
+                self.kind, self.value, self.children = 'val', op[1], {}
+            else:
+                self.kind, self.value, self.children = 'dict', None, {}
+            return
+
+        key = path[-1]
+        if op[0] == 'del':
+            node.children.pop(key, None)
+        elif op[0] == 'val':
+            node.children[key] = _Node('val', op[1])
+        else:
+            child = node.children.get(key)
+            if child is None or child.kind == 'val':
+                node.children[key] = _Node(op[1])
+            else:
+                child.kind = op[1]
+
+
+class SnapshotBackend(StateBackend):
+    """
+    Keeps each state as ``__snapshot/<name>.snap.json`` (a compact JSON snapshot) plus
+    ``__snapshot/<name>.wal`` (one JSON line per mutation) under the states directory.
+
+    Opening a state reads the snapshot and replays the log. Once the log grows past
+    ``compact_bytes`` it is rotated and folded into a new snapshot by a background thread.
+    Replaying is idempotent, so a crash in the middle of a compaction is harmless.
+    This backend assumes a single writer process.
+    """
+
+    def __init__(self, states_dir: str, compact_bytes: int = 4 * 1024 * 1024):
+        self.states_dir = os.path.join(states_dir, '__snapshot')
+        self.compact_bytes = compact_bytes
+        self._wal_files = {}
+        self._wal_sizes = {}
+        self._lock = threading.RLock()
+        self._compacting = set()
+        # state -> (version of the snapshot and rotated log, live log inode, offset, tree)
+        self._trees = {}
+        os.makedirs(self.states_dir, exist_ok=True)
+
+    def _snapshot_path(self, state_name: str) -> str:
+        return os.path.join(self.states_dir, f"{safe_path_component(state_name)}.snap.json")
+
+    def _wal_path(self, state_name: str) -> str:
+        return os.path.join(self.states_dir, f"{safe_path_component(state_name)}.wal")
+
+    def _wal(self, state_name: str):
+        wal = self._wal_files.get(state_name)
+        if wal is None:
+            wal = open(self._wal_path(state_name), 'a')
+            self._wal_files[state_name] = wal
+            self._wal_sizes[state_name] = wal.tell()
+        return wal
+
+    def apply(self, state_name: str, path: List[str], op: Tuple) -> None:
+        self.apply_batch([(state_name, path, op)])
+
+    def apply_batch(self, ops: Iterable[Tuple[str, List[str], Tuple]]) -> None:
+        touched = set()
+        with self._lock:
+            for state_name, path, op in ops:
+                line = json.dumps([[str(p) for p in path]] + list(op), separators=(',', ':')) + '\n'
+                self._wal(state_name).write(line)
+                self._wal_sizes[state_name] += len(line)
+                touched.add(state_name)
+            for state_name in touched:
+                self._wal_files[state_name].flush()
+
+        for state_name in touched:
+            if self._wal_sizes[state_name] >= self.compact_bytes:
+                self.compact(state_name, background=True)
+
+    def _read_tree(self, state_name: str, live: bool = True) -> _Node:
+        """Snapshot plus the rotated log, plus the live log unless *live* is False."""
+        root = _Node()
+        snapshot_path = self._snapshot_path(state_name)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as f:
+                root = _Node.from_plain(json.load(f))
+
+        wal_paths = [self._wal_path(state_name) + '.1']
+        if live:
+            wal_paths.append(self._wal_path(state_name))
+        for wal_path in wal_paths:
+            self._replay(root, wal_path, 0)
+        return root
+
+    @staticmethod
+    def _replay(root: _Node, wal_path: str, offset: int) -> int:
+        """Apply the log lines of *wal_path* from *offset*, return the offset after the last one."""
+        try:
+            f = open(wal_path, 'rb')
+        except FileNotFoundError:
+            return offset
+        with f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError
+                    path, *op = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of the log
+                    break
+                root.apply(path, tuple(op))
+                offset += len(line)
+        return offset
+
+    def _tree(self, state_name: str) -> _Node:
+        """
+        The replayed tree of *state_name*, kept between calls: while the snapshot and the
+        rotated log are unchanged, only the lines appended to the live log are applied.
+        Callers must not modify it.
+        """
+        with self._lock:
+            if state_name in self._wal_files:
+                self._wal_files[state_name].flush()
+            version = self.version(state_name)
+            base, (ino, size) = version[:2], version[2][:2] if version[2] else (None, 0)
+            cached = self._trees.get(state_name)
+            if cached is None or cached[0] != base or cached[1] != ino or size < cached[2]:
+                cached = (base, ino, 0, self._read_tree(state_name, live=False))
+            if size != cached[2]:
+                offset = self._replay(cached[3], self._wal_path(state_name), cached[2])
+                cached = (base, ino, offset, cached[3])
+            self._trees[state_name] = cached
+            return cached[3]
+
+    def load(self, state_name: str) -> Union[Dict, List, Any]:
+        root = self._tree(state_name)
+        with self._lock:
+            return root.to_plain() if root.kind else {}
+
+    def stat(self, state_name: str, path: List[str]) -> Union[Tuple[str, bool], None]:
+        node = self._tree(state_name)
+        if node.kind is None and not node.children:
+            return None
+        for component in path:
+            node = node.children.get(str(component))
+            if node is None:
+                return None
+        return (node.kind or 'dict', bool(node.children))
+
+    def version(self, state_name: str) -> Any:
+        # The log only grows between compactions, and compaction swaps files
+        token = []
+        for path in (self._snapshot_path(state_name),
+                     self._wal_path(state_name) + '.1',
+                     self._wal_path(state_name)):
+            try:
+                st = os.stat(path)
+                token.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                token.append(None)
+        return tuple(token)
+
+    def compact(self, state_name: str, background: bool = False) -> None:
+        """Fold the write-ahead log of *state_name* into a fresh snapshot."""
+        with self._lock:
+            if state_name in self._compacting:
+                return
+            self._compacting.add(state_name)
+            # Rotate the log: new writes go to a fresh file while we compact
+            wal = self._wal_files.pop(state_name, None)
+            self._wal_sizes.pop(state_name, None)
+            if wal is not None:
+                wal.close()
+            wal_path = self._wal_path(state_name)
+            if os.path.exists(wal_path) and not os.path.exists(wal_path + '.1'):
+                os.replace(wal_path, wal_path + '.1')
+
+        def _compact():
+            try:
+                # The live log keeps growing meanwhile, only fold the rotated one
+                root = self._read_tree(state_name, live=False)
+                snapshot_path = self._snapshot_path(state_name)
+                tmp_path = snapshot_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(root.to_plain() if root.kind else {}, f, separators=(',', ':'))
+                os.replace(tmp_path, snapshot_path)
+                if os.path.exists(wal_path + '.1'):
+                    os.remove(wal_path + '.1')
+            finally:
+                with self._lock:
+                    self._compacting.discard(state_name)
+
+        if background:
+            threading.Thread(target=_compact, name=f'cogni-compact-{state_name}', daemon=True).start()
+        else:
+            _compact()
+
+    def drop(self, state_name: str) -> None:
+        with self._lock:
+            wal = self._wal_files.pop(state_name, None)
+            self._wal_sizes.pop(state_name, None)
+            self._trees.pop(state_name, None)
+            if wal is not None:
+                wal.close()
+            for path in (self._snapshot_path(state_name),
+                         self._wal_path(state_name),
+                         self._wal_path(state_name) + '.1'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def state_names(self) -> List[str]:
+        names = set()
+        for entry in os.listdir(self.states_dir):
+            for suffix in ('.snap.json', '.wal'):
+                if entry.endswith(suffix):
+                    names.add(entry[:-len(suffix)])
+        return sorted(names)
+
+    def close(self) -> None:
+        with self._lock:
+            for wal in self._wal_files.values():
+                wal.close()
+            self._wal_files = {}
+            self._wal_sizes = {}
+            self._trees = {}
+
+
+# ---------------------------------------------------------------------------
+# SQLite: one row per node, shared safely between processes
+# ---------------------------------------------------------------------------
+
+class SQLiteBackend(StateBackend):
+    """
+    Stores every ``(state, path)`` node as a row of ``<states_dir>/states.sqlite3``.
+
+    The database runs in WAL mode so readers never block writers, every batch of ops is
+    one ``BEGIN IMMEDIATE`` transaction, and subtree reads are range scans on the
+    ``(state, path)`` primary key. Several processes can share the same database;
+    ``append_slot`` hands out list indices atomically so concurrent appends never collide.
+    """
+
+    #: Separator between path components in the ``path`` column
+    SEP = '\x1f'
+
+    lazy = True
+
+    def __init__(self, states_dir: str, filename: str = 'states.sqlite3', timeout: float = 30.0):
+        os.makedirs(states_dir, exist_ok=True)
+        self.db_path = os.path.join(states_dir, filename)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, timeout=timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS nodes ('
+            ' state TEXT NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' value TEXT,'
+            ' PRIMARY KEY (state, path)'
+            ') WITHOUT ROWID')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS versions (state TEXT PRIMARY KEY, gen INTEGER NOT NULL)')
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _key(self, path: List[str]) -> str:
+        return self.SEP.join(str(p) for p in path)
+
+    def _range(self, key: str) -> Tuple[str, str]:
+        """Bounds of the rows strictly below *key*."""
+        if key == '':
+            # Every non-root row; chr(0x10ffff) sorts after any path
+            return '\x00', chr(0x10ffff)
+        return key + self.SEP, key + chr(ord(self.SEP) + 1)
+
+    def _delete_below(self, conn, state_name: str, key: str) -> None:
+        low, high = self._range(key)
+        conn.execute('DELETE FROM nodes WHERE state = ? AND path >= ? AND path < ?',
+                     (state_name, low, high))
+
+    def _apply_op(self, conn, state_name: str, path: List[str], op: Tuple) -> None:
+        key = self._key(path)
+        kind = op[0]
+        if kind == 'del':
+            self._delete_below(conn, state_name, key)
+            conn.execute('DELETE FROM nodes WHERE state = ? AND path = ?', (state_name, key))
+            if path:
+                # Items may have been removed from a list: recount its next index on demand
+                conn.execute("UPDATE nodes SET value = NULL WHERE state = ? AND path = ? AND kind = 'list'",
+                             (state_name, self._key(path[:-1])))
+        elif kind == 'val':
+            self._delete_below(conn, state_name, key)
+            conn.execute('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)',
+                         (state_name, key, 'val', json.dumps(op[1])))
+        else:
+            row = conn.execute('SELECT kind FROM nodes WHERE state = ? AND path = ?',
+                               (state_name, key)).fetchone()
+            if row is not None and row[0] != 'val':
+                if row[0] != op[1]:
+                    conn.execute('UPDATE nodes SET kind = ? WHERE state = ? AND path = ?',
+                                 (op[1], state_name, key))
+            else:
+                conn.execute('INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, NULL)',
+                             (state_name, key, op[1]))
+
+    def _bump(self, conn, state_name: str) -> None:
+        conn.execute('INSERT INTO versions VALUES (?, 1)'
+                     ' ON CONFLICT (state) DO UPDATE SET gen = gen + 1', (state_name,))
+
+    def apply(self, state_name: str, path: List[str], op: Tuple) -> None:
+        with self._transaction() as conn:
+            self._apply_op(conn, state_name, path, op)
+            self._bump(conn, state_name)
+
+    def apply_batch(self, ops: Iterable[Tuple[str, List[str], Tuple]]) -> None:
+        touched = set()
+        with self._transaction() as conn:
+            for state_name, path, op in ops:
+                self._apply_op(conn, state_name, path, op)
+                touched.add(state_name)
+            for state_name in touched:
+                self._bump(conn, state_name)
+
+    def version(self, state_name: str) -> Any:
+        with self._lock:
+            row = self._conn.execute('SELECT gen FROM versions WHERE state = ?', (state_name,)).fetchone()
+        return row[0] if row else None
+
+    def append_slot(self, state_name: str, path: List[str], count: int = 1) -> int:
+        """
+        Atomically reserve the next *count* indices of the list at *path*, return the first.
+
+        A ``null`` placeholder is written at each reserved index (lists skip ``None`` on load)
+        and the next free index is kept in the list row so appends stay O(1).
+        """
+        key = self._key(path)
+        prefix = key + self.SEP if key else ''
+        with self._transaction() as conn:
+            row = conn.execute('SELECT kind, value FROM nodes WHERE state = ? AND path = ?',
+                               (state_name, key)).fetchone()
+            if row is None or row[0] != 'list':
+                self._apply_op(conn, state_name, path, ('type', 'list'))
+                row = ('list', None)
+            if row[1] is None:
+                # No counter yet: find the highest index once
+                low, high = self._range(key)
+                indices = [int(child) for (child,) in conn.execute(
+                    'SELECT substr(path, ?) FROM nodes WHERE state = ? AND path >= ? AND path < ?',
+                    (len(prefix) + 1, state_name, low, high)) if child.isdigit()]
+                idx = max(indices) + 1 if indices else 0
+            else:
+                idx = int(row[1])
+            # The counter may lag behind indices written by plain ops
+            i = idx
+            while i < idx + count:
+                if conn.execute('SELECT 1 FROM nodes WHERE state = ? AND path = ?',
+                                (state_name, prefix + str(i))).fetchone():
+                    idx = i + 1
+                i += 1
+            conn.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?)',
+                             [(state_name, prefix + str(i), 'val', 'null') for i in range(idx, idx + count)])
+            conn.execute('UPDATE nodes SET value = ? WHERE state = ? AND path = ?',
+                         (str(idx + count), state_name, key))
+            self._bump(conn, state_name)
+        return idx
+
+    def load_subtree(self, state_name: str, path: List[str]) -> Any:
+        key = self._key(path)
+        low, high = self._range(key)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path, kind, value FROM nodes'
+                ' WHERE state = ? AND (path = ? OR (path >= ? AND path < ?)) ORDER BY path',
+                (state_name, key, low, high)).fetchall()
+        if not rows:
+            return {}
+
+        root = _Node()
+        skip = len(key) + 1 if key else 0
+        for row_path, kind, value in rows:
+            rel = row_path[skip:].split(self.SEP) if row_path != key else []
+            if kind == 'val':
+                root.apply(rel, ('val', json.loads(value)))
+            else:
+                root.apply(rel, ('type', kind))
+        return root.to_plain() if root.kind else {}
+
+    def load_children(self, state_name: str, path: List[str]) -> Tuple[str, List[Tuple[str, str, Any]]]:
+        key = self._key(path)
+        low, high = self._range(key)
+        skip = len(key) + 1 if key else 0
+        with self._lock:
+            row = self._conn.execute('SELECT kind, value FROM nodes WHERE state = ? AND path = ?',
+                                     (state_name, key)).fetchone()
+            if row is not None and row[0] == 'val':
+                return 'val', []
+            rows = self._conn.execute(
+                'SELECT substr(path, ?), kind, value FROM nodes'
+                ' WHERE state = ? AND path >= ? AND path < ? AND instr(substr(path, ?), ?) = 0',
+                (skip + 1, state_name, low, high, skip + 1, self.SEP)).fetchall()
+        kind = row[0] if row is not None else 'dict'
+        children = [(name, child_kind, json.loads(value) if child_kind == 'val' else None)
+                    for name, child_kind, value in rows]
+        if kind == 'list':
+            by_index = sorted((int(name), (name, child_kind, value))
+                              for name, child_kind, value in children if name.isdigit())
+            # Slots reserved by append_slot read as None until written, but keep their index
+            children = [child for _, child in by_index]
+        return kind, children
+
+    def stat(self, state_name: str, path: List[str]) -> Union[Tuple[str, bool], None]:
+        key = self._key(path)
+        low, high = self._range(key)
+        with self._lock:
+            row = self._conn.execute('SELECT kind FROM nodes WHERE state = ? AND path = ?',
+                                     (state_name, key)).fetchone()
+            child = self._conn.execute(
+                'SELECT 1 FROM nodes WHERE state = ? AND path >= ? AND path < ? LIMIT 1',
+                (state_name, low, high)).fetchone()
+        if row is None:
+            # Implicit intermediate node
+            return ('dict', True) if child else None
+        return (row[0], child is not None)
+
+    def load(self, state_name: str) -> Union[Dict, List, Any]:
+        return self.load_subtree(state_name, [])
+
+    def drop(self, state_name: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM nodes WHERE state = ?', (state_name,))
+            self._bump(conn, state_name)
+
+    def state_names(self) -> List[str]:
+        with self._lock:
+            return [name for (name,) in self._conn.execute('SELECT DISTINCT state FROM nodes')]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+BACKENDS = {
+    'directory': DirectoryBackend,
+    'snapshot': SnapshotBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def make_backend(backend: Union[str, StateBackend], states_dir: str) -> StateBackend:
+    """Build a backend from its name, or return *backend* if it is already one."""
+    if isinstance(backend, StateBackend):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown state backend '{backend}', expected one of {list(BACKENDS)}")
+    return BACKENDS[backend](states_dir)
+
+
+def migrate_states(src: StateBackend, dst: StateBackend, state_names: List[str] = None) -> List[str]:
+    """
+    Copy states from one backend to another (e.g. directory tree -> snapshot files).
+
+    Returns the names of the migrated states.
+    """
+    names = state_names or src.state_names()
+    for state_name in names:
+        data = src.load(state_name)
+        dst.drop(state_name)
+        dst.apply_batch(_plain_to_ops(state_name, [], data))
+    return names
+
+
+def _plain_to_ops(state_name: str, path: List[str], data: Any):
+    """Yield the ops that rebuild *data* at *path*."""
+    if isinstance(data, dict):
+        yield state_name, path, ('type', 'dict')
+        for k, v in data.items():
+            yield from _plain_to_ops(state_name, path + [str(k)], v)
+    elif isinstance(data, list):
+        yield state_name, path, ('type', 'list')
+        for i, v in enumerate(data):
+            yield from _plain_to_ops(state_name, path + [str(i)], v)
+    else:
+        yield state_name, path, ('val', data)
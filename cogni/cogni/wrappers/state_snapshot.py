@@ -0,0 +1,232 @@
+"""
+Read-only, memory-mapped snapshots of a state.
+
+A writer publishes a state as one compact file, replaced atomically, with one line per node
+sorted by path::
+
+    <path>\\t<kind>\\t<json value>\\n
+
+``path`` is the ``\\x1f``-separated list of ``unicode_escape``-d keys (empty for the root),
+``kind`` is ``d`` (dict), ``l`` (list) or ``v`` (scalar, followed by its JSON value). Readers
+mmap the file and binary-search it, so looking up a path only decodes the lines below it.
+"""
+import os
+import json
+import mmap
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+SEP = b'\x1f'
+
+
+def _encode_path(path) -> bytes:
+    return SEP.join(str(p).encode('unicode_escape') for p in path)
+
+
+def _decode_path(key: bytes) -> Tuple[str, ...]:
+    if not key:
+        return ()
+    return tuple(part.decode('unicode_escape') for part in key.split(SEP))
+
+
+def _lines(data: Any, path: Tuple) -> Iterator[Tuple[bytes, bytes]]:
+    """``(key, line)`` for *data* and everything below it."""
+    key = _encode_path(path)
+    if isinstance(data, dict):
+        yield key, key + b'\td\t\n'
+        for k, v in data.items():
+            yield from _lines(v, path + (k,))
+    elif isinstance(data, list):
+        yield key, key + b'\tl\t\n'
+        for i, v in enumerate(data):
+            yield from _lines(v, path + (i,))
+    else:
+        yield key, key + b'\tv\t' + json.dumps(data).encode() + b'\n'
+
+
+def write_snapshot(file_path: str, data: Any) -> None:
+    """Publish *data* at *file_path* atomically (readers see the old or the new file)."""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.writelines(line for _, line in sorted(_lines(data, ())))
+    os.replace(tmp_path, file_path)
+
+
+class StateSnapshot:
+    """
+    A published state, read in place.
+
+    Paths are ``'logs/0/tool'`` strings or lists of keys, like ``State.exists``. Values are
+    plain python (dicts, lists, scalars), built only for the part that is asked for.
+    """
+
+    def __init__(self, file_path: str, state_name: str = None):
+        self.file_path = file_path
+        self.state_name = state_name
+        with open(file_path, 'rb') as f:
+            self.published_at = os.fstat(f.fileno()).st_mtime
+            size = os.fstat(f.fileno()).st_size
+            # An empty file can't be mapped
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def close(self) -> None:
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def __enter__(self) -> 'StateSnapshot':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -----------------------------------------------------------------
+    # Scanning
+    # -----------------------------------------------------------------
+    def _seek(self, key: bytes) -> int:
+        """Offset of the first line whose path sorts at or after *key*."""
+        buf = self._buf
+        lo, hi = 0, len(buf)
+        while lo < hi:
+            start = buf.rfind(b'\n', 0, (lo + hi) // 2) + 1
+            if buf[start:buf.find(b'\t', start)] < key:
+                lo = buf.find(b'\n', start) + 1
+            else:
+                hi = start
+        return lo
+
+    def _scan(self, key: bytes, below: bool = True) -> Iterator[Tuple[bytes, bytes, bytes]]:
+        """``(key, kind, json)`` of the node at *key*, then of every node below it."""
+        buf = self._buf
+        prefix = key + SEP if key else b''
+        offset = self._seek(key)
+        end = len(buf)
+        while offset < end:
+            eol = buf.find(b'\n', offset)
+            line = buf[offset:eol]
+            offset = eol + 1
+            line_key, kind, value = line.split(b'\t', 2)
+            if line_key != key and not line_key.startswith(prefix):
+                return
+            yield line_key, kind, value
+            if not below:
+                return
+        return
+
+    def _lookup(self, path) -> Union[Tuple[bytes, bytes], None]:
+        key = _encode_path(self._split(path))
+        for line_key, kind, value in self._scan(key, below=False):
+            if line_key == key:
+                return kind, value
+        return None
+
+    @staticmethod
+    def _split(path) -> Tuple[str, ...]:
+        if isinstance(path, str):
+            return tuple(p for p in path.split('/') if p)
+        return tuple(str(p) for p in path)
+
+    # -----------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------
+    def exists(self, path: Union[str, List[str]] = ()) -> bool:
+        return self._lookup(path) is not None
+
+    def kind(self, path: Union[str, List[str]] = ()) -> Union[str, None]:
+        """``'dict'``, ``'list'``, ``'val'``, or None if nothing is stored at *path*."""
+        found = self._lookup(path)
+        if found is None:
+            return None
+        return {b'd': 'dict', b'l': 'list', b'v': 'val'}[found[0]]
+
+    def get(self, path: Union[str, List[str]] = (), default: Any = None) -> Any:
+        """The plain value at *path*, or *default* if nothing is stored there."""
+        key = _encode_path(self._split(path))
+        depth = len(self._split(path))
+        root = None
+        containers: Dict[Tuple, Any] = {}
+        for line_key, kind, value in self._scan(key):
+            rel = _decode_path(line_key)[depth:]
+            node = {} if kind == b'd' else [] if kind == b'l' else json.loads(value)
+            if not rel:
+                root = node
+            else:
+                parent = containers.get(rel[:-1])
+                if isinstance(parent, dict):
+                    parent[rel[-1]] = node
+                elif isinstance(parent, list):
+                    # Lines sort '10' before '2': keep the index to order the list afterwards
+                    parent.append((int(rel[-1]), node))
+            if kind != b'v':
+                containers[rel] = node
+            if not rel and kind == b'v':
+                break
+        if root is None:
+            return default
+        for node in containers.values():
+            if isinstance(node, list):
+                node.sort(key=lambda item: item[0])
+                node[:] = [item for _, item in node]
+        return root
+
+    def __getitem__(self, path: Union[str, List[str]]) -> Any:
+        missing = object()
+        value = self.get(path, missing)
+        if value is missing:
+            raise KeyError(path)
+        return value
+
+    def __contains__(self, path: Union[str, List[str]]) -> bool:
+        return self.exists(path)
+
+    def keys(self, path: Union[str, List[str]] = ()) -> List[str]:
+        """Keys (or list indices, as strings) of the container at *path*."""
+        path = self._split(path)
+        key = _encode_path(path)
+        # Children have one more component than *path*, i.e. len(path) separators
+        keys = [_decode_path(line_key)[-1] for line_key, _, _ in self._scan(key)
+                if line_key != key and line_key.count(SEP) == len(path)]
+        if self.kind(path) == 'list':
+            keys.sort(key=int)
+        return keys
+
+    def to_dict(self) -> Any:
+        return self.get((), {})
+
+    def diff(self, other: 'StateSnapshot') -> List:
+        """
+        Changes that turn *self* into *other*, as ``StateChange`` items.
+
+        A ``'set'`` carries the new plain value of an added or changed node and covers its
+        whole subtree, a ``'delete'`` is reported once for a removed subtree. Both files are
+        walked once, in path order.
+        """
+        from .state import StateChange
+
+        state_name = other.state_name or self.state_name
+        old, new = self._scan(b''), other._scan(b'')
+        a, b = next(old, None), next(new, None)
+        changes = []
+        covered = None
+        while a is not None or b is not None:
+            if b is None or (a is not None and a[0] < b[0]):
+                key, op = a[0], 'delete'
+                a = next(old, None)
+            elif a is None or b[0] < a[0]:
+                key, op = b[0], 'set'
+                b = next(new, None)
+            else:
+                key, op = a[0], ('set' if a[1:] != b[1:] else None)
+                a, b = next(old, None), next(new, None)
+            if op is None or (covered is not None and _is_below(key, covered)):
+                continue
+            # Sorted paths: the subtree of *key* comes right after it in both files
+            covered = key
+            path = _decode_path(key)
+            changes.append(StateChange(state_name, path, op, other.get(path) if op == 'set' else None))
+        return changes
+
+
+def _is_below(key: bytes, ancestor: bytes) -> bool:
+    if not ancestor:
+        return bool(key)
+    return key.startswith(ancestor + SEP)
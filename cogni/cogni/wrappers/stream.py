@@ -1,23 +1,488 @@
-from time import time
+"""
+Token streams.
 
-class _Stream:
-    def __init__(self):
+A stream is an append-only text buffer. Writers append deltas, readers keep an offset (a
+``StreamCursor``) and only get what was appended since their last read. The buffer lives
+in memory; readers of other processes see it through ``State['stream_buffer'][name]``,
+where the writer appends the new deltas at most every ``persist_interval`` seconds.
+
+``Stream`` keeps one stream per agent run and hop (a channel), so that agents running at
+the same time don't mix their outputs. Finished channels are evicted beyond
+``MAX_FINISHED``, and ``Stream.tail`` follows several live channels at once.
+
+Persisted streams carry the pid of their writer and the time of its last persistence. A
+stream left open by a writer that died, or that went quiet for ``ABANDONED_AFTER`` seconds,
+is closed by whichever process reads it, and any process evicts finished streams beyond
+``MAX_FINISHED`` from the State.
+"""
+import os
+import re
+import time
+import asyncio
+import itertools
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+#: Minimum delay in seconds between two persistences of a stream
+PERSIST_INTERVAL = 0.25
+#: Characters kept in memory per stream, the oldest chunks are dropped beyond
+CAPACITY = 1024 * 1024
+#: Finished channels kept (in memory and in the State) before the oldest are evicted
+MAX_FINISHED = 32
+#: Seconds without persistence after which an open stream of another process is abandoned
+ABANDONED_AFTER = 600.0
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """False only when no process *pid* is running on this machine."""
+    if not pid or os.name == 'nt':
+        # Unknown owner, or no signal 0 to probe with: only the idle time tells
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _abandoned(entry) -> bool:
+    """True for a persisted stream still open whose writer is dead or silent for too long."""
+    if entry.get('done', True):
+        return False
+    return time.time() - entry.get('updated', 0) > ABANDONED_AFTER or not _process_alive(entry.get('pid'))
+
+
+class StreamCursor:
+    """A reading position in a stream."""
+
+    def __init__(self, buffer: 'StreamBuffer', offset: int = 0):
+        self.buffer = buffer
+        self.offset = offset
+        self.generation = buffer.generation
+
+    def read(self) -> str:
+        """What was written since the last read (everything, when the stream was restarted)."""
+        delta, self.offset, self.generation = self.buffer._read_since(self.offset, self.generation)
+        return delta
+
+    def wait(self, timeout: float = None) -> str:
+        """Like ``read``, but first wait up to *timeout* seconds for something new."""
+        self.buffer.wait(self.offset, timeout, self.generation)
+        return self.read()
+
+    @property
+    def done(self) -> bool:
+        """True once the stream is closed and everything was read."""
+        return self.buffer.done and self.generation == self.buffer.generation \
+            and self.offset >= self.buffer.length
+
+
+class StreamBuffer:
+    """
+    One append-only stream of text.
+
+    Offsets count characters from the start of the stream. Only the last *capacity*
+    characters are kept: a reader further behind resumes at the oldest one kept. ``reset``
+    starts a new stream in the same buffer, with a new ``generation``.
+    """
+
+    def __init__(self, name: str, persist_interval: Optional[float] = PERSIST_INTERVAL,
+                 capacity: int = CAPACITY):
+        self.name = name
+        self.persist_interval = persist_interval
+        self.capacity = capacity
+        self._cond = threading.Condition()
+        self._chunks: List[str] = []
+        # End offset of each chunk, and offset of the first one
+        self._ends: List[int] = []
+        self._start = 0
+        self.done = False
+        self.generation = 0
+        # Chunks already appended to the State, and when
+        self._persisted = 0
+        self._last_persist = 0.0
+        # Set once this process writes the stream: the State is then written, never read
+        self._writer = False
+        # Chunks of the State already read, when another process writes the stream
+        self._synced = 0
+        # Called (from the writing thread) on every change
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def length(self) -> int:
+        return self._ends[-1] if self._ends else self._start
+
+    def _changed(self) -> None:
+        self._cond.notify_all()
+        for listener in list(self._listeners):
+            listener()
+
+    # -----------------------------------------------------------------
+    # Writing
+    # -----------------------------------------------------------------
+    def write(self, delta: str) -> int:
+        """Append *delta*, return the new length of the stream."""
+        with self._cond:
+            self._writer = True
+            if delta:
+                self._append(delta)
+                self._changed()
+            length = self.length
+            due = self.persist_interval is not None \
+                and time.monotonic() - self._last_persist >= self.persist_interval
+        if due:
+            self.persist()
+        return length
+
+    def _append(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        self._ends.append(self.length + len(chunk))
+        if self.length - self._start > self.capacity:
+            # Drop the oldest chunks, keeping at least the last one
+            drop = min(bisect_right(self._ends, self.length - self.capacity), len(self._chunks) - 1)
+            if drop:
+                self._start = self._ends[drop - 1]
+                del self._chunks[:drop], self._ends[:drop]
+                self._persisted = max(self._persisted - drop, 0)
+
+    def reset(self) -> None:
+        """Start a new, empty stream."""
+        with self._cond:
+            self._writer = True
+            self._chunks, self._ends, self._start = [], [], 0
+            self._persisted = 0
+            self.done = False
+            # Unique across processes and restarts, so that readers notice
+            self.generation = time.time_ns()
+            self._changed()
+        if self.persist_interval is not None:
+            self.persist()
+
+    def close(self) -> None:
+        """Mark the stream as complete and persist what is left."""
+        with self._cond:
+            self._writer = True
+            self.done = True
+            self._changed()
+        if self.persist_interval is not None:
+            self.persist()
+
+    def persist(self) -> None:
+        """Append the deltas written since the last persistence to the State."""
         from .state import State
-        self.last_stream_event = -1
-        State['stream_buffer']['current_stream'] = ""
-        
-        
+        with self._cond:
+            pending = self._chunks[self._persisted:]
+            self._persisted = len(self._chunks)
+            self._last_persist = time.monotonic()
+            generation, done = self.generation, self.done
+            persisted = self._chunks[:self._persisted]
+        streams = State['stream_buffer']
+        entry = streams.get(self.name)
+        if not hasattr(entry, 'get') or entry.get('generation') != generation:
+            streams[self.name] = {'generation': generation, 'chunks': [''.join(persisted)] if persisted else [],
+                                  'done': done, 'pid': os.getpid(), 'updated': time.time()}
+            return
+        if pending:
+            # One chunk per persistence, whatever the number of deltas
+            entry['chunks'].append(''.join(pending))
+        # Also the heartbeat that keeps readers from taking the stream for abandoned
+        entry.update(done=done, updated=time.time())
+
+    # -----------------------------------------------------------------
+    # Reading
+    # -----------------------------------------------------------------
+    def read(self, offset: int = 0) -> str:
+        """The text written from *offset* on."""
+        return self._read_since(offset, self.generation)[0]
+
     @property
-    def stream(self):
+    def text(self) -> str:
+        return self.read(0)
+
+    def cursor(self, offset: int = 0) -> StreamCursor:
+        return StreamCursor(self, offset)
+
+    def _read_since(self, offset: int, generation: int):
+        """``(text from offset, new offset, generation)``, from 0 if the stream was restarted."""
+        self._sync()
+        with self._cond:
+            if generation != self.generation:
+                offset = 0
+            # Dropped by the ring: resume at the oldest chunk kept
+            offset = max(offset, self._start)
+            i = bisect_right(self._ends, offset)
+            if i == len(self._chunks):
+                return '', max(offset, self.length), self.generation
+            start = self._ends[i - 1] if i else self._start
+            delta = self._chunks[i][offset - start:] + ''.join(self._chunks[i + 1:])
+            return delta, self.length, self.generation
+
+    def wait(self, offset: int, timeout: float = None, generation: int = None) -> bool:
+        """Wait until the stream goes past *offset* or is closed, False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        generation = self.generation if generation is None else generation
+
+        def ready():
+            return self.length > offset or self.done or self.generation != generation
+
+        while True:
+            self._sync()
+            with self._cond:
+                if ready():
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                if self._writer:
+                    self._cond.wait_for(ready, remaining)
+                else:
+                    # Written by another process: check the State again shortly
+                    step = self.persist_interval or PERSIST_INTERVAL
+                    self._cond.wait(step if remaining is None else min(step, remaining))
+
+    def _sync(self) -> None:
+        """Catch up with the chunks another process persisted."""
+        if self._writer:
+            return
         from .state import State
-        State.reset_cache()
-        
-        return State['stream_buffer']['current_stream']
-    
-    @stream.setter
-    def stream(self, value):
+        State.refresh('stream_buffer')
+        entry = State['stream_buffer'].get(self.name)
+        if not hasattr(entry, 'get'):
+            return
+        if _abandoned(entry):
+            # Its writer is gone: close it for every reader
+            entry['done'] = True
+        with self._cond:
+            changed = False
+            if entry.get('generation') != self.generation:
+                self._chunks, self._ends, self._start = [], [], 0
+                self._synced = 0
+                self.generation = entry.get('generation')
+                changed = True
+            chunks = entry['chunks'][self._synced:]
+            for chunk in chunks:
+                self._append(chunk)
+            self._synced += len(chunks)
+            if self.done != entry['done']:
+                self.done = entry['done']
+                changed = True
+            if chunks or changed:
+                self._changed()
+
+
+_runs = itertools.count()
+
+#: Channel the LLM output of the current agent goes to, see ``_Stream.channel``
+_current_channel: ContextVar[Optional[StreamBuffer]] = ContextVar('cogni_stream_channel', default=None)
+
+
+class _Stream:
+    """
+    The streams of the LLM responses, one channel per agent run and hop.
+
+    ``write``, ``reset``, ``close`` and ``stream`` go to the channel opened by the current
+    agent (see ``channel``), or to the ``current_stream`` buffer outside of one.
+    """
+
+    def __init__(self, max_finished: int = MAX_FINISHED, capacity: int = CAPACITY):
+        self.max_finished = max_finished
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._channels: Dict[str, StreamBuffer] = {}
+        # Finished channels, oldest first
+        self._finished: 'OrderedDict[str, None]' = OrderedDict()
+        # Called with the name of each new channel, for ``tail``
+        self._watchers: List[Callable[[str], None]] = []
+        self._default = StreamBuffer('current_stream', capacity=capacity)
+
+    # -----------------------------------------------------------------
+    # Channels
+    # -----------------------------------------------------------------
+    @staticmethod
+    def new_run(agent: str) -> str:
+        """An identifier for a run of *agent*, unique across processes."""
+        return f"{re.sub(r'[^A-Za-z0-9_-]', '_', agent)}.{os.getpid()}-{next(_runs)}"
+
+    @staticmethod
+    def key(run: str, hop: int) -> str:
+        return f"{run}.{hop}"
+
+    def __getitem__(self, key: str) -> StreamBuffer:
+        """The channel *key*; a channel of another process is read from the State."""
+        with self._lock:
+            buffer = self._channels.get(key)
+            if buffer is None:
+                buffer = self._channels[key] = StreamBuffer(key, capacity=self.capacity)
+                buffer._listeners.append(lambda: self._on_change(buffer))
+                created = True
+            else:
+                created = False
+        if created:
+            for watcher in list(self._watchers):
+                watcher(key)
+        return buffer
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._channels
+
+    @contextmanager
+    def channel(self, agent: str, hop: int, run: str = None):
+        """
+        Open the channel of *agent* at *hop* (of *run*, a fresh one by default) and make it
+        the current one in this context until the block exits, then close it.
+        """
+        buffer = self[self.key(run or self.new_run(agent), hop)]
+        buffer.reset()
+        token = _current_channel.set(buffer)
+        try:
+            yield buffer
+        finally:
+            _current_channel.reset(token)
+            if not buffer.done:
+                buffer.close()
+
+    def live(self) -> List[str]:
+        """
+        Channels still being written, here or (as persisted) in other processes.
+
+        Persisted channels of dead or silent writers are closed on the way, and the finished
+        ones beyond ``max_finished`` evicted, whichever process wrote them.
+        """
         from .state import State
-        
-        State['stream_buffer']['current_stream'] = value
-        
-Stream = _Stream()
\ No newline at end of file
+        State.refresh('stream_buffer')
+        streams = State['stream_buffer']
+        names = [name for name, buffer in list(self._channels.items()) if not buffer.done]
+        finished = []
+        for name, entry in list(streams.items()):
+            if not hasattr(entry, 'get'):
+                continue
+            if _abandoned(entry):
+                entry['done'] = True
+            if entry.get('done', True):
+                finished.append((entry.get('updated', 0), name))
+            elif name not in self._channels:
+                names.append(name)
+        finished.sort()
+        for _, name in finished[:max(len(finished) - self.max_finished, 0)]:
+            if name not in self._channels or self._channels[name].done:
+                del streams[name]
+        return names
+
+    def _on_change(self, buffer: StreamBuffer) -> None:
+        if not buffer.done or buffer.name in self._finished:
+            return
+        with self._lock:
+            self._finished[buffer.name] = None
+            evicted = []
+            while len(self._finished) > self.max_finished:
+                name, _ = self._finished.popitem(last=False)
+                self._channels.pop(name, None)
+                evicted.append(name)
+        if evicted:
+            from .state import State
+            streams = State['stream_buffer']
+            for name in evicted:
+                if name in streams:
+                    del streams[name]
+
+    # -----------------------------------------------------------------
+    # Tailing
+    # -----------------------------------------------------------------
+    async def tail(self, *keys: str, follow: bool = False,
+                   poll_interval: float = PERSIST_INTERVAL) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Yield ``(channel, delta)`` as the channels *keys* (all the live ones by default) are
+        written, until they are all closed.
+
+        With *follow*, channels opened later are tailed too and the iteration never ends.
+        Every delta is read from the cursor of its channel, so nothing is skipped and each
+        read only costs what was appended. Channels of other processes are checked every
+        *poll_interval* seconds.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def notify(*_):
+            loop.call_soon_threadsafe(wakeup.set)
+
+        cursors: Dict[str, StreamCursor] = {}
+
+        def watch(key: str) -> None:
+            if key not in cursors:
+                buffer = self[key]
+                buffer._listeners.append(notify)
+                cursors[key] = buffer.cursor(0)
+
+        for key in keys or self.live():
+            watch(key)
+        if follow:
+            self._watchers.append(notify)
+        try:
+            while cursors or follow:
+                wakeup.clear()
+                if follow:
+                    for key in self.live():
+                        watch(key)
+                for key, cursor in list(cursors.items()):
+                    delta = cursor.read()
+                    if delta:
+                        yield key, delta
+                    if cursor.done:
+                        cursor.buffer._listeners.remove(notify)
+                        del cursors[key]
+                if not cursors and not follow:
+                    break
+                remote = any(not cursor.buffer._writer for cursor in cursors.values())
+                try:
+                    await asyncio.wait_for(wakeup.wait(), poll_interval if remote or follow else None)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for cursor in cursors.values():
+                if notify in cursor.buffer._listeners:
+                    cursor.buffer._listeners.remove(notify)
+            if notify in self._watchers:
+                self._watchers.remove(notify)
+
+    # -----------------------------------------------------------------
+    # The current channel
+    # -----------------------------------------------------------------
+    @property
+    def current(self) -> StreamBuffer:
+        return _current_channel.get() or self._default
+
+    @property
+    def stream(self) -> str:
+        return self.current.text
+
+    @stream.setter
+    def stream(self, value: str) -> None:
+        # Set with the whole text so far: only the new part is written
+        current = self.current
+        length = current.length
+        if len(value) >= length:
+            current.write(value[length:])
+        else:
+            current.reset()
+            current.write(value)
+
+    def write(self, delta: str) -> int:
+        return self.current.write(delta)
+
+    def reset(self) -> None:
+        self.current.reset()
+
+    def close(self) -> None:
+        self.current.close()
+
+    def cursor(self, offset: int = 0) -> StreamCursor:
+        return self.current.cursor(offset)
+
+
+Stream = _Stream()